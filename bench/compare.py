@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark comparison
+Compares two bench/run.py result files stage by stage and exits non-zero when
+throughput dropped or tail latency rose by more than the thresholds
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+# Latency changes below this many milliseconds are timer noise, whatever the ratio
+LATENCY_FLOOR_MS = 0.05
+
+
+def compare(base: Dict, new: Dict, threshold: float = 0.15,
+            latency_threshold: float = 0.30) -> Tuple[List[Dict], List[str]]:
+    """
+    Stage-by-stage changes between two reports
+
+    Args:
+        base: Report of the reference commit
+        new: Report under test
+        threshold: Relative throughput drop counted as a regression (0.15 = 15%)
+        latency_threshold: Relative p95/p99 rise counted as a regression (tails are noisier)
+
+    Returns:
+        (rows, warnings) - one row per metric of every stage in both reports
+    """
+    warnings = []
+    base_workload, new_workload = base['meta']['workload'], new['meta']['workload']
+    if base_workload != new_workload:
+        warnings.append(f"Workloads differ ({base_workload} vs {new_workload}); results are not comparable")
+    for key in ('cpu_count', 'broker'):
+        if base['meta'].get(key) != new['meta'].get(key):
+            warnings.append(f"{key} differs: {base['meta'].get(key)} vs {new['meta'].get(key)}")
+
+    rows = []
+    for name, stage in new['stages'].items():
+        before = base['stages'].get(name)
+        if before is None:
+            warnings.append(f"Stage {name} is new, nothing to compare")
+            continue
+
+        old_rate, new_rate = before['ops_per_second'], stage['ops_per_second']
+        change = (new_rate - old_rate) / old_rate if old_rate else 0.0
+        rows.append({'stage': name, 'metric': 'ops_per_second', 'base': old_rate, 'new': new_rate,
+                     'change': change, 'regression': change < -threshold})
+
+        for percentile in ('p95', 'p99'):
+            old_ms = before['latency_ms'].get(percentile)
+            new_ms = stage['latency_ms'].get(percentile)
+            if old_ms is None or new_ms is None:
+                continue
+            change = (new_ms - old_ms) / old_ms if old_ms else 0.0
+            rows.append({'stage': name, 'metric': f'{percentile}_ms', 'base': old_ms, 'new': new_ms,
+                         'change': change,
+                         'regression': change > latency_threshold and new_ms - old_ms > LATENCY_FLOOR_MS})
+    return rows, warnings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('base', help='Reference results (e.g. bench/results/<main commit>.json)')
+    parser.add_argument('new', help='Results to check')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Allowed relative throughput drop (default 0.15)')
+    parser.add_argument('--latency-threshold', type=float, default=0.30,
+                        help='Allowed relative p95/p99 rise (default 0.30)')
+    parser.add_argument('--json', action='store_true', help='Emit machine-readable results')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    rows, warnings = compare(base, new, args.threshold, args.latency_threshold)
+    regressions = [row for row in rows if row['regression']]
+
+    if args.json:
+        print(json.dumps({'base': base['meta']['commit'], 'new': new['meta']['commit'],
+                          'threshold': args.threshold, 'latency_threshold': args.latency_threshold,
+                          'warnings': warnings,
+                          'rows': rows, 'regressions': len(regressions)}, indent=2))
+    else:
+        for warning in warnings:
+            print(f"WARNING: {warning}")
+        print(f"{base['meta']['commit']} -> {new['meta']['commit']} (throughput -{args.threshold:.0%}, "
+              f"latency +{args.latency_threshold:.0%})")
+        print(f"{'stage':<20} {'metric':<15} {'base':>11} {'new':>11} {'change':>8}")
+        for row in rows:
+            flag = '  REGRESSION' if row['regression'] else ''
+            print(f"{row['stage']:<20} {row['metric']:<15} {row['base']:>11.3f} {row['new']:>11.3f} "
+                  f"{row['change']:>+8.1%}{flag}")
+        print(f"\n{len(regressions)} regression(s)")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark
+Drives the intent API, MQTT control path, database and feedback loop with a seeded
+workload and writes throughput and p50/p95/p99 latency per stage as JSON, keyed by
+commit, for bench/compare.py
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from workload import Workload
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_revision():
+    """(commit, dirty) of the working tree, or ('unknown', False) outside git"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(status)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def run(args) -> dict:
+    """Run the selected stages and build the report"""
+    from stages import STAGES
+
+    workload = Workload(seed=args.seed, intents=args.intents, nodes=args.nodes)
+    commit, dirty = git_revision()
+    report = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'broker': args.broker or 'stub',
+            'repeat': args.repeat,
+            'workload': workload.describe(),
+        },
+        'stages': {},
+    }
+
+    options = {
+        'api': {'lists': args.lists},
+        'mqtt': {'broker': args.broker},
+        'db': {'lists': args.lists},
+        'feedback': {'cycles': args.cycles},
+    }
+    for name in args.stages:
+        # Each stage runs `repeat` times on fresh components; the median run (by
+        # throughput) is kept, so one noisy run does not move the result
+        runs = [STAGES[name](workload, **options[name]) for _ in range(args.repeat)]
+        for operation in runs[0]:
+            ranked = sorted((run[operation] for run in runs), key=lambda stage: stage['ops_per_second'])
+            report['stages'][operation] = ranked[len(ranked) // 2]
+    return report
+
+
+def print_table(report: dict):
+    print(f"{'stage':<20} {'ops':>7} {'ops/s':>11} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stage in report['stages'].items():
+        latency = stage['latency_ms']
+        print(f"{name:<20} {stage['ops']:>7} {stage['ops_per_second']:>11.1f} "
+              f"{latency.get('p50', 0):>9.3f} {latency.get('p95', 0):>9.3f} {latency.get('p99', 0):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stages', nargs='+', choices=['api', 'mqtt', 'db', 'feedback'],
+                        default=['api', 'mqtt', 'db', 'feedback'])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--intents', type=int, default=500)
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--lists', type=int, default=100, help='List requests per API/database run')
+    parser.add_argument('--cycles', type=int, default=20, help='Feedback evaluation cycles')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage; the median is reported')
+    parser.add_argument('--broker', help='host:port of an MQTT broker (default: stub client)')
+    parser.add_argument('--out', help='Results file (default: bench/results/<commit>.json)')
+    parser.add_argument('--log-level', default='ERROR', help='Lowest component log level shown during the run')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON instead of a table')
+    args = parser.parse_args()
+
+    # Components log every request at INFO, which would dominate the timings
+    logging.disable(getattr(logging, args.log_level.upper()) - 1)
+
+    report = run(args)
+
+    out = args.out or os.path.join(BENCH_DIR, 'results', f"{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+        print(f"\nResults written to {out}")
+
+
+if __name__ == '__main__':
+    main()
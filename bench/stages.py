@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Benchmark stages - Drive the intent API, MQTT control path, database and feedback loop
+Each stage runs the in-tree components in process against a Workload and returns
+per-operation latencies; nothing needs to be running except, optionally, a broker
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import numpy as np
+
+from workload import StepClock, Workload
+
+DEVICE_POLICY_TYPES = ('qos_control', 'device_config', 'sample_rate', 'audio_gain', 'publish_interval')
+
+
+class Timings:
+    """Latencies of one operation type, in seconds"""
+
+    def __init__(self):
+        self.samples: List[float] = []
+        self.elapsed = 0.0
+
+    def time(self, operation: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        result = operation(*args, **kwargs)
+        duration = time.perf_counter() - start
+        self.samples.append(duration)
+        self.elapsed += duration
+        return result
+
+    def summary(self) -> Dict:
+        """Throughput and latency percentiles (ms)"""
+        if not self.samples:
+            return {'ops': 0, 'seconds': 0.0, 'ops_per_second': 0.0, 'latency_ms': {}}
+        latency = np.array(self.samples) * 1000
+        return {
+            'ops': len(self.samples),
+            'seconds': round(self.elapsed, 6),
+            'ops_per_second': round(len(self.samples) / self.elapsed, 2) if self.elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(float(np.percentile(latency, 50)), 4),
+                'p95': round(float(np.percentile(latency, 95)), 4),
+                'p99': round(float(np.percentile(latency, 99)), 4),
+                'max': round(float(latency.max()), 4),
+            },
+        }
+
+
+class _PublishResult:
+    rc = 0  # mqtt.MQTT_ERR_SUCCESS
+
+
+class StubClient:
+    """Stands in for the paho client: accepts every publish and keeps count"""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+        return _PublishResult()
+
+
+def make_enforcer(broker: Optional[str] = None):
+    """
+    Device enforcer publishing to a stub client, or to a real broker ("host:port")
+
+    Returns:
+        (enforcer, disconnect)
+    """
+    from enforcement.device import DeviceEnforcer
+
+    if broker is None:
+        enforcer = DeviceEnforcer(client_id='imperium-bench')
+        enforcer.client = StubClient()
+        enforcer.connection.connected = True
+        return enforcer, lambda: None
+
+    host, _, port = broker.partition(':')
+    enforcer = DeviceEnforcer(broker_host=host, broker_port=int(port or 1883), client_id='imperium-bench')
+    if not enforcer.connect(timeout=5.0):
+        enforcer.disconnect()
+        raise RuntimeError(f"MQTT broker {broker} not reachable")
+    return enforcer, enforcer.disconnect
+
+
+def _device_policies(workload: Workload) -> List[Dict]:
+    """Device policies the workload's intents generate, as IntentManager would enforce them"""
+    from intent_manager.api import IntentManager
+    from intent_manager.parser import IntentParser
+    from policy_engine.engine import PolicyEngine
+
+    parser, engine = IntentParser(), PolicyEngine()
+    policies = []
+    for intent in workload.intents:
+        parsed = parser.parse(intent['description'])
+        target = IntentManager._target_device(parsed)
+        for policy in engine.generate_policies(parsed):
+            policy = policy.to_dict()
+            if policy['policy_type'] in DEVICE_POLICY_TYPES:
+                policies.append({
+                    'policy_id': policy['policy_id'],
+                    'policy_type': policy['policy_type'],
+                    'target': target or policy.get('target', ''),
+                    'parameters': policy.get('parameters', {}),
+                    'priority': policy.get('priority', 5),
+                })
+    return policies
+
+
+def run_api(workload: Workload, lists: int = 100) -> Dict[str, Dict]:
+    """
+    Intent API through the Flask app: submit every intent, read each back, list
+
+    Device policies go to a stub-backed enforcer, so submissions include
+    parsing, policy generation, persistence and control message encoding.
+    """
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    from intent_manager.api import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(db_path=os.path.join(tmp, 'bench.db'), create_admin=False)
+        components = app.extensions['imperium']
+        components['rate_limiter'].enabled = False
+        enforcer, _ = make_enforcer()
+        components['intent_manager'].device_enforcer = enforcer
+        headers = {'Authorization': f"Bearer {components['auth_manager'].generate_token('bench', 'admin')}"}
+        client = app.test_client()
+
+        submit, get, listing = Timings(), Timings(), Timings()
+        ids = []
+        for intent in workload.intents:
+            response = submit.time(client.post, '/api/v1/intents', json=intent, headers=headers)
+            if response.status_code == 201:
+                ids.append(response.get_json()['intent']['id'])
+        for intent_id in ids:
+            get.time(client.get, f'/api/v1/intents/{intent_id}', headers=headers)
+        for _ in range(lists):
+            listing.time(client.get, '/api/v1/intents', headers=headers)
+
+        components['db_manager'].engine.dispose()
+    return {'api.submit': submit.summary(), 'api.get': get.summary(), 'api.list': listing.summary()}
+
+
+def run_mqtt(workload: Workload, broker: Optional[str] = None, timeout: float = 10.0) -> Dict[str, Dict]:
+    """
+    MQTT control path: apply each device policy through the enforcer
+
+    With a broker, each control message is also received by a subscriber and
+    the publish-to-delivery time recorded (messages to one device arrive in
+    order, so they are matched first in, first out per topic).
+    """
+    policies = _device_policies(workload)
+    enforcer, disconnect = make_enforcer(broker)
+    apply = Timings()
+    results = {}
+
+    sent = defaultdict(deque)
+    delivery = Timings()
+    received = threading.Event()
+    subscriber = None
+
+    if broker:
+        import paho.mqtt.client as mqtt
+
+        publish = enforcer.client.publish
+
+        def timed_publish(topic, payload, qos=0):
+            sent[topic].append(time.perf_counter())
+            return publish(topic, payload, qos=qos)
+
+        enforcer.client.publish = timed_publish
+
+        def on_message(client, userdata, msg):
+            queue = sent.get(msg.topic)
+            if queue:
+                duration = time.perf_counter() - queue.popleft()
+                delivery.samples.append(duration)
+                delivery.elapsed += duration
+            if not any(sent.values()):
+                received.set()
+
+        subscribed = threading.Event()
+        host, _, port = broker.partition(':')
+        subscriber = mqtt.Client(client_id='imperium-bench-subscriber')
+        subscriber.on_message = on_message
+        subscriber.on_subscribe = lambda *args: subscribed.set()
+        subscriber.connect(host, int(port or 1883))
+        subscriber.subscribe('iot/+/control', qos=1)
+        subscriber.loop_start()
+        subscribed.wait(timeout)
+
+    try:
+        start = time.perf_counter()
+        for policy in policies:
+            apply.time(enforcer.apply_policy, policy)
+        results['mqtt.apply'] = apply.summary()
+
+        if subscriber is not None:
+            if any(sent.values()):
+                received.wait(timeout)
+            results['mqtt.delivery'] = delivery.summary()
+            # End to end: first apply until the last control message arrived
+            wall = time.perf_counter() - start
+            results['mqtt.delivery']['ops_per_second'] = round(len(delivery.samples) / wall, 2)
+            results['mqtt.delivery']['lost'] = sum(len(queue) for queue in sent.values())
+        else:
+            results['mqtt.apply']['published'] = enforcer.client.published
+    finally:
+        if subscriber is not None:
+            subscriber.loop_stop()
+            subscriber.disconnect()
+        disconnect()
+    return results
+
+
+def run_db(workload: Workload, lists: int = 100) -> Dict[str, Dict]:
+    """Database layer: insert intents and their policies, read them back, list"""
+    from database import DatabaseManager
+    from intent_manager.parser import IntentParser
+    from policy_engine.engine import PolicyEngine
+
+    parser, engine = IntentParser(), PolicyEngine()
+    prepared = []
+    for i, intent in enumerate(workload.intents):
+        parsed = parser.parse(intent['description'])
+        prepared.append((f"bench-intent-{i}", intent['description'], parsed,
+                         [p.to_dict() for p in engine.generate_policies(parsed)]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(db_path=os.path.join(tmp, 'bench.db'))
+        add_intent, add_policy, get, listing = Timings(), Timings(), Timings(), Timings()
+
+        for intent_id, description, parsed, policies in prepared:
+            add_intent.time(db.add_intent, intent_id, description, parsed, status='active')
+            for j, policy in enumerate(policies):
+                add_policy.time(db.add_policy, f"{intent_id}-policy-{j}", intent_id,
+                                policy['policy_type'], policy.get('parameters', {}), status='active')
+        for intent_id, _, _, _ in prepared:
+            get.time(db.get_intent, intent_id)
+        for _ in range(lists):
+            listing.time(db.get_all_intents, limit=100)
+
+        db.engine.dispose()
+    return {'db.add_intent': add_intent.summary(), 'db.add_policy': add_policy.summary(),
+            'db.get_intent': get.summary(), 'db.list_intents': listing.summary()}
+
+
+def run_feedback(workload: Workload, cycles: int = 20, interval: float = 30.0) -> Dict[str, Dict]:
+    """
+    Feedback loop: evaluation cycles over every goal against synthetic metrics
+
+    Latency on a tenth of the devices steps up halfway through, so cycles
+    include both healthy and violating intents.
+    """
+    from feedback.detection import ViolationDetector
+    from feedback.monitor import FeedbackEngine
+    from feedback.sources import SyntheticSource
+
+    clock = StepClock()
+    halfway = cycles * interval / 2
+    source = SyntheticSource(workload.nodes, noise=0.1, seed=workload.seed, clock=clock,
+                             steps=[(halfway, 'latency', node, 60.0) for node in workload.degraded])
+    engine = FeedbackEngine(source=source, history_size=256,
+                            detector=ViolationDetector(min_breach_samples=3, trend_horizon=120))
+    for i, (goals, target, priority) in enumerate(workload.goals):
+        engine.register_intent(f"intent-{i}", goals, targets=target, priority=priority)
+
+    cycle = Timings()
+    violations = 0
+    for _ in range(cycles):
+        results = cycle.time(engine.evaluate_intents)
+        violations += sum(1 for result in results.values() if result['violations'])
+        clock.now += interval
+
+    summary = cycle.summary()
+    summary['intents_per_second'] = round(len(workload.goals) * summary['ops_per_second'], 2)
+    summary['violations'] = violations
+    return {'feedback.cycle': summary}
+
+
+STAGES = {
+    'api': run_api,
+    'mqtt': run_mqtt,
+    'db': run_db,
+    'feedback': run_feedback,
+}
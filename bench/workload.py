@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark workload - Seeded, reproducible intents, goals and device metrics
+The same seed always yields the same requests in the same order, so results
+from different commits measure the same work
+"""
+import hashlib
+import json
+import random
+from typing import Dict, List
+
+# Intents the parser turns into network and device policies (QoS, sample
+# rate and publish interval ones reach the MQTT control path)
+TEMPLATES = [
+    ('priority', 'Prioritize device {node}'),
+    ('bandwidth', 'Limit bandwidth to {mbps} mbps for {node}'),
+    ('latency', 'Reduce latency to {ms}ms for {node}'),
+    ('qos', 'Set QoS level {qos} for {node}'),
+    ('sample_rate', 'Set sampling rate to {seconds} seconds for {node}'),
+    ('publish_interval', 'Set telemetry rate to {seconds} seconds for {node}'),
+]
+
+
+class StepClock:
+    """Simulated time, advanced explicitly by the benchmark"""
+
+    def __init__(self, start: float = 1_700_000_000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Workload:
+    """
+    Deterministic workload for every benchmark stage
+
+    Args:
+        seed: Random seed; identical seeds give identical workloads
+        intents: Number of intents submitted
+        nodes: Number of devices the intents target
+    """
+
+    def __init__(self, seed: int = 42, intents: int = 500, nodes: int = 100):
+        self.seed = seed
+        self.nodes = [f"node-{i}" for i in range(1, nodes + 1)]
+        rng = random.Random(seed)
+
+        self.intents: List[Dict] = []
+        for _ in range(intents):
+            kind, template = rng.choice(TEMPLATES)
+            description = template.format(
+                node=rng.choice(self.nodes), mbps=rng.choice([5, 10, 20, 50, 100]),
+                ms=rng.choice([10, 20, 30, 50, 100]), qos=rng.randint(0, 2),
+                seconds=rng.choice([1, 2, 5, 10, 30])
+            )
+            self.intents.append({'description': description, 'type': kind})
+
+        # Feedback goals: one per intent, against a random device
+        self.goals = [
+            ({'max_latency': rng.choice([20, 50, 100]), 'min_throughput': rng.choice([1, 5, 10])},
+             rng.choice(self.nodes), rng.randint(1, 10))
+            for _ in range(intents)
+        ]
+        # Devices whose latency steps up halfway through the feedback run
+        self.degraded = rng.sample(self.nodes, max(1, len(self.nodes) // 10))
+
+    def describe(self) -> Dict:
+        """Parameters and a digest of the generated requests, for comparing runs"""
+        digest = hashlib.sha256(json.dumps([self.intents, self.goals], sort_keys=True).encode()).hexdigest()
+        return {'seed': self.seed, 'intents': len(self.intents), 'nodes': len(self.nodes),
+                'digest': digest[:16]}
@@ -0,0 +1,69 @@
+# Imperium - gunicorn configuration
+#
+# Multi-process serving of the Intent Manager API:
+#   API_SERVER=gunicorn python src/main.py
+#   gunicorn -c config/gunicorn.conf.py wsgi:application
+#
+# Every worker builds its own controller components after the fork (see
+# src/wsgi.py), so each runs its own MQTT connection and feedback loop for
+# the intents submitted to it.
+import itertools
+import os
+
+pythonpath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', '5000')}"
+workers = int(os.getenv('API_WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.getenv('API_THREADS', '8'))
+keepalive = int(os.getenv('API_KEEPALIVE_SECONDS', '5'))
+backlog = int(os.getenv('API_BACKLOG', '1024'))
+timeout = int(os.getenv('API_WORKER_TIMEOUT_SECONDS', '30'))
+graceful_timeout = 10
+
+# Components hold threads and sockets that do not survive a fork
+preload_app = False
+
+# Each worker resolves policy conflicts and reconciles device shadows on its
+# own, so two conflicting intents sent to different workers would both be
+# enforced. Several workers only when that is acknowledged.
+if workers > 1 and os.getenv('API_WORKERS_SPLIT_ENFORCEMENT', 'false').lower() != 'true':
+    raise RuntimeError(f"API_WORKERS={workers}: each worker enforces policies independently; "
+                       "set API_WORKERS_SPLIT_ENFORCEMENT=true to accept that, or use API_WORKERS=1")
+
+# Write generations only count the worker's own writes, so with several
+# workers an ETag or cached body could hide an intent submitted to another
+if workers > 1:
+    os.environ.setdefault('API_RESPONSE_CACHE', 'false')
+
+accesslog = '-' if os.getenv('API_ACCESS_LOG', 'false').lower() == 'true' else None
+errorlog = '-'
+
+
+# Slot -> worker. A worker replacing a dead one takes over its slot, and with it
+# the MQTT client ID and the outbox file of messages its predecessor queued
+_slots = {}
+
+
+def pre_fork(server, worker):
+    worker.slot = next(slot for slot in itertools.count() if slot not in _slots)
+    _slots[worker.slot] = worker
+
+
+def post_worker_init(worker):
+    import wsgi
+    wsgi.init_worker(slot=worker.slot)
+
+
+def worker_exit(server, worker):
+    import wsgi
+    wsgi.shutdown_worker()
+
+
+def child_exit(server, worker):
+    _slots.pop(getattr(worker, 'slot', None), None)
+    # With PROMETHEUS_MULTIPROC_DIR set (an empty directory, cleared before
+    # start), /metrics merges every worker's samples; drop the dead worker's gauges
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
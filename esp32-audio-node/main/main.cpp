@@ -239,9 +239,10 @@ static void audio_publish_task(void *param) {
 static void heartbeat_task(void *param) {
     while (true) {
         if (g_mqtt.isConnected()) {
-            char status[128];
+            char status[192];
             snprintf(status, sizeof(status), 
-                "{\"device_id\":\"%s\",\"status\":\"online\",\"timestamp\":%" PRIu32 "}",
+                "{\"device_id\":\"%s\",\"status\":\"online\","
+                "\"encodings\":[\"json\",\"binary-v1\"],\"timestamp\":%" PRIu32 "}",
                 DEVICE_ID, (uint32_t)(xTaskGetTickCount() * portTICK_PERIOD_MS));
             g_mqtt.publishStatus(status);
         }
@@ -11,6 +11,16 @@
 
 static const char *TAG = "POLICY";
 
+// binary-v1 control frames: header byte, opcode, little-endian fixed fields
+#define BINARY_FRAME_HEADER      0xA1
+#define OP_SET_QOS               0x01
+#define OP_SET_SAMPLE_RATE       0x02
+#define OP_SET_PUBLISH_INTERVAL  0x03
+#define OP_SET_AUDIO_GAIN        0x04
+#define OP_ENABLE                0x05
+#define OP_DISABLE               0x06
+#define OP_RESET                 0x07
+
 PolicyHandler g_policy;
 
 PolicyHandler::PolicyHandler()
@@ -27,6 +37,11 @@ void PolicyHandler::processControlMessage(const char* data, int len) {
         return;
     }
     
+    if ((uint8_t)data[0] == BINARY_FRAME_HEADER) {
+        processBinaryMessage((const uint8_t*)data, len);
+        return;
+    }
+    
     ESP_LOGI(TAG, "Processing control message: %.*s", len, data);
     
     // Parse JSON command
@@ -99,6 +114,62 @@ void PolicyHandler::processControlMessage(const char* data, int len) {
     cJSON_Delete(root);
 }
 
+void PolicyHandler::processBinaryMessage(const uint8_t* data, int len) {
+    if (len < 2) {
+        ESP_LOGE(TAG, "Binary frame too short");
+        return;
+    }
+    
+    uint8_t opcode = data[1];
+    const uint8_t *body = data + 2;
+    int body_len = len - 2;
+    ESP_LOGI(TAG, "Binary command: 0x%02x (%d bytes)", opcode, len);
+    
+    switch (opcode) {
+        case OP_SET_QOS:
+            if (body_len == 1) {
+                handleSetQoS(body[0]);
+                return;
+            }
+            break;
+        case OP_SET_SAMPLE_RATE:
+        case OP_SET_PUBLISH_INTERVAL:
+            if (body_len == 4) {
+                uint32_t value;
+                memcpy(&value, body, sizeof(value));  // ESP32 is little-endian
+                if (opcode == OP_SET_SAMPLE_RATE) {
+                    handleSetSampleRate(value);
+                } else {
+                    handleSetPublishInterval(value);
+                }
+                return;
+            }
+            break;
+        case OP_SET_AUDIO_GAIN:
+            if (body_len == 4) {
+                float gain;
+                memcpy(&gain, body, sizeof(gain));
+                handleSetAudioGain(gain);
+                return;
+            }
+            break;
+        case OP_ENABLE:
+            handleEnable();
+            return;
+        case OP_DISABLE:
+            handleDisable();
+            return;
+        case OP_RESET:
+            handleReset();
+            return;
+        default:
+            ESP_LOGW(TAG, "Unknown binary opcode: 0x%02x", opcode);
+            return;
+    }
+    
+    ESP_LOGE(TAG, "Bad length %d for binary opcode 0x%02x", len, opcode);
+}
+
 void PolicyHandler::handleSetQoS(int qos) {
     if (qos < 0 || qos > 2) {
         ESP_LOGE(TAG, "Invalid QoS: %d", qos);
@@ -22,6 +22,9 @@ public:
     float getAudioGain() { return audio_gain_; }
     
 private:
+    // Decode a compact binary-v1 control frame (see src/control_codec.py)
+    void processBinaryMessage(const uint8_t* data, int len);
+    
     void handleSetQoS(int qos);
     void handleSetSampleRate(uint32_t sample_rate);
     void handleEnable();
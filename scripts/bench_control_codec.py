@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Control message codec benchmark
+Compares bytes on the wire and encode/decode cost of JSON vs binary-v1 frames
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from control_codec import BINARY_ENCODING, JSON_ENCODING, decode_control, encode_control
+
+# The control messages DeviceEnforcer actually sends
+MESSAGES = [
+    {'command': 'SET_QOS', 'qos': 2},
+    {'command': 'SET_SAMPLE_RATE', 'sample_rate': 44100},
+    {'command': 'SET_PUBLISH_INTERVAL', 'interval_ms': 5000},
+    {'command': 'SET_AUDIO_GAIN', 'gain': 2.5},
+    {'command': 'DISABLE'},
+    {'type': 'qos_update', 'qos': 1, 'reliable_delivery': True},
+    {'type': 'config_update', 'sampling_rate': 10, 'enabled': True, 'priority': 'high'},
+]
+
+
+def bench_message(message, iterations):
+    """Measure one message in both encodings"""
+    row = {'message': message.get('command') or message.get('type')}
+    for encoding in (JSON_ENCODING, BINARY_ENCODING):
+        payload, used = encode_control(message, encoding)
+        wire = payload.encode() if isinstance(payload, str) else payload
+        encode_s = timeit.timeit(lambda: encode_control(message, encoding), number=iterations)
+        decode_s = timeit.timeit(lambda: decode_control(wire), number=iterations)
+        row[encoding] = {
+            'encoding_used': used,
+            'bytes': len(wire),
+            'encode_us': encode_s / iterations * 1e6,
+            'decode_us': decode_s / iterations * 1e6,
+        }
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--iterations', type=int, default=100000)
+    parser.add_argument('--json', action='store_true', help='Emit machine-readable results')
+    args = parser.parse_args()
+
+    rows = [bench_message(m, args.iterations) for m in MESSAGES]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{'message':<22}{'json B':>8}{'bin B':>8}{'ratio':>7}"
+          f"{'enc json':>10}{'enc bin':>9}{'dec json':>10}{'dec bin':>9}  (us/op)")
+    total_json = total_bin = 0
+    for row in rows:
+        j, b = row[JSON_ENCODING], row[BINARY_ENCODING]
+        total_json += j['bytes']
+        total_bin += b['bytes']
+        print(f"{row['message']:<22}{j['bytes']:>8}{b['bytes']:>8}{j['bytes'] / b['bytes']:>6.1f}x"
+              f"{j['encode_us']:>10.2f}{b['encode_us']:>9.2f}{j['decode_us']:>10.2f}{b['decode_us']:>9.2f}")
+    print(f"{'total':<22}{total_json:>8}{total_bin:>8}{total_json / total_bin:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -655,6 +655,49 @@ def live_target_health():
         print("\n\nStopped live monitoring.")
         input("Press Enter to continue...")
 
+def live_event_stream():
+    """Follow intent, policy, device and feedback changes as the API streams them"""
+    if not TOKEN:
+        print_info("Logging in first...")
+        if not login():
+            input("Press Enter to continue...")
+            return
+    
+    colors = {'intent': Colors.CYAN, 'policy': Colors.GREEN, 'device': Colors.BLUE,
+              'feedback': Colors.YELLOW, 'reset': Colors.RED}
+    last_event_id = None
+    print_info("Streaming events... Press Ctrl+C to stop")
+    
+    try:
+        while True:
+            headers = {"Authorization": f"Bearer {TOKEN}"}
+            if last_event_id:
+                headers["Last-Event-ID"] = last_event_id
+            try:
+                with requests.get(f"{API_URL}/api/v1/events", headers=headers,
+                                  stream=True, timeout=(5, 60)) as response:
+                    if response.status_code != 200:
+                        print_error(f"Event stream refused: {response.status_code} {response.text}")
+                        break
+                    event_type = None
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("id: "):
+                            last_event_id = line[4:]
+                        elif line.startswith("event: "):
+                            event_type = line[7:]
+                        elif line.startswith("data: "):
+                            color = colors.get(event_type, Colors.WHITE)
+                            print(f"{Colors.DIM}[{get_timestamp()}]{Colors.END} "
+                                  f"{color}{event_type:<8}{Colors.END} {line[6:]}")
+            except requests.exceptions.RequestException as e:
+                # Reconnect and resume from the last event seen
+                print_warning(f"Stream interrupted ({e}), reconnecting...")
+                time.sleep(3)
+    except KeyboardInterrupt:
+        pass
+    print("\n\nStopped event stream.")
+    input("Press Enter to continue...")
+
 def live_network_stats():
     """Live network traffic statistics"""
     print_info("Starting live network monitoring... Press Ctrl+C to stop")
@@ -1533,7 +1576,7 @@ def main_menu():
    
 {Colors.GREEN}  Live Dashboards:{Colors.END}
    14. Live System Metrics     15. Live Network Stats
-   16. Full Dashboard
+   16. Full Dashboard          18. Live Event Stream
     
 {Colors.CYAN}  Demo:{Colors.END}
    17. Run Full Demo (Automated)
@@ -1634,6 +1677,8 @@ def main_menu():
         elif choice == '17':
             run_demo_sequence()
             input("\nPress Enter to continue...")
+        elif choice == '18':
+            live_event_stream()
         else:
             print_error("Invalid option")
             input("\nPress Enter to continue...")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+API load test
+Drives the Intent Manager API from concurrent keep-alive clients and reports
+requests per second, latency percentiles and status codes
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def run_client(url, paths, headers, deadline, latencies, statuses, lock, revalidate=False):
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    local_latencies, local_statuses = [], Counter()
+    etags = {}
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        request_headers = headers
+        if revalidate and path in etags:
+            request_headers = {**headers, 'If-None-Match': etags[path]}
+        start = time.perf_counter()
+        try:
+            response = session.get(url + path, headers=request_headers, timeout=10)
+            status = response.status_code
+            if 'ETag' in response.headers:
+                etags[path] = response.headers['ETag']
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        local_latencies.append(time.perf_counter() - start)
+        local_statuses[status] += 1
+    session.close()
+    with lock:
+        latencies.extend(local_latencies)
+        statuses.update(local_statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--path', action='append', help='Path to request (repeatable, default /health)')
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    parser.add_argument('-d', '--duration', type=float, default=15)
+    parser.add_argument('--token', help='Bearer token for authenticated endpoints')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='Send If-None-Match with the last ETag seen (like a polling dashboard)')
+    parser.add_argument('--label', default='', help='Name of the configuration under test')
+    parser.add_argument('--json', action='store_true', help='Emit machine-readable results')
+    args = parser.parse_args()
+
+    paths = args.path or ['/health']
+    headers = {'Authorization': f"Bearer {args.token}"} if args.token else {}
+    latencies, statuses, lock = [], Counter(), threading.Lock()
+
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    clients = [threading.Thread(target=run_client,
+                                args=(args.url, paths, headers, deadline, latencies, statuses, lock,
+                                      args.revalidate))
+               for _ in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    ok = sum(n for status, n in statuses.items() if isinstance(status, int) and status < 400)
+    report = {
+        'label': args.label,
+        'concurrency': args.concurrency,
+        'requests': len(latencies),
+        'requests_per_second': ok / elapsed,
+        'latency_ms': {'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)),
+                       'p99': float(np.percentile(ms, 99))},
+        'statuses': {str(status): n for status, n in sorted(statuses.items(), key=str)},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{args.label or args.url}: {report['requests']} requests, {args.concurrency} clients, {elapsed:.1f}s")
+    print(f"  {report['requests_per_second']:.0f} successful req/s, latency p50 {report['latency_ms']['p50']:.1f} ms, "
+          f"p95 {report['latency_ms']['p95']:.1f} ms, p99 {report['latency_ms']['p99']:.1f} ms")
+    print(f"  statuses: {report['statuses']}")
+
+
+if __name__ == '__main__':
+    main()
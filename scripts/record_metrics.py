@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Metrics recorder
+Samples the feedback engine's per-node queries from Prometheus into a JSONL file
+that FEEDBACK_METRICS_SOURCE=recorded (RecordedSource) can replay offline
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from feedback.sources import METRIC_QUERIES, PrometheusSource
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--prometheus', default=os.getenv('PROMETHEUS_URL', 'http://localhost:9090'))
+    parser.add_argument('-o', '--output', default='data/recorded_metrics.jsonl')
+    parser.add_argument('-d', '--duration', type=float, default=600, help='Seconds to record')
+    parser.add_argument('-i', '--interval', type=float, default=5, help='Seconds between samples')
+    args = parser.parse_args()
+
+    source = PrometheusSource(args.prometheus)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    samples = 0
+    deadline = time.monotonic() + args.duration
+    next_sample = time.monotonic()
+    with open(args.output, 'a') as out:
+        while time.monotonic() < deadline:
+            ts = time.time()
+            for metric, (_, per_node, _) in METRIC_QUERIES.items():
+                for series in source.query(per_node).get('result', []):
+                    node_id = series.get('metric', {}).get('node_id')
+                    if node_id is None:
+                        continue
+                    out.write(json.dumps({'ts': ts, 'metric': metric, 'node_id': node_id,
+                                          'value': float(series['value'][1])}) + '\n')
+                    samples += 1
+            out.flush()
+
+            next_sample += args.interval
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+
+    source.close()
+    print(f"Recorded {samples} samples to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Trace report
+Reads spans exported by the controller (TRACING_EXPORT_PATH) and shows where the time
+went between intent submission and device acknowledgement
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+
+def load(path):
+    """Spans grouped by trace ID, in file order"""
+    traces = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                span = json.loads(line)
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def applied_ms(spans):
+    """Root start to the last device acknowledgement, or None if no device acknowledged"""
+    acks = [s['end'] for s in spans if s['name'] == 'device.ack' and s['status'] == 'ok']
+    if not acks:
+        return None
+    start = min(s['start'] for s in spans)
+    return (max(acks) - start) * 1000
+
+
+def print_tree(spans):
+    by_parent = defaultdict(list)
+    ids = {s['span_id'] for s in spans}
+    for span in spans:
+        # Spans whose parent is outside this file (e.g. the caller's) are roots here
+        parent = span['parent_span_id'] if span['parent_span_id'] in ids else None
+        by_parent[parent].append(span)
+    origin = min(s['start'] for s in spans)
+
+    def walk(parent, depth):
+        for span in sorted(by_parent[parent], key=lambda s: s['start']):
+            offset = (span['start'] - origin) * 1000
+            status = '' if span['status'] == 'ok' else f"  [{span['status']}]"
+            print(f"  {offset:>9.2f} ms  {'  ' * depth}{span['name']:<28} {span['duration_ms']:>9.2f} ms{status}")
+            walk(span['span_id'], depth + 1)
+
+    walk(None, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', nargs='?', default=os.getenv('TRACING_EXPORT_PATH', 'data/traces.jsonl'))
+    parser.add_argument('--trace', help='Show only this trace ID')
+    parser.add_argument('--last', type=int, default=3, help='Traces shown as trees (default 3)')
+    parser.add_argument('--json', action='store_true', help='Emit machine-readable results')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        sys.exit(f"No spans at {args.path} (is TRACING_ENABLED on?)")
+    traces = load(args.path)
+    if args.trace:
+        traces = {args.trace: traces.get(args.trace, [])}
+
+    durations = defaultdict(list)
+    for spans in traces.values():
+        for span in spans:
+            durations[span['name']].append(span['duration_ms'])
+    applied = [ms for ms in (applied_ms(spans) for spans in traces.values()) if ms is not None]
+
+    def percentiles(values):
+        values = np.array(values)
+        return {'count': len(values), 'p50': round(float(np.percentile(values, 50)), 3),
+                'p95': round(float(np.percentile(values, 95)), 3), 'max': round(float(values.max()), 3)}
+
+    report = {
+        'traces': len(traces),
+        'intent_to_applied_ms': percentiles(applied) if applied else None,
+        'spans': {name: percentiles(values) for name, values in sorted(durations.items())},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    for trace_id in list(traces)[-args.last:]:
+        spans = traces[trace_id]
+        if not spans:
+            continue
+        total = applied_ms(spans)
+        print(f"trace {trace_id}" + (f"  (applied after {total:.2f} ms)" if total is not None else ''))
+        print_tree(spans)
+        print()
+
+    print(f"{report['traces']} traces")
+    if applied:
+        a = report['intent_to_applied_ms']
+        print(f"intent to applied: p50 {a['p50']:.2f} ms, p95 {a['p95']:.2f} ms ({a['count']} acknowledged)")
+    print(f"{'span':<28} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name, stats in report['spans'].items():
+        print(f"{name:<28} {stats['count']:>7} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['max']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
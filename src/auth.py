@@ -6,26 +6,44 @@ Provides JWT-based authentication for API endpoints with role-based access contr
 
 from flask import request, jsonify
 from functools import wraps
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import jwt
 import bcrypt
 import os
-from database import DatabaseManager
+import secrets
+import threading
+import time
+
+from controller_metrics import auth_token_cache_total
 
 
 class AuthManager:
     """Manager for authentication and authorization."""
     
-    def __init__(self, secret_key=None, db_manager=None):
+    def __init__(self, secret_key=None, db_manager=None, token_cache_size=1024, stream_ticket_seconds=30):
         """Initialize authentication manager.
         
         Args:
             secret_key: JWT secret key (defaults to env var or random)
             db_manager: DatabaseManager instance
+            token_cache_size: Verified tokens remembered until they expire (0 disables)
+            stream_ticket_seconds: Lifetime of single-use event stream tickets
         """
         self.secret_key = secret_key or os.getenv('JWT_SECRET_KEY', 'dev-secret-key-change-in-production')
-        self.db_manager = db_manager or DatabaseManager()
+        if db_manager is None:
+            from database import DatabaseManager
+            db_manager = DatabaseManager()
+        self.db_manager = db_manager
         self.token_expiry_hours = 24
+        # Clients send the same bearer token with every request
+        self.token_cache_size = token_cache_size
+        self._token_cache = OrderedDict()
+        self._token_cache_lock = threading.Lock()
+        # Stream tickets go in URLs (and so in access logs): short-lived, and each redeemed once
+        self.stream_ticket_seconds = stream_ticket_seconds
+        self._redeemed_tickets = {}
+        self._tickets_lock = threading.Lock()
     
     def hash_password(self, password):
         """Hash password using bcrypt.
@@ -77,13 +95,79 @@ class AuthManager:
         Returns:
             Decoded payload dict or None if invalid
         """
+        if self.token_cache_size:
+            with self._token_cache_lock:
+                payload = self._token_cache.get(token)
+                if payload is not None:
+                    if payload['exp'] > time.time():
+                        self._token_cache.move_to_end(token)
+                        auth_token_cache_total.labels('hit').inc()
+                        return payload
+                    del self._token_cache[token]
+            auth_token_cache_total.labels('miss').inc()
+        
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=['HS256'])
-            return payload
         except jwt.ExpiredSignatureError:
             return None
         except jwt.InvalidTokenError:
             return None
+        if payload.get('typ') == 'stream':
+            # Stream tickets only open event streams
+            return None
+        
+        if self.token_cache_size:
+            with self._token_cache_lock:
+                self._token_cache[token] = payload
+                while len(self._token_cache) > self.token_cache_size:
+                    self._token_cache.popitem(last=False)
+        return payload
+    
+    def issue_stream_ticket(self, user):
+        """Issue a single-use ticket that opens one event stream.
+        
+        EventSource cannot send an Authorization header, so browsers pass
+        this ticket as ?ticket= instead of their bearer token.
+        
+        Args:
+            user: Decoded bearer token payload of the requesting user
+            
+        Returns:
+            Ticket string, valid for stream_ticket_seconds
+        """
+        payload = {
+            'username': user['username'],
+            'role': user['role'],
+            'typ': 'stream',
+            'jti': secrets.token_urlsafe(16),
+            'exp': datetime.utcnow() + timedelta(seconds=self.stream_ticket_seconds)
+        }
+        return jwt.encode(payload, self.secret_key, algorithm='HS256')
+    
+    def redeem_stream_ticket(self, ticket):
+        """Validate a stream ticket and mark it used.
+        
+        Args:
+            ticket: Ticket from issue_stream_ticket
+            
+        Returns:
+            Ticket payload, or None if invalid, expired or already redeemed
+        """
+        try:
+            payload = jwt.decode(ticket, self.secret_key, algorithms=['HS256'])
+        except jwt.InvalidTokenError:
+            return None
+        if payload.get('typ') != 'stream':
+            return None
+        
+        now = time.time()
+        with self._tickets_lock:
+            for jti in [j for j, exp in self._redeemed_tickets.items() if exp <= now]:
+                del self._redeemed_tickets[jti]
+            if payload['jti'] in self._redeemed_tickets:
+                return None
+            self._redeemed_tickets[payload['jti']] = payload['exp']
+        return payload
     
     def register_user(self, username, password, email=None, role='user'):
         """Register new user.
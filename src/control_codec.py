@@ -0,0 +1,149 @@
+"""
+Control message codec for Imperium device commands.
+
+Control messages are JSON by default. Devices that advertise the compact
+binary encoding in their status message ("encodings": ["json", "binary-v1"])
+receive fixed-layout frames instead, which are several times smaller and need
+no JSON parser on the device.
+
+Binary frame layout (little-endian):
+    byte 0      0xA1 (high nibble 0xA marks a binary frame, low nibble = version)
+    byte 1      opcode
+    bytes 2..   opcode-specific fixed fields
+
+A JSON payload always starts with '{' (or whitespace), so the first byte is
+enough to tell the two encodings apart.
+"""
+
+import json
+import struct
+
+JSON_ENCODING = 'json'
+BINARY_ENCODING = 'binary-v1'
+SUPPORTED_ENCODINGS = (JSON_ENCODING, BINARY_ENCODING)
+
+BINARY_VERSION = 1
+BINARY_HEADER = 0xA0 | BINARY_VERSION
+
+# Sentinel for "not set" in optional unsigned fields
+_UNSET_U32 = 0xFFFFFFFF
+
+_PRIORITY_CODES = {'low': 0, 'normal': 1, 'high': 2}
+_PRIORITY_NAMES = {code: name for name, code in _PRIORITY_CODES.items()}
+
+
+def _priority_code(name):
+    return _PRIORITY_CODES.get(name, _PRIORITY_CODES['normal'])
+
+
+# opcode -> (message key, value, struct format, fields)
+# Each field is (name, to_wire, from_wire)
+_COMMANDS = {
+    0x01: ('command', 'SET_QOS', '<B', (('qos', int, int),)),
+    0x02: ('command', 'SET_SAMPLE_RATE', '<I', (('sample_rate', int, int),)),
+    0x03: ('command', 'SET_PUBLISH_INTERVAL', '<I', (('interval_ms', int, int),)),
+    0x04: ('command', 'SET_AUDIO_GAIN', '<f', (('gain', float, lambda v: round(v, 4)),)),
+    0x05: ('command', 'ENABLE', '<', ()),
+    0x06: ('command', 'DISABLE', '<', ()),
+    0x07: ('command', 'RESET', '<', ()),
+    0x10: ('type', 'qos_update', '<BB', (
+        ('qos', lambda v: int(v or 0), int),
+        ('reliable_delivery', bool, bool),
+    )),
+    0x11: ('type', 'config_update', '<IBB', (
+        ('sampling_rate', lambda v: _UNSET_U32 if v is None else int(v),
+         lambda v: None if v == _UNSET_U32 else v),
+        ('enabled', bool, bool),
+        ('priority', _priority_code, lambda v: _PRIORITY_NAMES.get(v, 'normal')),
+    )),
+}
+
+_OPCODES = {(key, value): opcode for opcode, (key, value, _, _) in _COMMANDS.items()}
+_STRUCTS = {opcode: struct.Struct(fmt) for opcode, (_, _, fmt, _) in _COMMANDS.items()}
+
+
+class CodecError(ValueError):
+    """Raised when a control payload cannot be decoded."""
+
+
+def encode_binary(message):
+    """Encode a control message as a binary frame.
+
+    Args:
+        message: Control message dict as built by DeviceEnforcer
+
+    Returns:
+        Frame bytes, or None if the message has no binary representation
+        (unknown command or extra fields) and must be sent as JSON
+    """
+    if 'command' in message:
+        opcode = _OPCODES.get(('command', message['command']))
+    else:
+        opcode = _OPCODES.get(('type', message.get('type')))
+    if opcode is None:
+        return None
+
+    key, _, _, fields = _COMMANDS[opcode]
+    if set(message) - {key} - {name for name, _, _ in fields}:
+        return None
+
+    try:
+        values = [to_wire(message.get(name)) for name, to_wire, _ in fields]
+        body = _STRUCTS[opcode].pack(*values)
+    except (TypeError, ValueError, struct.error):
+        return None
+
+    return bytes((BINARY_HEADER, opcode)) + body
+
+
+def decode_binary(payload):
+    """Decode a binary frame into a control message dict.
+
+    Raises:
+        CodecError: If the frame is malformed or uses an unknown version/opcode
+    """
+    if len(payload) < 2 or payload[0] != BINARY_HEADER:
+        raise CodecError("Not a binary-v1 control frame")
+
+    opcode = payload[1]
+    if opcode not in _COMMANDS:
+        raise CodecError(f"Unknown opcode 0x{opcode:02x}")
+
+    key, value, _, fields = _COMMANDS[opcode]
+    layout = _STRUCTS[opcode]
+    if len(payload) != 2 + layout.size:
+        raise CodecError(f"Bad frame length {len(payload)} for opcode 0x{opcode:02x}")
+
+    message = {key: value}
+    for (name, _, from_wire), raw in zip(fields, layout.unpack_from(payload, 2)):
+        message[name] = from_wire(raw)
+    return message
+
+
+def encode_control(message, encoding=JSON_ENCODING):
+    """Encode a control message, falling back to JSON when needed.
+
+    Returns:
+        Tuple of (payload, encoding actually used)
+    """
+    if encoding == BINARY_ENCODING:
+        frame = encode_binary(message)
+        if frame is not None:
+            return frame, BINARY_ENCODING
+    return json.dumps(message), JSON_ENCODING
+
+
+def decode_control(payload):
+    """Decode a control payload in either encoding.
+
+    Args:
+        payload: Raw MQTT payload (bytes or str)
+
+    Returns:
+        Control message dict
+    """
+    if isinstance(payload, (bytes, bytearray)) and payload[:1] == bytes((BINARY_HEADER,)):
+        return decode_binary(payload)
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode()
+    return json.loads(payload)
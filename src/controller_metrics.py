@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Controller Metrics - Prometheus instrumentation of the API and intent pipeline
+Request latency per route, intent stage timings, rate limiting, auth token cache
+and database query timings, served at /metrics by the API
+"""
+import inspect
+import logging
+import os
+import time
+from functools import wraps
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Most API calls finish in milliseconds; submissions that enforce on tc take longer
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ============== Prometheus Metrics ==============
+
+api_request_duration = Histogram(
+    'imperium_api_request_duration_seconds',
+    'Time to produce an API response (to the first byte for streams)',
+    ['method', 'route', 'status'],
+    buckets=_LATENCY_BUCKETS
+)
+intent_stage_duration = Histogram(
+    'imperium_intent_stage_duration_seconds',
+    'Time spent in each stage of handling a submitted intent',
+    ['stage'],  # parse, policy_generation, persist, enforce
+    buckets=_LATENCY_BUCKETS
+)
+rate_limited_total = Counter(
+    'imperium_api_rate_limited_total',
+    'Requests rejected by the rate limiter',
+    ['limit_type']
+)
+auth_token_cache_total = Counter(
+    'imperium_auth_token_cache_total',
+    'Bearer token checks answered from the verified-token cache (hit) or by decoding (miss)',
+    ['result']
+)
+db_query_duration = Histogram(
+    'imperium_db_query_duration_seconds',
+    'Time spent in database operations, including commit',
+    ['operation'],
+    buckets=_LATENCY_BUCKETS
+)
+
+
+def timed_query(operation: str):
+    """Decorator recording a DatabaseManager method (sync or async) in db_query_duration"""
+    histogram = db_query_duration.labels(operation)
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await f(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+def render_metrics():
+    """
+    Exposition of all controller metrics
+
+    Under a multi-process server with PROMETHEUS_MULTIPROC_DIR set, the
+    samples of every worker are merged, so any worker can answer a scrape.
+
+    Returns:
+        (body, content_type)
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def instrument_flask(app):
+    """Time every request of a Flask app by route template and status, and serve /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            # Route templates, not paths, so intent IDs do not become labels
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            api_request_duration.labels(request.method, route, str(response.status_code)).observe(
+                time.perf_counter() - start)
+        return response
+
+    def metrics():
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
+
+    app.add_url_rule('/metrics', view_func=metrics, methods=['GET'])
+
+
+class ASGIMetricsMiddleware:
+    """ASGI counterpart of instrument_flask's request timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                # The router records the matched route in the scope
+                route = scope.get('route')
+                api_request_duration.labels(
+                    scope['method'], getattr(route, 'path', 'unmatched'), str(message['status'])
+                ).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -8,12 +8,15 @@ This module provides SQLAlchemy ORM models for persistent storage of:
 """
 
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import create_engine, select, update, Column, Integer, String, Text, DateTime, Float, ForeignKey, Boolean
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, selectinload
 import json
 import os
 
+from controller_metrics import timed_query
+from response_cache import Generations
+
 Base = declarative_base()
 
 
@@ -52,7 +55,7 @@ class Policy(Base):
     intent_id = Column(String(36), ForeignKey('intents.id'), nullable=False)
     type = Column(String(50), nullable=False)  # tc_commands, mqtt_configs, routing_rules, etc.
     parameters = Column(Text)  # JSON string
-    status = Column(String(20), default='pending')  # pending, enforced, failed
+    status = Column(String(20), default='pending')  # pending, enforced, superseded, expired, withdrawn, failed
     created_at = Column(DateTime, default=datetime.utcnow)
     enforced_at = Column(DateTime, nullable=True)
     
@@ -126,12 +129,15 @@ class User(Base):
 class DatabaseManager:
     """Manager class for database operations."""
     
-    def __init__(self, db_path='data/imperium.db'):
+    def __init__(self, db_path='data/imperium.db', generations=None):
         """Initialize database connection.
         
         Args:
             db_path: Path to SQLite database file
+            generations: Change counters bumped by writes (drive API ETags)
         """
+        self.generations = generations or Generations()
+        
         # Create data directory if it doesn't exist
         db_dir = os.path.dirname(db_path)
         if db_dir and not os.path.exists(db_dir):
@@ -146,6 +152,7 @@ class DatabaseManager:
         """Get a new database session."""
         return self.Session()
     
+    @timed_query('add_intent')
     def add_intent(self, intent_id, original_intent, parsed_intent, status='pending'):
         """Add new intent to database."""
         session = self.get_session()
@@ -158,6 +165,7 @@ class DatabaseManager:
             )
             session.add(intent)
             session.commit()
+            self.generations.bump('intents')
             return intent.to_dict()
         except Exception as e:
             session.rollback()
@@ -165,6 +173,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('add_policy')
     def add_policy(self, policy_id, intent_id, policy_type, parameters, status='pending'):
         """Add new policy to database."""
         session = self.get_session()
@@ -178,6 +187,7 @@ class DatabaseManager:
             )
             session.add(policy)
             session.commit()
+            self.generations.bump('policies')
             return policy.to_dict()
         except Exception as e:
             session.rollback()
@@ -185,6 +195,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('update_intent_status')
     def update_intent_status(self, intent_id, status):
         """Update intent status."""
         session = self.get_session()
@@ -194,6 +205,7 @@ class DatabaseManager:
                 intent.status = status
                 intent.updated_at = datetime.utcnow()
                 session.commit()
+                self.generations.bump('intents')
                 return intent.to_dict()
             return None
         except Exception as e:
@@ -202,6 +214,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('update_policy_status')
     def update_policy_status(self, policy_id, status):
         """Update policy status."""
         session = self.get_session()
@@ -212,6 +225,7 @@ class DatabaseManager:
                 if status == 'enforced':
                     policy.enforced_at = datetime.utcnow()
                 session.commit()
+                self.generations.bump('policies')
                 return policy.to_dict()
             return None
         except Exception as e:
@@ -220,6 +234,41 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('update_policy_statuses')
+    def update_policy_statuses(self, statuses):
+        """
+        Update the status of many policies in one transaction.
+        
+        Args:
+            statuses: Dict of policy_id -> status; unknown IDs are ignored
+        
+        Returns:
+            Number of policies updated
+        """
+        if not statuses:
+            return 0
+        session = self.get_session()
+        try:
+            updated = 0
+            ids = list(statuses)
+            # Chunked to stay under SQLite's bound parameter limit
+            for i in range(0, len(ids), 500):
+                for policy in session.query(Policy).filter(Policy.id.in_(ids[i:i + 500])):
+                    policy.status = statuses[policy.id]
+                    if policy.status == 'enforced':
+                        policy.enforced_at = datetime.utcnow()
+                    updated += 1
+            session.commit()
+            if updated:
+                self.generations.bump('policies')
+            return updated
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+    
+    @timed_query('get_intent')
     def get_intent(self, intent_id):
         """Get intent by ID."""
         session = self.get_session()
@@ -229,6 +278,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('get_all_intents')
     def get_all_intents(self, limit=100):
         """Get all intents."""
         session = self.get_session()
@@ -238,6 +288,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('get_all_policies')
     def get_all_policies(self, limit=100):
         """Get all policies."""
         session = self.get_session()
@@ -247,6 +298,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('add_metric')
     def add_metric(self, metric_name, metric_value, device_id=None, intent_id=None, meta_data=None):
         """Add metrics data."""
         session = self.get_session()
@@ -267,6 +319,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('get_metrics')
     def get_metrics(self, metric_name=None, device_id=None, start_time=None, end_time=None, limit=1000):
         """Query metrics with filters."""
         session = self.get_session()
@@ -287,6 +340,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('add_user')
     def add_user(self, username, password_hash, email=None, role='user'):
         """Add new user."""
         session = self.get_session()
@@ -306,6 +360,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('get_user_by_username')
     def get_user_by_username(self, username):
         """Get user by username."""
         session = self.get_session()
@@ -315,6 +370,7 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @timed_query('update_last_login')
     def update_last_login(self, username):
         """Update user's last login time."""
         session = self.get_session()
@@ -328,3 +384,123 @@ class DatabaseManager:
             raise e
         finally:
             session.close()
+
+
+class AsyncDatabaseManager:
+    """Asyncio counterpart of DatabaseManager, used by the ASGI API.
+    
+    Covers the operations the API serves; requires the aiosqlite driver.
+    """
+    
+    def __init__(self, db_path='data/imperium.db', generations=None):
+        """Initialize async database connection.
+        
+        Args:
+            db_path: Path to SQLite database file
+            generations: Change counters bumped by writes (drive API ETags)
+        """
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        
+        self.generations = generations or Generations()
+        self.db_path = db_path
+        self.engine = create_async_engine(f'sqlite+aiosqlite:///{db_path}')
+        # Objects stay readable after commit; nothing is lazily loaded on the event loop
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+    
+    async def create_tables(self):
+        """Create missing tables."""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    
+    async def close(self):
+        """Close all pooled connections."""
+        await self.engine.dispose()
+    
+    @timed_query('add_intent')
+    async def add_intent(self, intent_id, original_intent, parsed_intent, status='pending', policies=()):
+        """Add new intent, and optionally its policies, in one transaction.
+        
+        Args:
+            policies: Policy dicts (policy_id, policy_type, parameters) stored as 'pending'
+        """
+        async with self.Session() as session:
+            async with session.begin():
+                intent = Intent(
+                    id=intent_id,
+                    original_intent=original_intent,
+                    parsed_intent=json.dumps(parsed_intent) if parsed_intent else None,
+                    status=status,
+                    policies=[
+                        Policy(
+                            id=p['policy_id'],
+                            type=p['policy_type'],
+                            parameters=json.dumps(p['parameters']) if p.get('parameters') else None,
+                            status='pending'
+                        )
+                        for p in policies
+                    ]
+                )
+                session.add(intent)
+            self.generations.bump('intents', 'policies')
+            return intent.to_dict()
+    
+    @timed_query('get_intent')
+    async def get_intent(self, intent_id):
+        """Get intent by ID."""
+        async with self.Session() as session:
+            result = await session.execute(
+                select(Intent).options(selectinload(Intent.policies)).filter_by(id=intent_id)
+            )
+            intent = result.scalars().first()
+            return intent.to_dict() if intent else None
+    
+    @timed_query('get_all_intents')
+    async def get_all_intents(self, limit=100):
+        """Get all intents."""
+        async with self.Session() as session:
+            result = await session.execute(
+                select(Intent).options(selectinload(Intent.policies))
+                .order_by(Intent.created_at.desc()).limit(limit)
+            )
+            return [intent.to_dict() for intent in result.scalars()]
+    
+    @timed_query('get_all_policies')
+    async def get_all_policies(self, limit=100):
+        """Get all policies."""
+        async with self.Session() as session:
+            result = await session.execute(select(Policy).order_by(Policy.created_at.desc()).limit(limit))
+            return [policy.to_dict() for policy in result.scalars()]
+    
+    @timed_query('add_user')
+    async def add_user(self, username, password_hash, email=None, role='user'):
+        """Add new user."""
+        async with self.Session() as session:
+            async with session.begin():
+                user = User(
+                    username=username,
+                    password_hash=password_hash,
+                    email=email,
+                    role=role
+                )
+                session.add(user)
+            return user.to_dict()
+    
+    @timed_query('get_user_by_username')
+    async def get_user_by_username(self, username):
+        """Get user by username."""
+        async with self.Session() as session:
+            result = await session.execute(select(User).filter_by(username=username))
+            return result.scalars().first()
+    
+    @timed_query('update_last_login')
+    async def update_last_login(self, username):
+        """Update user's last login time."""
+        async with self.Session() as session:
+            async with session.begin():
+                await session.execute(
+                    update(User).where(User.username == username).values(last_login=datetime.utcnow())
+                )
@@ -6,72 +6,153 @@ Sends configuration and control messages to IoT nodes
 import paho.mqtt.client as mqtt
 import json
 import logging
-from typing import Dict, Any
+import threading
+from typing import Any, Callable, Dict, List, Mapping, Optional
 import time
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from control_codec import BINARY_ENCODING, JSON_ENCODING, encode_control
+from enforcement.mqtt_manager import ControlOutbox, MQTTConnectionManager
+from enforcement.registry import DeviceRecord, DeviceRegistry
+from enforcement.shadow import DeviceShadowManager
+from tracing import get_tracer, parse_traceparent
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Fields whose change is worth telling subscribers about
+_STATE_FIELDS = ('online', 'qos', 'sampling_rate', 'priority', 'enabled')
+
 
 class DeviceEnforcer:
     """Enforces policies on IoT devices via MQTT"""
     
-    def __init__(self, broker_host='localhost', broker_port=1883):
+    def __init__(self, broker_host='localhost', broker_port=1883,
+                 outbox_path: Optional[str] = None, outbox_size: int = 1000,
+                 reconnect_min_delay: int = 1, reconnect_max_delay: int = 60,
+                 device_stale_after: Optional[float] = None, device_max_devices: int = 100000,
+                 control_encoding: str = 'auto', command_debounce: float = 0.0,
+                 client_id: str = 'device-enforcer'):
         self.broker_host = broker_host
         self.broker_port = broker_port
+        # 'auto' uses the compact binary encoding for devices that advertise it
+        self.control_encoding = control_encoding
         
-        self.client = mqtt.Client(client_id='device-enforcer')
-        self.client.on_connect = self.on_connect
+        # Must be unique per process: the broker drops the older session on a clash
+        self.client = mqtt.Client(client_id=client_id)
         self.client.on_message = self.on_message
         
-        self.connected = False
-        self.device_status = {}
+        # Reconnects with backoff; messages issued while offline wait in the outbox
+        self.connection = MQTTConnectionManager(
+            self.client, broker_host, broker_port,
+            min_delay=reconnect_min_delay,
+            max_delay=reconnect_max_delay,
+            on_connect=self.on_connect
+        )
+        self.outbox = ControlOutbox(max_size=outbox_size, path=outbox_path)
+        self._send_lock = threading.RLock()
+        
+        # Latest parsed status per device, written by the paho network thread
+        self.registry = DeviceRegistry(stale_after=device_stale_after, max_devices=device_max_devices)
+        
+        # Desired state merged from all policies; only real changes are published
+        self.shadows = DeviceShadowManager(self._send_control_message, debounce=command_debounce)
+        
+        # Called with the node ID after each status update (e.g. to re-check its intents)
+        self.status_listeners: List[Callable[[str], Any]] = []
+        # Called with the new record only when a device's reported state changes
+        self.change_listeners: List[Callable[[DeviceRecord], Any]] = []
+    
+    @staticmethod
+    def _state_changed(previous: Optional[DeviceRecord], record: DeviceRecord) -> bool:
+        """Whether anything but timestamps differs (heartbeats change nothing)"""
+        if previous is None:
+            return True
+        return any(getattr(previous, name) != getattr(record, name) for name in _STATE_FIELDS)
+    
+    @property
+    def connected(self) -> bool:
+        """Whether the broker connection is currently up"""
+        return self.connection.connected
     
     def on_connect(self, client, userdata, flags, rc):
         """Callback when connected to MQTT broker"""
         if rc == 0:
             logger.info("Device Enforcer connected to MQTT broker")
-            self.connected = True
             # Subscribe to all device status topics
             client.subscribe("iot/+/status", qos=1)
+            self._flush_outbox()
         else:
             logger.error(f"Connection failed with code {rc}")
     
     def on_message(self, client, userdata, msg):
         """Handle incoming device status messages"""
         try:
-            payload = json.loads(msg.payload.decode())
-            node_id = payload.get('node_id')
-            self.device_status[node_id] = payload
-            logger.debug(f"Updated status for {node_id}")
+            raw = msg.payload.decode()
+            try:
+                payload = json.loads(raw)
+            except ValueError:
+                # ESP32 nodes publish a bare "online" string on connect
+                payload = raw.strip()
+            
+            topic_parts = msg.topic.split('/')
+            topic_node_id = topic_parts[1] if len(topic_parts) > 2 else None
+            
+            if isinstance(payload, dict):
+                node_id = payload.get('node_id') or payload.get('device_id') or topic_node_id
+            else:
+                node_id = topic_node_id
+            previous = self.registry.get(node_id) if node_id else None
+            record = self.registry.update_from_status(payload, topic_node_id=topic_node_id)
+            if record:
+                logger.debug(f"Updated status for {record.node_id}")
+                config = payload.get('config') if isinstance(payload, dict) else None
+                self.shadows.acknowledge(record.node_id, config)
+                if isinstance(payload, dict) and payload.get('traceparent'):
+                    # The device echoes the context of the control message it applied
+                    get_tracer().finish_remote(payload['traceparent'], node_id=record.node_id)
+                for listener in self.status_listeners:
+                    listener(record.node_id)
+                if self._state_changed(previous, record):
+                    for listener in self.change_listeners:
+                        listener(record)
+            
+            self.registry.evict_stale()
         except Exception as e:
             logger.error(f"Error processing status message: {e}")
     
-    def connect(self):
-        """Connect to MQTT broker"""
-        try:
-            self.client.connect(self.broker_host, self.broker_port, 60)
-            self.client.loop_start()
-            
-            # Wait for connection
-            timeout = 5
-            while not self.connected and timeout > 0:
-                time.sleep(0.5)
-                timeout -= 0.5
-            
-            if not self.connected:
-                raise Exception("Failed to connect to MQTT broker")
+    def connect(self, timeout: float = 5.0) -> bool:
+        """
+        Connect to MQTT broker
+        
+        If the broker is unreachable the connection keeps retrying in the
+        background and control messages are queued until it comes up.
+        
+        Args:
+            timeout: Seconds to wait for the initial connection
             
+        Returns:
+            bool: Whether the broker was reached within the timeout
+        """
+        if self.connection.start(timeout):
             logger.info("Successfully connected to MQTT broker")
-            
-        except Exception as e:
-            logger.error(f"Connection error: {e}")
-            raise
+            return True
+        
+        logger.warning(
+            f"MQTT broker {self.broker_host}:{self.broker_port} not reachable yet, "
+            f"retrying in background (control messages will be queued)"
+        )
+        return False
     
     def disconnect(self):
         """Disconnect from MQTT broker"""
-        self.client.loop_stop()
-        self.client.disconnect()
+        # Debounced commands go out (or into the outbox) before the connection closes
+        self.shadows.close()
+        self.connection.stop()
         logger.info("Disconnected from MQTT broker")
     
     def apply_policy(self, policy: Dict[str, Any]) -> bool:
@@ -84,6 +165,13 @@ class DeviceEnforcer:
         Returns:
             bool: Success status
         """
+        with get_tracer().span('device.apply_policy', policy_id=policy.get('policy_id'),
+                               policy_type=policy.get('policy_type'), target=policy.get('target')) as span:
+            success = self._apply_policy(policy)
+            span.set('success', success)
+            return success
+    
+    def _apply_policy(self, policy: Dict[str, Any]) -> bool:
         policy_type = policy.get('policy_type')
         
         if policy_type == 'qos_control':
@@ -122,7 +210,7 @@ class DeviceEnforcer:
                 'reliable_delivery': params.get('reliable_delivery', False)
             }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
     
     def _apply_sample_rate_policy(self, policy: Dict) -> bool:
         """Apply sample rate policy to audio devices (ESP32)"""
@@ -137,7 +225,7 @@ class DeviceEnforcer:
             'sample_rate': int(sample_rate)
         }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
     
     def _apply_device_control_policy(self, policy: Dict) -> bool:
         """Apply enable/disable/reset control to device"""
@@ -151,7 +239,7 @@ class DeviceEnforcer:
             'command': command
         }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
     
     def _apply_publish_interval_policy(self, policy: Dict) -> bool:
         """Apply publish interval policy to device"""
@@ -166,7 +254,7 @@ class DeviceEnforcer:
             'interval_ms': int(interval_ms)
         }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
     
     def _apply_audio_gain_policy(self, policy: Dict) -> bool:
         """Apply audio gain policy to audio devices"""
@@ -181,7 +269,7 @@ class DeviceEnforcer:
             'gain': float(gain)
         }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
     
     def _apply_device_config(self, policy: Dict) -> bool:
         """Apply device configuration"""
@@ -197,38 +285,167 @@ class DeviceEnforcer:
             'priority': params.get('priority', 'normal')
         }
         
-        return self._send_control_message(target, control_message)
+        return self._submit(policy, target, control_message)
+    
+    def _submit(self, policy: Dict, target: str, message: Dict) -> bool:
+        """Hand a policy's desired device setting to the shadow for reconciliation"""
+        if message.get('command') == 'RESET':
+            # One-shot command: always sent, and the device returns to defaults
+            self.shadows.forget_acknowledged(target)
+            traceparent = get_tracer().current_traceparent()
+            return self._send_control_message(target, dict(message, traceparent=traceparent) if traceparent else message)
+        
+        record = self.registry.get(target)
+        current = {name: getattr(record, name) for name in ('qos', 'sampling_rate', 'priority', 'enabled')
+                   if getattr(record, name) is not None} if record else None
+        return self.shadows.update(
+            target, message,
+            policy_id=policy.get('policy_id'),
+            priority=policy.get('priority', 5),
+            traceparent=get_tracer().current_traceparent(),
+            current=current
+        )
     
     def _send_control_message(self, target: str, message: Dict) -> bool:
-        """Send control message to specific device"""
-        if not self.connected:
-            logger.error("Not connected to MQTT broker")
-            return False
+        """Send control message to specific device, queueing it while offline"""
+        with self._send_lock:
+            # Older queued commands must go out first, so queue behind them
+            if not self.connected or len(self.outbox):
+                self.outbox.put(target, message)
+                logger.warning(f"MQTT broker unavailable, queued control message for {target} "
+                               f"({len(self.outbox)} pending)")
+                return True
+            
+            return self._publish_control_message(target, message)
+    
+    def _publish_control_message(self, target: str, message: Dict) -> bool:
+        """Publish a control message on the device's control topic"""
+        # Trace context travels in the message, since shadow reconciliation and
+        # outbox flushes publish from other threads than the enforcing request
+        if 'traceparent' in message:
+            parent = parse_traceparent(message['traceparent'])
+            message = {key: value for key, value in message.items() if key != 'traceparent'}
+        else:
+            parent = None
+        if parent is None:
+            return self._publish(target, message) != 'failed'
+        
+        tracer = get_tracer()
+        encoding = self._encoding_for(target)
+        with tracer.span('mqtt.publish', parent=parent, target=target, encoding=encoding) as span:
+            if encoding != JSON_ENCODING:
+                # Binary frames carry no trace context, so no echo will come back
+                outcome = self._publish(target, message, traceparent=parent.traceparent)
+                span.set('outcome', outcome)
+                return outcome != 'failed'
+            
+            # Open from publish until the device's status echoes this span's context
+            # (waiting before the publish, so even an instant echo finds it)
+            ack = tracer.start_span('device.ack', parent=parent, target=target)
+            tracer.await_echo(ack)
+            outcome = self._publish(target, message, traceparent=parent.traceparent, echo=ack.traceparent)
+            span.set('outcome', outcome)
+            if outcome != 'sent':
+                tracer.abandon(ack, outcome)
+            return outcome != 'failed'
+    
+    def _publish(self, target: str, message: Dict, traceparent: Optional[str] = None,
+                 echo: Optional[str] = None) -> str:
+        """
+        Publish one message (with `echo` as its trace context, if given)
         
+        Returns:
+            'sent', 'queued' (back in the outbox with `traceparent`) or 'failed'
+        """
         try:
             topic = f"iot/{target}/control"
-            payload = json.dumps(message)
+            payload, _ = encode_control(dict(message, traceparent=echo) if echo else message,
+                                        self._encoding_for(target))
             
             result = self.client.publish(topic, payload, qos=1)
             
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
                 logger.info(f"Control message sent to {target}")
-                return True
+                return 'sent'
+            elif result.rc == mqtt.MQTT_ERR_NO_CONN:
+                # Connection dropped before the disconnect callback fired
+                self.outbox.put(target, dict(message, traceparent=traceparent) if traceparent else message)
+                logger.warning(f"Connection lost while sending to {target}, message queued")
+                return 'queued'
             else:
                 logger.error(f"Failed to send message: {result.rc}")
-                return False
+                return 'failed'
                 
         except Exception as e:
             logger.error(f"Error sending control message: {e}")
-            return False
+            return 'failed'
+    
+    def _encoding_for(self, target: str) -> str:
+        """Pick the control message encoding negotiated with a device"""
+        if self.control_encoding == 'auto':
+            record = self.registry.get(target)
+            if record and BINARY_ENCODING in record.encodings:
+                return BINARY_ENCODING
+        return JSON_ENCODING
+    
+    def _flush_outbox(self):
+        """Replay queued control messages in order after (re)connecting"""
+        with self._send_lock:
+            if not len(self.outbox):
+                return
+            
+            # Senders block on the lock, so nothing new is queued meanwhile
+            entries = self.outbox.drain()
+            logger.info(f"Replaying {len(entries)} queued control messages")
+            
+            for index, (target, message) in enumerate(entries):
+                if not self.connected:
+                    self.outbox.restore(entries[index:])
+                    break
+                self._publish_control_message(target, message)
+    
+    def get_connection_status(self) -> Dict[str, Any]:
+        """Get broker connection and outbox state"""
+        status = self.connection.get_status()
+        status['queued_messages'] = len(self.outbox)
+        return status
     
     def get_device_status(self, node_id: str) -> Dict[str, Any]:
         """Get status of specific device"""
-        return self.device_status.get(node_id, {})
+        record = self.registry.get(node_id)
+        return record.to_dict() if record else {}
     
-    def get_all_devices(self) -> Dict[str, Any]:
-        """Get status of all devices"""
-        return self.device_status
+    def get_all_devices(self) -> Mapping[str, DeviceRecord]:
+        """Get a read-only snapshot of all device records keyed by node ID"""
+        return self.registry.snapshot()
+    
+    def find_devices(self, device_type: Optional[str] = None, location: Optional[str] = None,
+                     online: Optional[bool] = None) -> List[DeviceRecord]:
+        """
+        Query devices through the registry indexes
+        
+        Args:
+            device_type: Only devices of this type
+            location: Only devices at this location
+            online: Only devices in this online state
+            
+        Returns:
+            Matching device records
+        """
+        if device_type is not None:
+            records = self.registry.by_type(device_type)
+        elif location is not None:
+            records = self.registry.by_location(location)
+        elif online:
+            records = self.registry.online()
+        else:
+            records = list(self.registry.snapshot().values())
+        
+        if location is not None:
+            records = [r for r in records if r.location == location]
+        if online is not None:
+            records = [r for r in records if r.online == online]
+        return records
 
 
 if __name__ == '__main__':
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+MQTT Connection Manager - Keeps the controller's broker connection alive
+Reconnects with exponential backoff and queues control messages while offline
+"""
+import paho.mqtt.client as mqtt
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from prometheus_client import Counter, Gauge
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ============== Prometheus Metrics ==============
+
+mqtt_connected = Gauge(
+    'imperium_mqtt_connected',
+    'Whether the controller is connected to the MQTT broker (1) or not (0)',
+    ['client']
+)
+mqtt_reconnects_total = Counter(
+    'imperium_mqtt_reconnects_total',
+    'Successful reconnections to the MQTT broker after a connection loss',
+    ['client']
+)
+mqtt_disconnects_total = Counter(
+    'imperium_mqtt_disconnects_total',
+    'Unexpected disconnections from the MQTT broker',
+    ['client']
+)
+mqtt_outbox_depth = Gauge(
+    'imperium_mqtt_outbox_depth',
+    'Control messages queued while the broker is unreachable'
+)
+mqtt_outbox_coalesced_total = Counter(
+    'imperium_mqtt_outbox_coalesced_total',
+    'Queued control messages replaced by a newer command for the same device setting'
+)
+mqtt_outbox_dropped_total = Counter(
+    'imperium_mqtt_outbox_dropped_total',
+    'Queued control messages dropped because the outbox was full'
+)
+
+# Commands that toggle the same device setting share a coalescing key
+_SETTING_ALIASES = {
+    'ENABLE': 'power',
+    'DISABLE': 'power',
+}
+
+
+class ControlOutbox:
+    """Bounded, optionally persistent queue of undelivered control messages"""
+
+    def __init__(self, max_size: int = 1000, path: Optional[str] = None):
+        """
+        Args:
+            max_size: Maximum number of queued messages (oldest dropped first)
+            path: JSON file used to persist the queue across restarts (optional)
+        """
+        self.max_size = max_size
+        self.path = path
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def setting_key(message: Dict[str, Any]) -> str:
+        """Return the device setting a control message changes"""
+        name = message.get('command') or message.get('type') or 'unknown'
+        return _SETTING_ALIASES.get(name, name)
+
+    def put(self, target: str, message: Dict[str, Any]):
+        """
+        Queue a control message, replacing any older one for the same setting
+
+        The replacement moves to the back of the queue so replay order matches
+        the order in which the surviving commands were issued.
+        """
+        key = (target, self.setting_key(message))
+        with self._lock:
+            if key in self._entries:
+                del self._entries[key]
+                mqtt_outbox_coalesced_total.inc()
+            elif len(self._entries) >= self.max_size:
+                dropped_key, _ = self._entries.popitem(last=False)
+                mqtt_outbox_dropped_total.inc()
+                logger.warning(f"Outbox full, dropped queued {dropped_key[1]} for {dropped_key[0]}")
+            self._entries[key] = {
+                'target': target,
+                'message': message,
+                'queued_at': time.time()
+            }
+            self._changed()
+
+    def drain(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Remove and return all queued messages in replay order"""
+        with self._lock:
+            entries = [(e['target'], e['message']) for e in self._entries.values()]
+            self._entries.clear()
+            self._changed()
+        return entries
+
+    def restore(self, entries: List[Tuple[str, Dict[str, Any]]]):
+        """Put undelivered messages back at the front of the queue"""
+        with self._lock:
+            pending = list(self._entries.items())
+            self._entries.clear()
+            now = time.time()
+            for target, message in entries:
+                key = (target, self.setting_key(message))
+                self._entries[key] = {'target': target, 'message': message, 'queued_at': now}
+            for key, entry in pending:
+                # Anything queued meanwhile is newer and wins
+                self._entries.pop(key, None)
+                self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                mqtt_outbox_dropped_total.inc()
+            self._changed()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _changed(self):
+        """Update metrics and persist (caller holds the lock)"""
+        mqtt_outbox_depth.set(len(self._entries))
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._entries.values()), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to persist MQTT outbox: {e}")
+
+    def _load(self):
+        """Load messages persisted by a previous run"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load MQTT outbox from {self.path}: {e}")
+            return
+
+        for entry in entries[-self.max_size:]:
+            key = (entry['target'], self.setting_key(entry['message']))
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+        mqtt_outbox_depth.set(len(self._entries))
+        if self._entries:
+            logger.info(f"Loaded {len(self._entries)} queued control messages from {self.path}")
+
+
+class MQTTConnectionManager:
+    """Owns the broker connection lifecycle for a paho client"""
+
+    def __init__(self, client: mqtt.Client, broker_host: str, broker_port: int,
+                 keepalive: int = 60, min_delay: int = 1, max_delay: int = 60,
+                 on_connect: Optional[Callable] = None,
+                 on_disconnect: Optional[Callable] = None,
+                 name: str = 'device-enforcer'):
+        """
+        Args:
+            client: paho MQTT client to manage
+            broker_host: Broker hostname
+            broker_port: Broker port
+            keepalive: MQTT keepalive in seconds
+            min_delay: Initial reconnect delay in seconds
+            max_delay: Upper bound for the exponential reconnect delay
+            on_connect: Called with paho's on_connect arguments after a successful connect
+            on_disconnect: Called with paho's on_disconnect arguments
+            name: Label used for metrics and logs
+        """
+        self.client = client
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.keepalive = keepalive
+        self.name = name
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+
+        self.connected = False
+        self.connect_count = 0
+        self.last_connected_at: Optional[float] = None
+        self.last_disconnected_at: Optional[float] = None
+        self._connected_event = threading.Event()
+        self._started = False
+
+        # paho doubles the delay after every failed attempt up to max_delay
+        self.client.reconnect_delay_set(min_delay=min_delay, max_delay=max_delay)
+        self.client.on_connect = self._handle_connect
+        self.client.on_disconnect = self._handle_disconnect
+
+        mqtt_connected.labels(client=name).set(0)
+
+    def start(self, timeout: float = 5.0) -> bool:
+        """
+        Start the network loop and wait up to `timeout` for the first connection
+
+        The loop keeps retrying in the background if the broker is down.
+
+        Returns:
+            bool: Whether the connection was established within the timeout
+        """
+        if not self._started:
+            self.client.connect_async(self.broker_host, self.broker_port, self.keepalive)
+            self.client.loop_start()
+            self._started = True
+        return self._connected_event.wait(timeout)
+
+    def stop(self):
+        """Disconnect and stop the network loop"""
+        if not self._started:
+            return
+        self._started = False
+        self.client.disconnect()
+        self.client.loop_stop()
+        self._set_connected(False)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get connection state for health reporting"""
+        return {
+            'connected': self.connected,
+            'broker': f"{self.broker_host}:{self.broker_port}",
+            'connect_count': self.connect_count,
+            'last_connected_at': self.last_connected_at,
+            'last_disconnected_at': self.last_disconnected_at
+        }
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        mqtt_connected.labels(client=self.name).set(1 if connected else 0)
+        if connected:
+            self._connected_event.set()
+        else:
+            self._connected_event.clear()
+
+    def _handle_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error(f"MQTT connection refused with code {rc}, will retry")
+            return
+
+        self.connect_count += 1
+        if self.connect_count > 1:
+            mqtt_reconnects_total.labels(client=self.name).inc()
+            logger.info(f"Reconnected to MQTT broker (connection #{self.connect_count})")
+        self.last_connected_at = time.time()
+        self._set_connected(True)
+
+        if self.on_connect:
+            self.on_connect(client, userdata, flags, rc)
+
+    def _handle_disconnect(self, client, userdata, rc):
+        self.last_disconnected_at = time.time()
+        self._set_connected(False)
+        if rc != 0:
+            mqtt_disconnects_total.labels(client=self.name).inc()
+            logger.warning(f"Lost connection to MQTT broker (rc={rc}), reconnecting with backoff")
+
+        if self.on_disconnect:
+            self.on_disconnect(client, userdata, rc)
@@ -7,6 +7,13 @@ import subprocess
 import logging
 from typing import Dict, Any
 import platform
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import get_tracer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,6 +39,13 @@ class NetworkEnforcer:
         Returns:
             bool: Success status
         """
+        with get_tracer().span('network.apply_policy', policy_id=policy.get('policy_id'),
+                               policy_type=policy.get('policy_type'), target=policy.get('target')) as span:
+            success = self._apply_policy(policy)
+            span.set('success', success)
+            return success
+    
+    def _apply_policy(self, policy: Dict[str, Any]) -> bool:
         policy_type = policy.get('policy_type')
         
         if policy_type == 'traffic_shaping':
@@ -94,9 +108,9 @@ class NetworkEnforcer:
         try:
             rate = params.get('rate', '100mbit')
             
-            # Use TBF (Token Bucket Filter) for simple rate limiting
+            # Use TBF (Token Bucket Filter) for simple rate limiting; replace so a new limit updates the old one
             self._run_tc_command([
-                'qdisc', 'add', 'dev', self.interface,
+                'qdisc', 'replace', 'dev', self.interface,
                 'root', 'tbf', 'rate', rate,
                 'burst', '32kbit', 'latency', '400ms'
             ])
@@ -135,20 +149,59 @@ class NetworkEnforcer:
             logger.error(f"Failed to apply routing priority: {e}")
             return False
     
+    def remove_policy(self, policy: Dict[str, Any]) -> bool:
+        """
+        Undo a network policy that nothing replaces (withdrawn or expired)
+        
+        Args:
+            policy: The policy as given to apply_policy
+            
+        Returns:
+            bool: Success status
+        """
+        policy_type = policy.get('policy_type')
+        with get_tracer().span('network.remove_policy', policy_id=policy.get('policy_id'),
+                               policy_type=policy_type, target=policy.get('target')) as span:
+            logger.info(f"Removing {policy_type} for {policy.get('target')}")
+            if not self.is_linux:
+                logger.info("Simulated: Would remove policy")
+                return True
+            
+            try:
+                if policy_type in ('traffic_shaping', 'bandwidth_limit'):
+                    # Both install the root qdisc; deleting it restores the interface default
+                    self._run_tc_command(['qdisc', 'del', 'dev', self.interface, 'root'])
+                elif policy_type == 'routing_priority':
+                    subprocess.run([
+                        'iptables', '-t', 'mangle', '-D', 'POSTROUTING',
+                        '-j', 'TOS', '--set-tos', policy.get('parameters', {}).get('tos', '0x10')
+                    ], check=True)
+                else:
+                    logger.warning(f"Unknown policy type: {policy_type}")
+                    return False
+                span.set('success', True)
+                return True
+            except Exception as e:
+                logger.error(f"Failed to remove {policy_type}: {e}")
+                span.set('success', False)
+                return False
+    
     def _run_tc_command(self, args):
         """Execute tc command"""
         cmd = ['tc'] + args
         logger.debug(f"Executing: {' '.join(cmd)}")
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"tc command failed: {result.stderr}")
-            raise Exception(f"tc failed: {result.stderr}")
+        with get_tracer().span('tc', command=' '.join(cmd)) as span:
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True
+            )
+            span.set('returncode', result.returncode)
+            
+            if result.returncode != 0:
+                logger.error(f"tc command failed: {result.stderr}")
+                raise Exception(f"tc failed: {result.stderr}")
         
         return result.stdout
     
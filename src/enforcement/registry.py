@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Device Registry - Thread-safe store of the latest known state of every device
+Updated from MQTT status messages, queried by the API and enforcers
+"""
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from control_codec import SUPPORTED_ENCODINGS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Share one string object for repeated values such as types and locations"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _parse_encodings(value: Any, current: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Known encodings from a status message's "encodings" list; a malformed value keeps `current`"""
+    if value is None:
+        return current
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        logger.warning(f"Ignoring malformed encodings in device status: {value!r}")
+        return current
+    return tuple(name for name in value if name in SUPPORTED_ENCODINGS)
+
+
+class DeviceRecord:
+    """Immutable snapshot of one device's parsed status"""
+
+    __slots__ = (
+        'node_id', 'device_type', 'location', 'online', 'qos',
+        'sampling_rate', 'priority', 'enabled', 'encodings', 'last_seen', 'reported_at'
+    )
+
+    def __init__(self, node_id: str, device_type: Optional[str] = None,
+                 location: Optional[str] = None, online: bool = False,
+                 qos: Optional[int] = None, sampling_rate: Optional[float] = None,
+                 priority: Optional[str] = None, enabled: Optional[bool] = None,
+                 encodings: Tuple[str, ...] = (), last_seen: float = 0.0,
+                 reported_at: Any = None):
+        object.__setattr__(self, 'node_id', node_id)
+        object.__setattr__(self, 'device_type', _intern(device_type))
+        object.__setattr__(self, 'location', _intern(location))
+        object.__setattr__(self, 'online', online)
+        object.__setattr__(self, 'qos', qos)
+        object.__setattr__(self, 'sampling_rate', sampling_rate)
+        object.__setattr__(self, 'priority', _intern(priority))
+        object.__setattr__(self, 'enabled', enabled)
+        object.__setattr__(self, 'encodings', tuple(_intern(e) for e in encodings))
+        object.__setattr__(self, 'last_seen', last_seen)
+        object.__setattr__(self, 'reported_at', reported_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DeviceRecord is immutable, use replace()")
+
+    def replace(self, **changes) -> 'DeviceRecord':
+        """Return a copy with the given fields changed"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return DeviceRecord(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'node_id': self.node_id,
+            'type': self.device_type,
+            'location': self.location,
+            'status': 'online' if self.online else 'offline',
+            'config': {
+                'qos': self.qos,
+                'sampling_rate': self.sampling_rate,
+                'priority': self.priority,
+                'enabled': self.enabled
+            },
+            'encodings': list(self.encodings),
+            'last_seen': self.last_seen,
+            'timestamp': self.reported_at
+        }
+
+
+class DeviceRegistry:
+    """
+    Indexed registry of device records
+
+    Writers replace whole records under a lock; readers get immutable records
+    and copy-on-write snapshots, so no caller ever sees a dict being mutated
+    by the MQTT network thread.
+    """
+
+    def __init__(self, stale_after: Optional[float] = None, max_devices: int = 100000):
+        """
+        Args:
+            stale_after: Seconds without a status update before a device is evicted
+            max_devices: Upper bound on tracked devices (least recently seen evicted)
+        """
+        self.stale_after = stale_after
+        self.max_devices = max_devices
+
+        # Ordered by last update so eviction only touches the oldest entries
+        self._records: "OrderedDict[str, DeviceRecord]" = OrderedDict()
+        self._by_type: Dict[str, Set[str]] = {}
+        self._by_location: Dict[str, Set[str]] = {}
+        self._online: Set[str] = set()
+        # Configured type/location, reapplied if an evicted device reports again
+        self._known: Dict[str, tuple] = {}
+
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Mapping[str, DeviceRecord]] = None
+
+    def register(self, node_id: str, device_type: Optional[str] = None,
+                 location: Optional[str] = None):
+        """Add a known device (e.g. from config/devices.yaml) before it reports"""
+        with self._lock:
+            self._known[node_id] = (_intern(device_type), _intern(location))
+            record = self._records.get(node_id)
+            if record is None:
+                # Start the staleness clock now so unseen devices get a grace period
+                record = DeviceRecord(node_id, device_type=device_type, location=location,
+                                      last_seen=time.time())
+                self._store(record, touch=True)
+            else:
+                record = record.replace(device_type=device_type or record.device_type,
+                                        location=location or record.location)
+                self._store(record, touch=False)
+
+    def register_from_config(self, devices_config: Dict[str, Any]):
+        """Seed the registry from the parsed devices.yaml structure"""
+        for node_id, spec in (devices_config or {}).get('devices', {}).items():
+            spec = spec or {}
+            self.register(node_id, spec.get('type'), spec.get('location'))
+
+    def update_from_status(self, payload: Any, topic_node_id: Optional[str] = None,
+                           now: Optional[float] = None) -> Optional[DeviceRecord]:
+        """
+        Parse a status message and update the device's record
+
+        Accepts the simulator format ({'node_id', 'config', 'status'}), the
+        ESP32 heartbeat ({'device_id', 'status'}) and bare status strings.
+
+        Returns:
+            The new record, or None if the message names no device
+        """
+        if not isinstance(payload, dict):
+            payload = {'status': str(payload)}
+
+        node_id = payload.get('node_id') or payload.get('device_id') or topic_node_id
+        if not node_id:
+            return None
+
+        config = payload.get('config') or {}
+        now = now if now is not None else time.time()
+
+        with self._lock:
+            record = self._records.get(node_id)
+            if record is None:
+                device_type, location = self._known.get(node_id, (None, None))
+                record = DeviceRecord(node_id, device_type=device_type, location=location)
+            record = record.replace(
+                device_type=payload.get('type', record.device_type),
+                location=payload.get('location', record.location),
+                online=payload.get('status', 'online') == 'online',
+                qos=config.get('qos', record.qos),
+                sampling_rate=config.get('sampling_rate', record.sampling_rate),
+                priority=config.get('priority', record.priority),
+                enabled=config.get('enabled', record.enabled),
+                encodings=_parse_encodings(payload.get('encodings'), record.encodings),
+                last_seen=now,
+                reported_at=payload.get('timestamp')
+            )
+            self._store(record, touch=True)
+            self._evict_overflow()
+
+        return record
+
+    def get(self, node_id: str) -> Optional[DeviceRecord]:
+        """Get the current record for a device"""
+        return self._records.get(node_id)
+
+    def snapshot(self) -> Mapping[str, DeviceRecord]:
+        """
+        Read-only view of all records
+
+        The copy is taken at most once per change, so repeated readers between
+        status updates share the same snapshot.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = MappingProxyType(dict(self._records))
+                snapshot = self._snapshot
+        return snapshot
+
+    def by_type(self, device_type: str) -> List[DeviceRecord]:
+        """Records of all devices of a given type"""
+        return self._lookup(self._by_type, device_type)
+
+    def by_location(self, location: str) -> List[DeviceRecord]:
+        """Records of all devices at a given location"""
+        return self._lookup(self._by_location, location)
+
+    def online(self) -> List[DeviceRecord]:
+        """Records of all devices currently reporting online"""
+        with self._lock:
+            return [self._records[node_id] for node_id in self._online]
+
+    def count(self, online: Optional[bool] = None) -> int:
+        """Number of tracked devices, optionally filtered by online state"""
+        if online is None:
+            return len(self._records)
+        return len(self._online) if online else len(self._records) - len(self._online)
+
+    def evict_stale(self, max_age: Optional[float] = None, now: Optional[float] = None) -> List[str]:
+        """
+        Drop devices that have not reported within `max_age` seconds
+
+        Returns:
+            IDs of evicted devices
+        """
+        max_age = max_age if max_age is not None else self.stale_after
+        if max_age is None:
+            return []
+
+        cutoff = (now if now is not None else time.time()) - max_age
+        evicted = []
+        with self._lock:
+            # Records are kept in update order, so stop at the first fresh one
+            while self._records:
+                node_id, record = next(iter(self._records.items()))
+                if record.last_seen >= cutoff:
+                    break
+                self._remove(node_id)
+                evicted.append(node_id)
+
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} stale devices")
+        return evicted
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, node_id):
+        return node_id in self._records
+
+    def _lookup(self, index: Dict[str, Set[str]], key: str) -> List[DeviceRecord]:
+        with self._lock:
+            return [self._records[node_id] for node_id in index.get(key, ())]
+
+    def _store(self, record: DeviceRecord, touch: bool):
+        """Insert or replace a record and maintain indexes (caller holds the lock)"""
+        previous = self._records.get(record.node_id)
+        if previous is not None:
+            self._unindex(previous)
+
+        self._records[record.node_id] = record
+        if touch:
+            self._records.move_to_end(record.node_id)
+
+        if record.device_type:
+            self._by_type.setdefault(record.device_type, set()).add(record.node_id)
+        if record.location:
+            self._by_location.setdefault(record.location, set()).add(record.node_id)
+        if record.online:
+            self._online.add(record.node_id)
+
+        self._snapshot = None
+
+    def _remove(self, node_id: str):
+        record = self._records.pop(node_id, None)
+        if record is not None:
+            self._unindex(record)
+            self._snapshot = None
+
+    def _unindex(self, record: DeviceRecord):
+        if record.device_type in self._by_type:
+            members = self._by_type[record.device_type]
+            members.discard(record.node_id)
+            if not members:
+                del self._by_type[record.device_type]
+        if record.location in self._by_location:
+            members = self._by_location[record.location]
+            members.discard(record.node_id)
+            if not members:
+                del self._by_location[record.location]
+        self._online.discard(record.node_id)
+
+    def _evict_overflow(self):
+        while len(self._records) > self.max_devices:
+            node_id = next(iter(self._records))
+            self._remove(node_id)
+            logger.warning(f"Device registry full, evicted least recently seen device {node_id}")
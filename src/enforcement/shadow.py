@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Device Shadow - Desired vs. acknowledged configuration per device
+Merges device settings from all active policies and publishes only real changes
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from prometheus_client import Counter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+shadow_commands_published_total = Counter(
+    'imperium_shadow_commands_published_total',
+    'Control messages published after shadow reconciliation'
+)
+shadow_commands_suppressed_total = Counter(
+    'imperium_shadow_commands_suppressed_total',
+    'Control messages not published because the device already has that state'
+)
+shadow_commands_coalesced_total = Counter(
+    'imperium_shadow_commands_coalesced_total',
+    'Control messages superseded by a newer update within the debounce window'
+)
+
+# Fields that describe the message rather than the device setting
+_ENVELOPE_FIELDS = ('command', 'type')
+
+# Restored when the last policy setting withdraws and the device's own value is unknown
+# (ESP32 firmware config.h and the simulator's default_config)
+SETTING_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'SET_QOS': {'command': 'SET_QOS', 'qos': 1},
+    'SET_SAMPLE_RATE': {'command': 'SET_SAMPLE_RATE', 'sample_rate': 16000},
+    'SET_PUBLISH_INTERVAL': {'command': 'SET_PUBLISH_INTERVAL', 'interval_ms': 10000},
+    'SET_AUDIO_GAIN': {'command': 'SET_AUDIO_GAIN', 'gain': 1.0},
+    'power': {'command': 'ENABLE'},
+    'qos_update': {'type': 'qos_update', 'qos': 0, 'reliable_delivery': False},
+    'config_update': {'type': 'config_update', 'sampling_rate': 5, 'enabled': True, 'priority': 'normal'},
+}
+
+
+def setting_key(message: Dict[str, Any]) -> str:
+    """Device setting a control message changes (ENABLE/DISABLE share one)"""
+    name = message.get('command') or message.get('type') or 'unknown'
+    return 'power' if name in ('ENABLE', 'DISABLE') else name
+
+
+class DeviceShadow:
+    """Desired, in-flight and acknowledged settings of one device"""
+
+    __slots__ = ('node_id', 'contributions', 'baseline', 'inflight', 'attempts', 'acked', 'unconfirmed',
+                 'traces', 'reported_fields', 'seq')
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        # setting -> {policy_id: (priority, seq, message)}
+        self.contributions: Dict[str, Dict[str, Tuple[int, int, Dict]]] = {}
+        # setting -> the device's value before the first policy set it, desired once no policy does
+        self.baseline: Dict[str, Dict] = {}
+        # setting -> (message, sent_at)
+        self.inflight: Dict[str, Tuple[Dict, float]] = {}
+        # setting -> times the in-flight message was sent without confirmation
+        self.attempts: Dict[str, int] = {}
+        # setting -> message confirmed by the device
+        self.acked: Dict[str, Dict] = {}
+        # setting -> message never confirmed within max_attempts; not resent until it changes
+        self.unconfirmed: Dict[str, Dict] = {}
+        # setting -> trace context of the latest update, sent with the next publish
+        self.traces: Dict[str, str] = {}
+        # Config fields the device has ever reported; only these can confirm a message
+        self.reported_fields: set = set()
+        self.seq = 0
+
+    def desired(self) -> Dict[str, Dict]:
+        """Effective message per setting: highest priority, then most recent, else the baseline"""
+        desired = dict(self.baseline)
+        desired.update({
+            key: max(entries.values(), key=lambda e: (e[0], e[1]))[2]
+            for key, entries in self.contributions.items() if entries
+        })
+        return desired
+
+
+class DeviceShadowManager:
+    """
+    Reconciles device shadows against what devices have acknowledged
+
+    Updates within the debounce window are coalesced, and a control message is
+    published only when the merged desired state differs from both the last
+    acknowledged and the in-flight state. A message is acknowledged by the
+    next status that reports the message's values for every field the device
+    reports at all; fields it never reports (the simulator's reliable_delivery,
+    any field of a config-less ESP32 heartbeat) cannot be checked and do not
+    hold it back. Until then it is resent after ack_timeout, at most
+    max_attempts times.
+    """
+
+    def __init__(self, publish: Callable[[str, Dict], bool], debounce: float = 0.0,
+                 ack_timeout: float = 30.0, max_attempts: int = 3):
+        """
+        Args:
+            publish: Sends one control message to a device, returns success
+            debounce: Seconds to collect updates per device before publishing (0 = immediately)
+            ack_timeout: Seconds after which an unacknowledged message may be resent
+            max_attempts: Sends of one message without confirmation before giving up on it
+        """
+        self.publish = publish
+        self.debounce = debounce
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+
+        self._shadows: Dict[str, DeviceShadow] = {}
+        self._policy_targets: Dict[str, set] = {}
+        # target -> flush deadline; one debounce for all, so insertion order is deadline order
+        self._pending: "OrderedDict[str, float]" = OrderedDict()
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._running = True
+
+    def update(self, target: str, message: Dict[str, Any], policy_id: Optional[str] = None,
+               priority: int = 5, traceparent: Optional[str] = None,
+               current: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Record a policy's desired setting for a device
+
+        Args:
+            target: Device ID
+            message: Control message describing the desired setting
+            policy_id: Policy contributing the setting (anonymous updates replace each other)
+            priority: Policy priority used to merge contributions
+            traceparent: Trace context of the update, carried by the resulting control message
+            current: The device's last reported config, kept as the setting's baseline the
+                first time a policy sets it (SETTING_DEFAULTS if it lacks the setting's fields)
+
+        Returns:
+            bool: False only if an immediate publish failed
+        """
+        key = setting_key(message)
+        with self._lock:
+            shadow = self._shadows.setdefault(target, DeviceShadow(target))
+            shadow.seq += 1
+            source = policy_id or '_direct'
+            if key not in shadow.baseline:
+                self._record_baseline(shadow, key, message, current)
+            entries = shadow.contributions.setdefault(key, {})
+            entries[source] = (int(priority or 0), shadow.seq, dict(message))
+            if traceparent:
+                shadow.traces[key] = traceparent
+            if policy_id:
+                self._policy_targets.setdefault(policy_id, set()).add(target)
+
+            if self.debounce <= 0:
+                return self._reconcile(shadow)
+
+            if target in self._pending:
+                shadow_commands_coalesced_total.inc()
+            else:
+                self._pending[target] = time.monotonic() + self.debounce
+                self._ensure_worker()
+                self._wakeup.notify()
+            return True
+
+    def withdraw(self, policy_id: str):
+        """
+        Remove a policy's contributions (e.g. superseded or expired)
+
+        A setting no policy contributes to any more returns to its baseline.
+        """
+        with self._lock:
+            for target in self._policy_targets.pop(policy_id, ()):
+                shadow = self._shadows.get(target)
+                if not shadow:
+                    continue
+                for entries in shadow.contributions.values():
+                    entries.pop(policy_id, None)
+                self._schedule(target)
+
+    def acknowledge(self, target: str, reported: Dict[str, Any]):
+        """
+        Reconcile with a status message from the device
+
+        In-flight messages whose fields the reported config confirms become
+        acknowledged; fields the device has never reported are not checked.
+        Acknowledged settings the device now contradicts (e.g. after a reboot)
+        are forgotten so they get re-sent, and messages unconfirmed past
+        ack_timeout are retried.
+        """
+        reported = reported or {}
+        with self._lock:
+            shadow = self._shadows.get(target)
+            if not shadow:
+                return
+
+            shadow.reported_fields.update(reported)
+            for key, (message, _) in list(shadow.inflight.items()):
+                if self._confirms(message, reported, shadow.reported_fields):
+                    shadow.acked[key] = message
+                    del shadow.inflight[key]
+                    shadow.attempts.pop(key, None)
+            for key, message in list(shadow.unconfirmed.items()):
+                if self._confirms(message, reported, shadow.reported_fields):
+                    shadow.acked[key] = shadow.unconfirmed.pop(key)
+
+            drifted = [key for key, message in shadow.acked.items()
+                       if key not in shadow.inflight and self._contradicts(message, reported)]
+            for key in drifted:
+                del shadow.acked[key]
+            if drifted:
+                logger.info(f"{target} drifted from acknowledged {drifted}, re-converging")
+
+            now = time.monotonic()
+            overdue = any(now - sent_at >= self.ack_timeout for _, sent_at in shadow.inflight.values())
+            if drifted or overdue:
+                self._schedule(target)
+
+    def forget_acknowledged(self, target: str):
+        """Drop acknowledged state, e.g. after a device reset to defaults"""
+        with self._lock:
+            shadow = self._shadows.get(target)
+            if shadow:
+                shadow.acked.clear()
+                shadow.inflight.clear()
+                shadow.attempts.clear()
+                shadow.unconfirmed.clear()
+
+    def flush(self, target: Optional[str] = None) -> bool:
+        """Publish pending changes now, for one device or all of them"""
+        with self._lock:
+            targets = [target] if target else list(self._pending)
+            ok = True
+            for name in targets:
+                self._pending.pop(name, None)
+                shadow = self._shadows.get(name)
+                if shadow:
+                    ok = self._reconcile(shadow) and ok
+            return ok
+
+    def get_shadow(self, target: str) -> Dict[str, Any]:
+        """Desired, in-flight and acknowledged state of a device"""
+        with self._lock:
+            shadow = self._shadows.get(target)
+            if not shadow:
+                return {}
+            return {
+                'desired': shadow.desired(),
+                'inflight': {k: m for k, (m, _) in shadow.inflight.items()},
+                'acknowledged': dict(shadow.acked),
+                'unconfirmed': dict(shadow.unconfirmed)
+            }
+
+    def close(self):
+        """Publish anything still pending and stop the debounce worker"""
+        self.flush()
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+
+    @classmethod
+    def _record_baseline(cls, shadow: DeviceShadow, key: str, message: Dict[str, Any],
+                         current: Optional[Dict[str, Any]]):
+        fields = cls._fields(message)
+        if current and fields and all(field in current for field, _ in fields):
+            baseline = {field: value for field, value in message.items() if field in _ENVELOPE_FIELDS}
+            baseline.update((field, current[field]) for field, _ in fields)
+        else:
+            baseline = SETTING_DEFAULTS.get(key)
+        if baseline:
+            shadow.baseline[key] = dict(baseline)
+
+    @staticmethod
+    def _fields(message: Dict[str, Any]):
+        return [(field, value) for field, value in message.items()
+                if field not in _ENVELOPE_FIELDS and value is not None]
+
+    @classmethod
+    def _confirms(cls, message: Dict[str, Any], reported: Dict[str, Any], reportable: set) -> bool:
+        """True if the device reports every field of the message it ever reports, with its value"""
+        return all(field in reported and reported[field] == value
+                   for field, value in cls._fields(message) if field in reportable)
+
+    @classmethod
+    def _contradicts(cls, message: Dict[str, Any], reported: Dict[str, Any]) -> bool:
+        """True if the device reports a different value for a field of the message"""
+        return any(field in reported and reported[field] != value for field, value in cls._fields(message))
+
+    def _schedule(self, target: str):
+        if self.debounce <= 0:
+            shadow = self._shadows.get(target)
+            if shadow:
+                self._reconcile(shadow)
+        elif target not in self._pending:
+            self._pending[target] = time.monotonic() + self.debounce
+            self._ensure_worker()
+            self._wakeup.notify()
+
+    def _reconcile(self, shadow: DeviceShadow) -> bool:
+        """Publish settings whose desired value is neither acknowledged nor in flight"""
+        now = time.monotonic()
+        ok = True
+        for key, message in shadow.desired().items():
+            # Kept out of the shadow's state, which compares messages for equality
+            traceparent = shadow.traces.pop(key, None)
+            if shadow.acked.get(key) == message or shadow.unconfirmed.get(key) == message:
+                shadow_commands_suppressed_total.inc()
+                continue
+            inflight = shadow.inflight.get(key)
+            attempts = 0
+            if inflight and inflight[0] == message:
+                if now - inflight[1] < self.ack_timeout:
+                    shadow_commands_suppressed_total.inc()
+                    continue
+                attempts = shadow.attempts.get(key, 0)
+                if attempts >= self.max_attempts:
+                    logger.warning(f"{shadow.node_id} did not confirm {key} after {attempts} attempts, "
+                                   f"not resending until it changes")
+                    shadow.unconfirmed[key] = message
+                    del shadow.inflight[key]
+                    shadow.attempts.pop(key, None)
+                    continue
+
+            if self.publish(shadow.node_id, dict(message, traceparent=traceparent) if traceparent else message):
+                shadow.inflight[key] = (message, now)
+                shadow.attempts[key] = attempts + 1
+                shadow.unconfirmed.pop(key, None)
+                shadow_commands_published_total.inc()
+            else:
+                ok = False
+        return ok
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='shadow-debounce', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        with self._lock:
+            while self._running:
+                if not self._pending:
+                    self._wakeup.wait()
+                    continue
+
+                target, deadline = next(iter(self._pending.items()))
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+
+                del self._pending[target]
+                shadow = self._shadows.get(target)
+                if shadow:
+                    try:
+                        self._reconcile(shadow)
+                    except Exception as e:
+                        logger.error(f"Error publishing shadow state for {target}: {e}")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Event Bus - In-process stream of state changes for server-sent events
+Intent, policy, device and feedback changes are numbered and kept in a bounded
+replay buffer so clients can resume from the last event ID they saw
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """One published state change"""
+
+    __slots__ = ('id', 'type', 'data', 'timestamp')
+
+    def __init__(self, event_id: int, event_type: str, data: Dict[str, Any], timestamp: float):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+        self.timestamp = timestamp
+
+    def to_sse(self) -> str:
+        """Server-sent events wire format"""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+class EventBus:
+    """
+    Thread-safe publish/subscribe with replay
+
+    Event IDs are increasing integers. Subscribers never hold a queue of their
+    own: they ask for everything after the last ID they saw, so a slow client
+    costs nothing until it reads. A client further behind than the replay
+    buffer gets a 'reset' event and should refetch full state, and so does a
+    client ahead of the newest ID: IDs restart at 1 with the process, so its
+    Last-Event-ID came from before a restart.
+    """
+
+    def __init__(self, buffer_size: int = 1000):
+        self._events: Deque[Event] = deque(maxlen=max(1, buffer_size))
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[], Any]] = []
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> int:
+        """
+        Publish an event
+
+        Returns:
+            The event's ID
+        """
+        with self._cond:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, event_type, data, time.time()))
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+        return self._last_id
+
+    def since(self, last_id: Optional[int]) -> Tuple[List[Event], bool]:
+        """
+        Events after `last_id`
+
+        Returns:
+            (events, reset) - reset is True when events after last_id have
+            already left the replay buffer, or last_id was never issued by this
+            process (events is then the whole buffer)
+        """
+        with self._cond:
+            return self._since(last_id)
+
+    def wait(self, last_id: Optional[int], timeout: float) -> Tuple[List[Event], bool]:
+        """Like since(), but block up to `timeout` seconds for new events"""
+        with self._cond:
+            if last_id is not None and last_id == self._last_id:
+                self._cond.wait(timeout)
+            return self._since(last_id)
+
+    def _since(self, last_id: Optional[int]) -> Tuple[List[Event], bool]:
+        if last_id is None or last_id == self._last_id:
+            return [], False
+        if last_id > self._last_id or not self._events or last_id < self._events[0].id - 1:
+            return list(self._events), True
+        # IDs are contiguous within the buffer
+        start = last_id - self._events[0].id + 1
+        return [self._events[i] for i in range(max(start, 0), len(self._events))], False
+
+    def add_listener(self, callback: Callable[[], Any]):
+        """Call `callback` (from the publishing thread) after every publish"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], Any]):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def stream(self, last_id: Optional[int] = None, keepalive: float = 15.0,
+               stop: Callable[[], bool] = None):
+        """
+        Yield server-sent event chunks, forever (or until `stop()` is true)
+
+        Args:
+            last_id: Resume after this event ID (None: only new events)
+            keepalive: Seconds between comment lines that keep proxies from closing the stream
+        """
+        yield "retry: 3000\n\n"
+        if last_id is None:
+            last_id = self._last_id
+
+        while not (stop and stop()):
+            chunk, last_id = self.next_chunk(last_id, self.wait(last_id, keepalive))
+            yield chunk
+
+    def next_chunk(self, last_id: Optional[int], result: Tuple[List[Event], bool]) -> Tuple[str, int]:
+        """SSE text for a since()/wait() result, and the ID the client is now at"""
+        events, reset = result
+        if reset:
+            # Missed events are gone: the client refetches full state and carries on from here
+            last_id = events[-1].id if events else self._last_id
+            return Event(last_id, 'reset', {'last_event_id': last_id}, time.time()).to_sse(), last_id
+        if events:
+            return ''.join(event.to_sse() for event in events), events[-1].id
+        return ": keepalive\n\n", last_id
+
+
+class StreamLimit:
+    """
+    Cap on concurrently open event streams
+
+    A stream holds its connection (and, on a threaded WSGI server, a request
+    thread) for as long as the client stays, so servers refuse new streams
+    beyond `limit` instead of running out of workers. 0 means no cap.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(0, int(limit))
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a slot; False when `limit` streams are already open"""
+        with self._lock:
+            if self.limit and self.open >= self.limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+
+def parse_last_event_id(header: Optional[str], query: Optional[str]) -> Optional[int]:
+    """Resume point from the Last-Event-ID header (reconnects) or ?last_event_id= (first connect)"""
+    for value in (header, query):
+        if value:
+            try:
+                return max(int(value), 0)
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Violation Detection - Decides when a goal is really violated
+Sustained-breach counting, EWMA smoothing, hysteresis and slope-based breach prediction,
+evaluated as NumPy arrays over every (intent, target, metric) goal at once
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Goal name -> (metric, direction); direction +1 means higher values are worse
+GOALS = {
+    'max_latency': ('latency', 1.0),
+    'min_throughput': ('throughput', -1.0),
+    'max_bandwidth': ('bandwidth', 1.0),
+}
+
+OK = 'ok'
+PENDING = 'pending'        # over the threshold, not yet for long enough
+VIOLATION = 'violation'    # sustained breach, held until the value clears the hysteresis band
+PREDICTED = 'predicted'    # within the goal but trending to breach within the horizon
+
+
+class GoalCheck:
+    """One goal of one intent on one target, as fed to the detector"""
+
+    __slots__ = ('intent_id', 'target', 'goal', 'metric', 'direction', 'threshold', 'value', 'slope')
+
+    def __init__(self, intent_id: str, target: Optional[str], goal: str, threshold: float,
+                 value: float, slope: float = 0.0):
+        self.intent_id = intent_id
+        self.target = target
+        self.goal = goal
+        self.metric, self.direction = GOALS[goal]
+        self.threshold = float(threshold)
+        self.value = float(value)
+        self.slope = float(slope or 0.0)
+
+    @property
+    def key(self) -> Tuple[str, Optional[str], str]:
+        return (self.intent_id, self.target, self.goal)
+
+
+class ViolationDetector:
+    """
+    Stateful violation detection across evaluation cycles
+
+    Goals are judged on the EWMA-smoothed value, so with ewma_alpha < 1 a single
+    noisy spike barely moves it. A goal becomes a violation once the smoothed
+    value has been over its threshold for `min_breach_samples` consecutive
+    samples and at least `min_breach_seconds`, and stays one until it is back
+    inside the goal by at least the hysteresis band, so a value hovering at the
+    threshold does not flap. Goals still met but trending towards the threshold
+    fast enough to cross it within `trend_horizon` seconds are reported as
+    predicted breaches.
+    """
+
+    def __init__(self, min_breach_samples: int = 1, hysteresis: float = 0.1,
+                 ewma_alpha: float = 1.0, trend_horizon: float = 0.0,
+                 min_breach_seconds: float = 0.0):
+        """
+        Args:
+            min_breach_samples: Consecutive samples over the threshold before a violation
+            hysteresis: Fraction of the threshold a violated value must recover by to clear
+            ewma_alpha: Weight of the newest sample in the smoothed value (1 disables smoothing)
+            trend_horizon: Seconds ahead to extrapolate the trend (0 disables prediction)
+            min_breach_seconds: Seconds the breach must have lasted before a violation
+        """
+        self.min_breach_samples = max(1, int(min_breach_samples))
+        self.min_breach_seconds = max(0.0, float(min_breach_seconds))
+        self.hysteresis = max(0.0, float(hysteresis))
+        self.ewma_alpha = min(1.0, float(ewma_alpha))
+        self.trend_horizon = max(0.0, float(trend_horizon))
+
+        # key -> [ewma, breach_count, violated, breach_since]
+        self._state: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, checks: Sequence[GoalCheck], now: float = None) -> List[Dict[str, Any]]:
+        """
+        Classify a batch of goal checks and advance their state
+
+        Returns:
+            One result per check, in order, with 'state' set to ok, pending,
+            violation or predicted
+        """
+        if not checks:
+            return []
+        now = time.time() if now is None else now
+
+        with self._lock:
+            states = [self._state.get(c.key) for c in checks]
+            known = np.array([s is not None for s in states])
+            prev_ewma = np.array([s[0] if s else 0.0 for s in states])
+            prev_count = np.array([s[1] if s else 0 for s in states], dtype=np.int64)
+            prev_violated = np.array([s[2] if s else False for s in states])
+            prev_since = np.array([s[3] if s and s[1] else now for s in states], dtype=np.float64)
+
+            sign = np.array([c.direction for c in checks])
+            threshold = np.array([c.threshold for c in checks])
+            value = np.array([c.value for c in checks])
+            slope = np.array([c.slope for c in checks])
+
+            ewma = np.where(known, self.ewma_alpha * value + (1 - self.ewma_alpha) * prev_ewma, value)
+
+            # Work in "higher is worse" space so max_ and min_ goals share one code path
+            x = sign * ewma
+            limit = sign * threshold
+            band = self.hysteresis * np.abs(threshold)
+
+            over = x > limit
+            count = np.where(over, prev_count + 1, 0)
+            since = np.where(over, prev_since, now)
+            sustained = (count >= self.min_breach_samples) & (now - since >= self.min_breach_seconds)
+            cleared = x <= limit - band
+            violated = np.where(prev_violated, ~cleared, sustained)
+
+            # Extrapolate the trend from the smoothed value; only movement towards the threshold counts
+            projected = x + sign * slope * self.trend_horizon
+            predicted = (self.trend_horizon > 0) & ~over & (sign * slope > 0) & (projected > limit)
+
+            results = []
+            for i, check in enumerate(checks):
+                self._state[check.key] = [float(ewma[i]), int(count[i]), bool(violated[i]),
+                                          float(since[i]) if over[i] else None]
+
+                if violated[i]:
+                    status = VIOLATION
+                elif over[i]:
+                    status = PENDING
+                elif predicted[i]:
+                    status = PREDICTED
+                else:
+                    status = OK
+
+                result = {
+                    'metric': check.metric,
+                    'expected': check.threshold,
+                    'actual': check.value,
+                    'target': check.target,
+                    'state': status,
+                    'ewma': float(ewma[i]),
+                    'breach_samples': int(count[i]),
+                    'breach_seconds': float(now - since[i])
+                }
+                if predicted[i]:
+                    result['predicted'] = float(sign[i] * projected[i])
+                    result['seconds_to_breach'] = float((limit[i] - x[i]) / (sign[i] * slope[i]))
+                results.append(result)
+            return results
+
+    def forget(self, intent_id: str):
+        """Drop detection state of an intent (e.g. removed or expired)"""
+        with self._lock:
+            for key in [k for k in self._state if k[0] == intent_id]:
+                del self._state[key]
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Metrics History - Bounded time series of feedback metrics
+Fixed-capacity NumPy ring buffers per (metric, target) with vectorized statistics
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Target key used for fleet-wide metrics
+FLEET = '*'
+
+
+class RingBuffer:
+    """Fixed-capacity columnar buffer of (timestamp, value) samples"""
+
+    __slots__ = ('capacity', 'timestamps', 'values', '_head', '_size', '_last')
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.values = np.zeros(self.capacity, dtype=np.float64)
+        self._head = 0   # next write position
+        self._size = 0
+        self._last: Optional[Tuple[float, float]] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, value: float):
+        """Add a sample, overwriting the oldest once full
+
+        A sample with the same timestamp as the newest one replaces it, so a
+        value observed by several intents in one cycle is stored once.
+        """
+        if self._last is not None and timestamp == self._last[0]:
+            self.values[(self._head - 1) % self.capacity] = value
+        else:
+            self.timestamps[self._head] = timestamp
+            self.values[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+        self._last = (timestamp, value)
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        """Newest (timestamp, value), O(1)"""
+        return self._last
+
+    def window(self, seconds: float = None, now: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Samples in chronological order, optionally only the last `seconds`"""
+        if self._size < self.capacity:
+            ts, vs = self.timestamps[:self._size], self.values[:self._size]
+        else:
+            ts = np.concatenate((self.timestamps[self._head:], self.timestamps[:self._head]))
+            vs = np.concatenate((self.values[self._head:], self.values[:self._head]))
+
+        if seconds is not None and len(ts):
+            cutoff = (time.time() if now is None else now) - seconds
+            start = int(np.searchsorted(ts, cutoff, side='left'))
+            ts, vs = ts[start:], vs[start:]
+        return ts, vs
+
+    def tail(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Newest `count` samples in chronological order, O(count)"""
+        count = min(max(0, int(count)), self._size)
+        index = np.arange(self._head - count, self._head) % self.capacity
+        return self.timestamps[index], self.values[index]
+
+    def mean(self, seconds: float = None, now: float = None) -> Optional[float]:
+        """Rolling mean"""
+        _, vs = self.window(seconds, now)
+        return float(vs.mean()) if len(vs) else None
+
+    def percentile(self, q: float, seconds: float = None, now: float = None) -> Optional[float]:
+        """Rolling percentile (q in 0..100)"""
+        _, vs = self.window(seconds, now)
+        return float(np.percentile(vs, q)) if len(vs) else None
+
+    def ewma(self, alpha: float = 0.3, seconds: float = None, now: float = None) -> Optional[float]:
+        """Exponentially weighted mean, newest sample weighted by alpha"""
+        _, vs = self.window(seconds, now)
+        if not len(vs):
+            return None
+        weights = (1.0 - alpha) ** np.arange(len(vs) - 1, -1, -1, dtype=np.float64)
+        return float(np.dot(weights, vs) / weights.sum())
+
+    def slope(self, seconds: float = None, now: float = None) -> Optional[float]:
+        """Least-squares trend in value units per second"""
+        ts, vs = self.window(seconds, now)
+        if len(vs) < 2:
+            return None
+        dt = ts - ts.mean()
+        denom = float(np.dot(dt, dt))
+        if denom == 0.0:
+            return 0.0
+        return float(np.dot(dt, vs - vs.mean()) / denom)
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.values.nbytes
+
+
+class MetricsHistory:
+    """
+    Ring buffers keyed by (metric, target)
+
+    Memory is bounded by capacity x max_series: each buffer is preallocated,
+    and the least recently updated series is dropped once max_series is reached.
+    """
+
+    def __init__(self, capacity: int = 1000, max_series: int = 10000):
+        """
+        Args:
+            capacity: Samples kept per series
+            max_series: Maximum number of (metric, target) series
+        """
+        self.capacity = capacity
+        self.max_series = max_series
+        self._series: "OrderedDict[Tuple[str, Hashable], RingBuffer]" = OrderedDict()
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, metric: str, target: Optional[str], value: float, timestamp: float = None):
+        """Add one sample (target None = fleet-wide)"""
+        key = (metric, target or FLEET)
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            buffer = self._series.get(key)
+            if buffer is None:
+                if len(self._series) >= self.max_series:
+                    _, evicted = self._series.popitem(last=False)
+                    self._samples -= len(evicted)
+                buffer = self._series[key] = RingBuffer(self.capacity)
+            else:
+                self._series.move_to_end(key)
+            before = len(buffer)
+            buffer.append(timestamp, float(value))
+            self._samples += len(buffer) - before
+
+    def series(self, metric: str, target: Optional[str] = None) -> Optional[RingBuffer]:
+        """Buffer of one series, if any samples were recorded"""
+        return self._series.get((metric, target or FLEET))
+
+    def latest(self, metric: str, target: Optional[str] = None) -> Optional[float]:
+        """Newest value of a series, O(1)"""
+        buffer = self.series(metric, target)
+        last = buffer.latest() if buffer else None
+        return last[1] if last else None
+
+    def stats(self, metric: str, target: Optional[str] = None, seconds: float = None,
+              alpha: float = 0.3) -> Dict[str, Optional[float]]:
+        """Rolling mean, p95, EWMA and slope of one series"""
+        buffer = self.series(metric, target)
+        if not buffer:
+            return {'samples': 0, 'mean': None, 'p95': None, 'ewma': None, 'slope': None}
+        now = buffer.latest()[0]
+        return {
+            'samples': len(buffer.window(seconds, now)[1]),
+            'mean': buffer.mean(seconds, now),
+            'p95': buffer.percentile(95, seconds, now),
+            'ewma': buffer.ewma(alpha, seconds, now),
+            'slope': buffer.slope(seconds, now)
+        }
+
+    def slopes(self, keys: Sequence[Tuple[str, Optional[str]]], samples: int = 10) -> np.ndarray:
+        """
+        Least-squares trend of many series at once
+
+        The last `samples` points of each (metric, target) series are stacked
+        into one NaN-padded matrix and fitted row-wise. Series with fewer than
+        three points get a slope of 0.
+
+        Returns:
+            Array of slopes in value units per second, one per key
+        """
+        ts = np.full((len(keys), samples), np.nan)
+        vs = np.full((len(keys), samples), np.nan)
+        for row, (metric, target) in enumerate(keys):
+            buffer = self.series(metric, target)
+            if buffer:
+                t, v = buffer.tail(samples)
+                n = len(v)
+                if n:
+                    ts[row, -n:] = t[-n:]
+                    vs[row, -n:] = v[-n:]
+
+        mask = ~np.isnan(vs)
+        count = mask.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = np.nansum(ts, axis=1) / count
+            v_mean = np.nansum(vs, axis=1) / count
+            dt = np.where(mask, ts - t_mean[:, None], 0.0)
+            dv = np.where(mask, vs - v_mean[:, None], 0.0)
+            denom = (dt * dt).sum(axis=1)
+            slope = (dt * dv).sum(axis=1) / denom
+        return np.where((count >= 3) & (denom > 0), slope, 0.0)
+
+    def series_count(self) -> int:
+        return len(self._series)
+
+    def __len__(self) -> int:
+        """Samples currently retained, O(1)"""
+        return self._samples
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the sample arrays"""
+        return sum(buffer.nbytes for buffer in self._series.values())
@@ -3,12 +3,22 @@
 Feedback Loop - Monitors network performance and adjusts policies
 Queries Prometheus for metrics and triggers policy adjustments
 """
-import requests
 import logging
+import threading
 import time
-from typing import Dict, Any, List
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional
 from datetime import datetime
 
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feedback.detection import GOALS, OK, PREDICTED, VIOLATION, GoalCheck, ViolationDetector
+from feedback.history import MetricsHistory
+from feedback.sources import METRIC_QUERIES, MetricsSource, PrometheusSource
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -16,21 +26,54 @@ logger = logging.getLogger(__name__)
 class FeedbackEngine:
     """Monitors performance and provides feedback for policy adjustment"""
     
-    def __init__(self, prometheus_url='http://localhost:9090'):
+    def __init__(self, prometheus_url='http://localhost:9090', max_workers: int = 8,
+                 history_size: int = 1000, detector: ViolationDetector = None,
+                 trend_samples: int = 10, source: MetricsSource = None):
+        """
+        Args:
+            prometheus_url: Prometheus base URL (used when no source is given)
+            max_workers: Concurrent queries per evaluation cycle
+            history_size: Samples kept per (metric, target)
+            detector: Violation detector (default: flag the first breaching sample)
+            trend_samples: Most recent samples used to fit metric trends
+            source: Where metrics come from (default: Prometheus at prometheus_url)
+        """
         self.prometheus_url = prometheus_url
         self.intent_goals = {}
-        self.metrics_history = []
+        # Last `history_size` samples per (metric, target)
+        self.metrics_history = MetricsHistory(capacity=history_size)
+        self.detector = detector or ViolationDetector()
+        self.trend_samples = trend_samples
+        
+        # Prometheus keeps one pooled keep-alive session for all queries
+        self.source = source or PrometheusSource(prometheus_url, pool_size=max_workers)
+        # Samples are stamped on the source's clock, so replayed and synthetic runs stay consistent
+        self.clock = getattr(self.source, 'clock', time.time)
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # State of the evaluation cycle in progress on this thread, so several
+        # cycles (e.g. scheduler workers) can run at once:
+        #   cache: query -> result, index: metric -> {node_id: value}, time: sample time
+        self._cycle = threading.local()
     
-    def register_intent(self, intent_id: str, goals: Dict[str, Any]):
+    def register_intent(self, intent_id: str, goals: Dict[str, Any], targets=None, priority: int = 5):
         """
         Register intent goals for monitoring
         
         Args:
             intent_id: Intent identifier
             goals: Dictionary of performance goals (latency, throughput, etc.)
+            targets: Device ID or list of device IDs the goals apply to
+                (default: judged against fleet-wide metrics)
+            priority: Intent priority (1-10), higher is checked more often
         """
+        if isinstance(targets, str):
+            targets = [targets]
         self.intent_goals[intent_id] = {
             'goals': goals,
+            'targets': list(dict.fromkeys(t for t in (targets or []) if t)),
+            'priority': priority,
             'registered_at': datetime.now().isoformat(),
             'satisfied': False
         }
@@ -40,76 +83,72 @@ class FeedbackEngine:
         """
         Query Prometheus for metrics
         
+        Within an evaluation cycle each distinct query is answered once.
+        
         Args:
             query: PromQL query string
             
         Returns:
             Query result
         """
-        try:
-            url = f"{self.prometheus_url}/api/v1/query"
-            params = {'query': query}
-            
-            response = requests.get(url, params=params, timeout=5)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            if data['status'] == 'success':
-                return data['data']
-            else:
-                logger.error(f"Prometheus query failed: {data}")
-                return {}
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to query Prometheus: {e}")
-            return {}
-        except Exception as e:
-            logger.error(f"Error querying Prometheus: {e}")
-            return {}
+        cache = getattr(self._cycle, 'cache', None)
+        if cache is not None and query in cache:
+            return cache[query]
+        
+        return self._fetch(query)
+    
+    def _fetch(self, query: str) -> Dict:
+        """Run one PromQL query against the metrics source"""
+        return self.source.query(query)
+    
+    @staticmethod
+    def build_query(metric: str, node_id: str = None, by_node: bool = False) -> str:
+        """PromQL for a metric, for one node, per node, or fleet-wide"""
+        single, per_node, fleet = METRIC_QUERIES[metric]
+        if by_node:
+            return per_node
+        return single.format(node_id=node_id) if node_id else fleet
     
     def get_latency_metrics(self, node_id: str = None) -> float:
         """Get current latency metrics"""
-        if node_id:
-            query = f'iot_latency_ms{{node_id="{node_id}"}}'
-        else:
-            query = 'avg(iot_latency_ms)'
-        
-        result = self.query_prometheus(query)
-        
-        if result and result.get('result'):
-            return float(result['result'][0]['value'][1])
-        
-        return 0.0
+        return self._metric_value('latency', node_id)
     
     def get_throughput_metrics(self, node_id: str = None) -> float:
         """Get current throughput metrics"""
-        if node_id:
-            query = f'rate(iot_messages_sent_total{{node_id="{node_id}"}}[1m])'
-        else:
-            query = 'sum(rate(iot_messages_sent_total[1m]))'
-        
-        result = self.query_prometheus(query)
-        
-        if result and result.get('result'):
-            return float(result['result'][0]['value'][1])
-        
-        return 0.0
+        return self._metric_value('throughput', node_id)
     
     def get_bandwidth_usage(self, node_id: str = None) -> float:
         """Get current bandwidth usage"""
-        if node_id:
-            query = f'iot_bandwidth_bytes{{node_id="{node_id}"}}'
-        else:
-            query = 'sum(iot_bandwidth_bytes)'
+        return self._metric_value('bandwidth', node_id)
+    
+    def _metric_value(self, metric: str, node_id: str = None) -> float:
+        """
+        Current value of a metric for one node or the fleet
+        
+        During an evaluation cycle per-node values come from the cycle's
+        vector query (a dictionary lookup); otherwise one aggregated query is run.
+        """
+        index = getattr(self._cycle, 'index', None)
+        if node_id and index is not None and metric in index:
+            return index[metric].get(node_id, 0.0)
         
-        result = self.query_prometheus(query)
+        result = self.query_prometheus(self.build_query(metric, node_id))
         
         if result and result.get('result'):
             return float(result['result'][0]['value'][1])
         
         return 0.0
     
+    @staticmethod
+    def _index_by_node(result: Dict) -> Dict[str, float]:
+        """Map a vector query result to {node_id: value}"""
+        index = {}
+        for series in (result or {}).get('result', []):
+            node_id = series.get('metric', {}).get('node_id')
+            if node_id is not None:
+                index[node_id] = float(series['value'][1])
+        return index
+    
     def check_intent_satisfaction(self, intent_id: str) -> Dict[str, Any]:
         """
         Check if intent goals are being met
@@ -124,87 +163,176 @@ class FeedbackEngine:
             logger.warning(f"Intent {intent_id} not registered")
             return {'satisfied': False, 'error': 'Intent not registered'}
         
-        intent = self.intent_goals[intent_id]
-        goals = intent['goals']
+        return self._evaluate([intent_id])[intent_id]
+    
+    def _evaluate(self, intent_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Measure intents and run their goals through the detector in one batch
         
-        # Collect current metrics
-        current_metrics = {
-            'latency': self.get_latency_metrics(),
-            'throughput': self.get_throughput_metrics(),
-            'bandwidth': self.get_bandwidth_usage(),
-            'timestamp': datetime.now().isoformat()
-        }
+        A goal is only a violation once the detector confirms it (sustained
+        breach, held by hysteresis); pending and predicted breaches are
+        reported as warnings.
+        """
+        sampled_at = getattr(self._cycle, 'time', None) or self.clock()
+        measured = {}
+        checks = []
         
-        # Check each goal
-        satisfaction = {
-            'intent_id': intent_id,
-            'satisfied': True,
-            'metrics': current_metrics,
-            'goals': goals,
-            'violations': []
+        # Collect current metrics per target device
+        for intent_id in intent_ids:
+            intent = self.intent_goals[intent_id]
+            target_metrics = {}
+            for target in intent.get('targets') or [None]:
+                metrics = {
+                    'latency': self.get_latency_metrics(target),
+                    'throughput': self.get_throughput_metrics(target),
+                    'bandwidth': self.get_bandwidth_usage(target)
+                }
+                target_metrics[target] = metrics
+                
+                # Store in history (one sample per metric and target per cycle)
+                for metric, value in metrics.items():
+                    self.metrics_history.record(metric, target, value, sampled_at)
+                
+                for goal, threshold in intent['goals'].items():
+                    if goal in GOALS and threshold is not None:
+                        checks.append(GoalCheck(intent_id, target, goal, threshold,
+                                                metrics[GOALS[goal][0]]))
+            measured[intent_id] = target_metrics
+        
+        # Trends of every (metric, target) involved, fitted in one pass
+        if self.detector.trend_horizon > 0 and checks:
+            series = list(dict.fromkeys((c.metric, c.target) for c in checks))
+            slopes = dict(zip(series, self.metrics_history.slopes(series, self.trend_samples)))
+            for check in checks:
+                check.slope = slopes[(check.metric, check.target)]
+        
+        results = {
+            intent_id: {
+                'intent_id': intent_id,
+                'satisfied': True,
+                'metrics': self._worst_metrics(target_metrics),
+                'goals': self.intent_goals[intent_id]['goals'],
+                'violations': [],
+                'warnings': []
+            }
+            for intent_id, target_metrics in measured.items()
         }
+        for intent_id, target_metrics in measured.items():
+            if self.intent_goals[intent_id].get('targets'):
+                results[intent_id]['targets'] = target_metrics
         
-        # Check latency goal
-        if 'max_latency' in goals:
-            if current_metrics['latency'] > goals['max_latency']:
-                satisfaction['satisfied'] = False
-                satisfaction['violations'].append({
-                    'metric': 'latency',
-                    'expected': goals['max_latency'],
-                    'actual': current_metrics['latency']
-                })
+        for check, detection in zip(checks, self.detector.evaluate(checks, now=sampled_at)):
+            if detection['state'] == VIOLATION:
+                results[check.intent_id]['violations'].append(detection)
+            elif detection['state'] != OK:
+                results[check.intent_id]['warnings'].append(detection)
         
-        # Check throughput goal
-        if 'min_throughput' in goals:
-            if current_metrics['throughput'] < goals['min_throughput']:
-                satisfaction['satisfied'] = False
-                satisfaction['violations'].append({
-                    'metric': 'throughput',
-                    'expected': goals['min_throughput'],
-                    'actual': current_metrics['throughput']
-                })
+        for intent_id, satisfaction in results.items():
+            satisfaction['satisfied'] = not satisfaction['violations']
+            
+            # Update intent status
+            self.intent_goals[intent_id]['satisfied'] = satisfaction['satisfied']
+            
+            logger.info(f"Intent {intent_id} satisfaction: {satisfaction['satisfied']}")
+            if satisfaction['violations']:
+                logger.warning(f"Violations detected: {satisfaction['violations']}")
         
-        # Check bandwidth goal
-        if 'max_bandwidth' in goals:
-            if current_metrics['bandwidth'] > goals['max_bandwidth']:
-                satisfaction['satisfied'] = False
-                satisfaction['violations'].append({
-                    'metric': 'bandwidth',
-                    'expected': goals['max_bandwidth'],
-                    'actual': current_metrics['bandwidth']
-                })
+        return results
+    
+    @staticmethod
+    def _worst_metrics(target_metrics: Dict[Any, Dict[str, float]]) -> Dict[str, Any]:
+        """Worst value per metric across the targets"""
+        return {
+            'latency': max(m['latency'] for m in target_metrics.values()),
+            'throughput': min(m['throughput'] for m in target_metrics.values()),
+            'bandwidth': max(m['bandwidth'] for m in target_metrics.values()),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def evaluate_intents(self, intent_ids: Iterable[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Check many intents in one evaluation cycle
         
-        # Store in history
-        self.metrics_history.append(current_metrics)
+        The PromQL needed by all intents is collected, deduplicated and run
+        concurrently, so each distinct expression hits Prometheus once per cycle.
+        Intents with target devices share one vector query per metric, grouped
+        by node_id and indexed by label, however many devices they name.
         
-        # Update intent status
-        self.intent_goals[intent_id]['satisfied'] = satisfaction['satisfied']
+        Args:
+            intent_ids: Intents to evaluate (default: all registered)
+            
+        Returns:
+            Dictionary of intent ID to satisfaction result
+        """
+        intent_ids = [i for i in (intent_ids if intent_ids is not None else list(self.intent_goals))
+                      if i in self.intent_goals]
         
-        logger.info(f"Intent {intent_id} satisfaction: {satisfaction['satisfied']}")
-        if satisfaction['violations']:
-            logger.warning(f"Violations detected: {satisfaction['violations']}")
+        queries = list(dict.fromkeys(
+            query for intent_id in intent_ids for query in self._queries_for(intent_id)
+        ))
+        cycle = self._cycle
+        cycle.time = self.clock()
+        cycle.cache = self._fetch_all(queries)
+        cycle.index = {
+            metric: self._index_by_node(cycle.cache[query])
+            for metric in METRIC_QUERIES
+            for query in [self.build_query(metric, by_node=True)]
+            if query in cycle.cache
+        }
+        try:
+            return self._evaluate(intent_ids)
+        finally:
+            cycle.cache = cycle.index = cycle.time = None
+    
+    def _queries_for(self, intent_id: str) -> List[str]:
+        """PromQL needed to evaluate one intent"""
+        by_node = bool(self.intent_goals[intent_id].get('targets'))
+        return [self.build_query(metric, by_node=by_node) for metric in METRIC_QUERIES]
+    
+    def _fetch_all(self, queries: List[str]) -> Dict[str, Dict]:
+        """Run independent queries, concurrently when the source is remote"""
+        if len(queries) <= 1 or not self.source.concurrent:
+            return {query: self._fetch(query) for query in queries}
         
-        return satisfaction
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='prometheus-query')
+        return dict(zip(queries, self._executor.map(self._fetch, queries)))
     
-    def recommend_adjustments(self, intent_id: str) -> List[Dict[str, Any]]:
+    def close(self):
+        """Release pooled connections and query workers"""
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.source.close()
+    
+    def recommend_adjustments(self, intent_id: str,
+                              satisfaction: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """
         Recommend policy adjustments based on current metrics
         
         Args:
             intent_id: Intent identifier
+            satisfaction: Result of check_intent_satisfaction for this cycle, if
+                already computed (avoids querying the metrics twice)
             
         Returns:
             List of recommended policy adjustments
         """
-        satisfaction = self.check_intent_satisfaction(intent_id)
+        if satisfaction is None:
+            satisfaction = self.check_intent_satisfaction(intent_id)
         
-        if satisfaction['satisfied']:
+        # Confirmed violations, plus breaches the trend says are coming
+        actionable = satisfaction['violations'] + [
+            w for w in satisfaction.get('warnings', []) if w.get('state') == PREDICTED
+        ]
+        if not actionable:
             logger.info(f"Intent {intent_id} is satisfied, no adjustments needed")
             return []
         
         recommendations = []
         
-        for violation in satisfaction['violations']:
+        for violation in actionable:
             metric = violation['metric']
             
             if metric == 'latency':
@@ -238,22 +366,29 @@ class FeedbackEngine:
                     }
                 })
         
+        # Device each recommendation applies to (None for fleet-wide intents)
+        for recommendation, violation in zip(recommendations, actionable):
+            recommendation['target'] = violation.get('target')
+            recommendation['predicted'] = violation.get('state') == PREDICTED
+        
         logger.info(f"Generated {len(recommendations)} adjustment recommendations")
         return recommendations
     
     def get_metrics_summary(self) -> Dict[str, Any]:
-        """Get summary of current metrics across all intents"""
+        """Get summary of current metrics across all intents (from recorded history)"""
         return {
             'intents': len(self.intent_goals),
             'satisfied': sum(1 for i in self.intent_goals.values() if i['satisfied']),
             'current_metrics': {
-                'latency': self.get_latency_metrics(),
-                'throughput': self.get_throughput_metrics(),
-                'bandwidth': self.get_bandwidth_usage()
+                metric: self.metrics_history.latest(metric) for metric in METRIC_QUERIES
             },
-            'history_size': len(self.metrics_history)
+            'history_size': len(self.metrics_history),
+            'history_series': self.metrics_history.series_count()
         }
-
+    
+    def get_metric_trend(self, metric: str, target: str = None, seconds: float = None) -> Dict[str, Any]:
+        """Rolling mean, p95, EWMA and slope of a metric for a target (default: fleet)"""
+        return self.metrics_history.stats(metric, target, seconds)
 
 if __name__ == '__main__':
     # Test feedback engine
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Remediation Executor - Closes the feedback loop
+Turns feedback recommendations into enforced policies, with per-target rate limits,
+cooldowns, bounded step sizes and rollback when the metric gets worse
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from prometheus_client import Counter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+remediation_actions_total = Counter(
+    'imperium_remediation_actions_total',
+    'Feedback recommendations handled by the remediation executor',
+    ['action', 'outcome']
+)
+remediation_rollbacks_total = Counter(
+    'imperium_remediation_rollbacks_total',
+    'Remediations rolled back because the metric got worse',
+    ['action']
+)
+
+# Recommendation action -> metric it is meant to improve
+ACTION_METRICS = {
+    'increase_priority': 'latency',
+    'increase_bandwidth': 'throughput',
+    'throttle_bandwidth': 'bandwidth',
+}
+
+# +1 when higher values of the metric are worse
+_METRIC_DIRECTION = {'latency': 1.0, 'throughput': -1.0, 'bandwidth': 1.0}
+
+_RATE_UNITS = {'kbps': 0.001, 'mbps': 1.0, 'gbps': 1000.0}
+
+# MQTT QoS levels a priority remediation moves between
+_QOS_RANGE = (0, 2)
+
+
+def _parse_rate(rate: str) -> Optional[float]:
+    """'15mbps' -> 15.0 (Mbit/s)"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*(kbps|mbps|gbps)?\s*$', str(rate).lower())
+    if not match:
+        return None
+    return float(match.group(1)) * _RATE_UNITS[match.group(2) or 'mbps']
+
+
+class Remediation:
+    """One applied remediation awaiting verification"""
+
+    __slots__ = ('intent_id', 'target', 'action', 'metric', 'baseline', 'parsed',
+                 'previous', 'policy_ids', 'applied_at', 'verify_at')
+
+    def __init__(self, intent_id: str, target: str, action: str, baseline: float,
+                 parsed: Dict[str, Any], previous: Optional['Remediation'],
+                 policy_ids: List[str], applied_at: float, verify_at: float):
+        self.intent_id = intent_id
+        self.target = target
+        self.action = action
+        self.metric = ACTION_METRICS[action]
+        self.baseline = baseline
+        self.parsed = parsed
+        self.previous = previous
+        self.policy_ids = policy_ids
+        self.applied_at = applied_at
+        self.verify_at = verify_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'intent_id': self.intent_id,
+            'target': self.target,
+            'action': self.action,
+            'metric': self.metric,
+            'baseline': self.baseline,
+            'policies': list(self.policy_ids),
+            'applied_at': self.applied_at,
+            'verify_at': self.verify_at
+        }
+
+
+class RemediationExecutor:
+    """
+    Applies feedback recommendations as policies
+
+    Every applied remediation is verified after `verify_window` seconds: if
+    the metric it targeted is worse than when it was applied (beyond
+    `rollback_tolerance`), the previous remediation for that target is
+    re-enforced, or the remediation's device settings are withdrawn.
+    """
+
+    def __init__(self, generate: Callable[[Dict[str, Any]], List], enforce: Callable[[List, Dict], Any],
+                 withdraw: Optional[Callable[[str], Any]] = None, cooldown: float = 300.0,
+                 max_actions: int = 4, rate_window: float = 3600.0, max_step: float = 0.5,
+                 verify_window: float = 120.0, rollback_tolerance: float = 0.1,
+                 default_rate: float = 10.0, default_qos: int = 0,
+                 current_rate: Optional[Callable[[str], Optional[float]]] = None):
+        """
+        Args:
+            generate: Builds policies from a parsed intent (PolicyEngine.generate_policies)
+            enforce: Enforces policies for a parsed intent (IntentManager.enforce_policies)
+            withdraw: Takes a policy out of effect by policy ID, used when a remediation is
+                replaced by the next step or rolled back
+            cooldown: Seconds before the same action may be repeated on a target
+            max_actions: Remediations allowed per target within rate_window
+            rate_window: Seconds over which max_actions is counted
+            max_step: Largest relative change per remediation (0.5 = +/-50% of the bandwidth,
+                or of the QoS range, i.e. one level)
+            verify_window: Seconds after which a remediation's effect is checked
+            rollback_tolerance: Relative worsening of the metric that triggers a rollback
+            default_rate: Bandwidth (Mbit/s) a throttle is bounded from on a target
+                without a limit
+            default_qos: QoS level the first priority step is bounded from
+            current_rate: Bandwidth limit (Mbit/s) in effect on a target, None if it has
+                none (PolicyEngine.effective_rate); without it, the last rate a
+                remediation applied is taken as the limit
+        """
+        self.generate = generate
+        self.enforce = enforce
+        self.withdraw = withdraw
+        self.cooldown = cooldown
+        self.max_actions = max_actions
+        self.rate_window = rate_window
+        self.max_step = max_step
+        self.verify_window = verify_window
+        self.rollback_tolerance = rollback_tolerance
+        self.default_rate = default_rate
+        self.default_qos = default_qos
+        self.current_rate = current_rate
+
+        self._history: Dict[str, Deque[float]] = {}
+        self._last_action: Dict[Tuple[str, str], float] = {}
+        # (target, action) -> latest remediation still in effect
+        self._active: Dict[Tuple[str, str], Remediation] = {}
+        self._pending: List[Remediation] = []
+        # target -> last bandwidth applied (Mbit/s) and last QoS level applied
+        self._rates: Dict[str, float] = {}
+        self._qos: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, intent_id: str, recommendations: List[Dict[str, Any]],
+                satisfaction: Dict[str, Any] = None, now: float = None) -> List[Dict[str, Any]]:
+        """
+        Apply recommendations for an intent, subject to the safety limits
+
+        Args:
+            intent_id: Intent the recommendations were made for
+            recommendations: Output of FeedbackEngine.recommend_adjustments
+            satisfaction: Cycle result the recommendations came from (baseline metrics)
+            now: Current time (for tests)
+
+        Returns:
+            One outcome per recommendation: status 'applied' or 'skipped' with a reason
+        """
+        now = time.time() if now is None else now
+        outcomes = []
+        with self._lock:
+            for rec in recommendations:
+                outcome = self._execute_one(intent_id, rec, satisfaction or {}, now)
+                remediation_actions_total.labels(action=rec.get('action', 'unknown'),
+                                                 outcome=outcome['status']).inc()
+                outcomes.append(outcome)
+        return outcomes
+
+    def _execute_one(self, intent_id: str, rec: Dict[str, Any], satisfaction: Dict[str, Any],
+                     now: float) -> Dict[str, Any]:
+        action, target = rec.get('action'), rec.get('target')
+        outcome = {'action': action, 'target': target, 'status': 'skipped'}
+
+        if action not in ACTION_METRICS:
+            outcome['reason'] = 'unknown action'
+            return outcome
+        if not target:
+            outcome['reason'] = 'fleet-wide intent, no target device'
+            return outcome
+
+        last = self._last_action.get((target, action))
+        if last is not None and now - last < self.cooldown:
+            outcome['reason'] = f"cooldown ({self.cooldown - (now - last):.0f}s left)"
+            return outcome
+
+        history = self._history.setdefault(target, deque())
+        while history and now - history[0] >= self.rate_window:
+            history.popleft()
+        if len(history) >= self.max_actions:
+            outcome['reason'] = f"rate limit ({self.max_actions} per {self.rate_window:.0f}s)"
+            return outcome
+
+        parsed = self._to_intent(action, target, rec.get('parameters', {}))
+        if parsed is None:
+            outcome['reason'] = 'no applicable parameters'
+            return outcome
+
+        policies = self._apply(parsed)
+        if policies is None:
+            outcome['reason'] = 'enforcement failed'
+            return outcome
+
+        self._track(target, parsed)
+
+        # Keep one level of rollback so superseded remediations are not retained forever
+        previous = self._active.get((target, action))
+        if previous:
+            previous.previous = None
+            # The new step replaces the previous one rather than competing with it
+            self._withdraw(previous.policy_ids)
+
+        metric = ACTION_METRICS[action]
+        remediation = Remediation(
+            intent_id=intent_id,
+            target=target,
+            action=action,
+            baseline=self._metric_value(satisfaction, target, metric),
+            parsed=parsed,
+            previous=previous,
+            policy_ids=[p.policy_id for p in policies],
+            applied_at=now,
+            verify_at=now + self.verify_window
+        )
+        self._active[(target, action)] = remediation
+        self._pending.append(remediation)
+        self._last_action[(target, action)] = now
+        history.append(now)
+
+        logger.info(f"Remediation {action} applied to {target} for {intent_id}: {parsed['parameters']}")
+        outcome.update(status='applied', policies=remediation.policy_ids,
+                       parameters=parsed['parameters'])
+        return outcome
+
+    def _to_intent(self, action: str, target: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Parsed-intent equivalent of a recommendation, with the step size bounded
+        
+        Bandwidth steps are bounded from the limit in effect on the target: an
+        increase never lowers it and is skipped on a target without a limit,
+        and a throttle never raises it (default_rate stands in for no limit).
+        QoS steps are bounded from the level the last remediation applied, or
+        default_qos before there is one.
+        """
+        if action == 'increase_priority':
+            parameters = {'target_device': target}
+            if params.get('qos') is not None:
+                current = self._qos.get(target, self.default_qos)
+                levels = max(1, round(self.max_step * (_QOS_RANGE[1] - _QOS_RANGE[0])))
+                qos = min(max(int(params['qos']), current - levels, _QOS_RANGE[0]), current + levels, _QOS_RANGE[1])
+                parameters['qos_level'] = (qos,)
+            return {'type': 'priority', 'original': f"auto-remediation: {action}",
+                    'parameters': parameters}
+
+        rate = _parse_rate(params.get('bandwidth', ''))
+        if rate is None or rate <= 0:
+            return None
+
+        current = self.current_rate(target) if self.current_rate else self._rates.get(target)
+        if action == 'increase_bandwidth':
+            if current is None:
+                # Nothing to raise; a new limit would only cap the device
+                return None
+            rate = max(1, round(min(rate, current * (1 + self.max_step))))
+            if rate <= current:
+                return None
+        else:
+            base = self.default_rate if current is None else current
+            rate = max(1, round(min(max(rate, base * (1 - self.max_step)), base)))
+            if current is not None and rate >= current:
+                return None
+
+        return {'type': 'bandwidth', 'original': f"auto-remediation: {action}",
+                'parameters': {'target_device': target,
+                               'bandwidth_limit': (f"{rate}", 'mbps')}}
+
+    def _apply(self, parsed: Dict[str, Any]) -> Optional[List]:
+        """Generate and enforce the policies of a parsed intent"""
+        try:
+            policies = list(self.generate(parsed))
+            if parsed['type'] == 'priority' and 'qos_level' in parsed['parameters']:
+                policies += self.generate(dict(parsed, type='qos'))
+            self.enforce(policies, parsed)
+            return policies
+        except Exception as e:
+            logger.error(f"Remediation enforcement failed: {e}")
+            return None
+
+    def verify(self, results: Dict[str, Dict[str, Any]], now: float = None) -> List[Dict[str, Any]]:
+        """
+        Check remediations whose verification window has passed
+
+        Args:
+            results: Latest FeedbackEngine.evaluate_intents output
+
+        Returns:
+            The remediations that were rolled back
+        """
+        now = time.time() if now is None else now
+        rolled_back = []
+        with self._lock:
+            still_pending = []
+            for remediation in self._pending:
+                satisfaction = results.get(remediation.intent_id)
+                if now < remediation.verify_at or satisfaction is None:
+                    # Not due yet, or the intent was not evaluated in this cycle
+                    if now < remediation.verify_at + self.verify_window:
+                        still_pending.append(remediation)
+                    continue
+
+                current = self._metric_value(satisfaction, remediation.target, remediation.metric)
+                if self._worse(remediation.metric, remediation.baseline, current):
+                    self._rollback(remediation, current)
+                    rolled_back.append(dict(remediation.to_dict(), current=current))
+            self._pending = still_pending
+        return rolled_back
+
+    def _worse(self, metric: str, baseline: Optional[float], current: Optional[float]) -> bool:
+        if baseline is None or current is None:
+            return False
+        change = _METRIC_DIRECTION[metric] * (current - baseline)
+        return change > self.rollback_tolerance * max(abs(baseline), 1e-9)
+
+    def _rollback(self, remediation: Remediation, current: float):
+        logger.warning(f"Rolling back {remediation.action} on {remediation.target}: "
+                       f"{remediation.metric} went from {remediation.baseline} to {current}")
+        remediation_rollbacks_total.labels(action=remediation.action).inc()
+
+        key = (remediation.target, remediation.action)
+        previous = remediation.previous
+        if self._active.get(key) is remediation:
+            if previous:
+                self._active[key] = previous
+            else:
+                del self._active[key]
+
+        self._withdraw(remediation.policy_ids)
+
+        if previous:
+            self._track(remediation.target, previous.parsed)
+            policies = self._apply(previous.parsed)
+            if policies is None:
+                logger.error(f"Failed to restore previous {remediation.action} on {remediation.target}")
+            else:
+                # Its original policies were withdrawn when it was replaced
+                previous.policy_ids = [p.policy_id for p in policies]
+        else:
+            (self._qos if remediation.action == 'increase_priority' else self._rates).pop(remediation.target, None)
+
+    def _track(self, target: str, parsed: Dict[str, Any]):
+        """Remember the value a remediation applied, to bound the next step from"""
+        parameters = parsed['parameters']
+        if parsed['type'] == 'bandwidth':
+            self._rates[target] = _parse_rate(''.join(parameters['bandwidth_limit']))
+        elif 'qos_level' in parameters:
+            self._qos[target] = parameters['qos_level'][0]
+
+    def _withdraw(self, policy_ids: List[str]):
+        if not self.withdraw:
+            return
+        for policy_id in policy_ids:
+            try:
+                self.withdraw(policy_id)
+            except Exception as e:
+                logger.error(f"Failed to withdraw {policy_id}: {e}")
+
+    @staticmethod
+    def _metric_value(satisfaction: Dict[str, Any], target: str, metric: str) -> Optional[float]:
+        """Metric of a target in a satisfaction result"""
+        per_target = satisfaction.get('targets', {}).get(target)
+        if per_target and metric in per_target:
+            return per_target[metric]
+        return satisfaction.get('metrics', {}).get(metric)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Remediations in effect and awaiting verification"""
+        with self._lock:
+            return {
+                'active': [r.to_dict() for r in self._active.values()],
+                'pending_verification': len(self._pending)
+            }
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Feedback Scheduler - Event-driven evaluation of intents
+Each intent is checked on its own interval from a deadline heap, on a bounded worker pool,
+and re-checked immediately when its policies are enforced or its devices report
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+from prometheus_client import Counter, Histogram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+feedback_evaluations_total = Counter(
+    'imperium_feedback_evaluations_total',
+    'Intent evaluations run by the feedback scheduler',
+    ['reason']
+)
+feedback_deadline_overruns_total = Counter(
+    'imperium_feedback_deadline_overruns_total',
+    'Intent evaluations that started later than one interval past their deadline'
+)
+feedback_schedule_lag_seconds = Histogram(
+    'imperium_feedback_schedule_lag_seconds',
+    'Delay between an intent evaluation deadline and its start',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60)
+)
+
+
+def interval_for_priority(base_interval: float, priority: int) -> float:
+    """Evaluation interval of an intent: priority 9-10 every base/4 ... priority 1-2 every 2x base"""
+    priority = max(1, min(10, int(priority or 5)))
+    if priority >= 9:
+        return base_interval / 4
+    if priority >= 7:
+        return base_interval / 2
+    if priority >= 3:
+        return base_interval
+    return base_interval * 2
+
+
+class FeedbackScheduler:
+    """
+    Deadline-driven feedback loop
+
+    Intents are kept in a min-heap of next-due times. The dispatcher thread
+    sleeps until the earliest deadline (or a trigger), pops every intent that
+    is due, and evaluates them in batches on a bounded pool. An intent is
+    never evaluated twice at once; triggers while it is running fold into
+    one follow-up evaluation.
+    """
+
+    def __init__(self, engine, on_results: Callable[[Dict[str, Dict[str, Any]]], Any],
+                 base_interval: float = 30.0, max_workers: int = 4, batch_size: int = 500,
+                 min_retrigger: float = 2.0):
+        """
+        Args:
+            engine: FeedbackEngine whose registered intents are scheduled
+            on_results: Called with each batch's evaluate_intents() results
+            base_interval: Interval for normal-priority intents (seconds)
+            max_workers: Batches evaluated concurrently
+            batch_size: Maximum intents per evaluation batch
+            min_retrigger: Minimum seconds between triggered re-checks of an intent
+        """
+        self.engine = engine
+        self.on_results = on_results
+        self.base_interval = base_interval
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.min_retrigger = min_retrigger
+
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._due: Dict[str, float] = {}        # intent -> current deadline (heap entries may be stale)
+        self._reason: Dict[str, str] = {}
+        self._intervals: Dict[str, float] = {}
+        self._last_run: Dict[str, float] = {}
+        self._deadline: Dict[str, float] = {}   # deadline of the evaluation in progress
+        self._running_ids: Set[str] = set()
+        self._rerun: Set[str] = set()
+        self._by_target: Dict[str, Set[str]] = {}
+        self.overruns = 0
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._inflight = threading.BoundedSemaphore(max_workers)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._next_sync = 0.0
+
+    def start(self):
+        """Start dispatching"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='feedback-eval')
+        self._thread = threading.Thread(target=self._dispatch, name='feedback-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop dispatching and wait for running evaluations"""
+        with self._lock:
+            self._running = False
+            self._wakeup.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    def sync(self, now: float = None):
+        """Pick up intents registered or removed in the engine since the last sync"""
+        now = time.monotonic() if now is None else now
+        goals = self.engine.intent_goals
+        with self._lock:
+            for intent_id in list(self._intervals):
+                if intent_id not in goals:
+                    self._remove(intent_id)
+            for intent_id, intent in list(goals.items()):
+                if intent_id not in self._intervals:
+                    self._add(intent_id, intent, now)
+
+    def trigger(self, intent_id: str = None, target: str = None, reason: str = 'trigger'):
+        """
+        Re-check an intent now, or every intent watching a target device
+
+        Triggers within min_retrigger of the intent's last evaluation are
+        deferred to that point rather than dropped.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if intent_id and intent_id not in self._intervals and intent_id in self.engine.intent_goals:
+                self._add(intent_id, self.engine.intent_goals[intent_id], now)
+            ids = [intent_id] if intent_id else list(self._by_target.get(target, ()))
+            for iid in ids:
+                if iid not in self._intervals:
+                    continue
+                if iid in self._running_ids:
+                    self._rerun.add(iid)
+                    continue
+                due = max(now, self._last_run.get(iid, float('-inf')) + self.min_retrigger)
+                if due < self._due.get(iid, float('inf')):
+                    self._push(iid, due, reason)
+            self._wakeup.notify()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Scheduled intents, running evaluations and overruns"""
+        with self._lock:
+            return {
+                'scheduled': len(self._intervals),
+                'running': len(self._running_ids),
+                'overruns': self.overruns,
+                'next_due_in': (min(self._due.values()) - time.monotonic()) if self._due else None
+            }
+
+    def _add(self, intent_id: str, intent: Dict[str, Any], now: float):
+        interval = interval_for_priority(self.base_interval, intent.get('priority', 5))
+        self._intervals[intent_id] = interval
+        for target in intent.get('targets') or ():
+            self._by_target.setdefault(target, set()).add(intent_id)
+        self._push(intent_id, now, 'scheduled')
+
+    def _remove(self, intent_id: str):
+        self._intervals.pop(intent_id, None)
+        self._due.pop(intent_id, None)
+        self._reason.pop(intent_id, None)
+        self._last_run.pop(intent_id, None)
+        self._rerun.discard(intent_id)
+        for watchers in self._by_target.values():
+            watchers.discard(intent_id)
+
+    def _push(self, intent_id: str, due: float, reason: str):
+        self._due[intent_id] = due
+        self._reason[intent_id] = reason
+        heapq.heappush(self._heap, (due, next(self._seq), intent_id))
+
+    def _pop_due(self, now: float) -> List[str]:
+        """Intents whose deadline has passed, skipping stale heap entries"""
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            deadline, _, intent_id = heapq.heappop(self._heap)
+            if self._due.get(intent_id) != deadline:
+                continue
+            del self._due[intent_id]
+            if intent_id in self._running_ids:
+                self._rerun.add(intent_id)
+                continue
+            self._deadline[intent_id] = deadline
+            lag = now - deadline
+            feedback_schedule_lag_seconds.observe(lag)
+            if lag > self._intervals.get(intent_id, self.base_interval):
+                self.overruns += 1
+                feedback_deadline_overruns_total.inc()
+            feedback_evaluations_total.labels(reason=self._reason.pop(intent_id, 'scheduled')).inc()
+            due.append(intent_id)
+        return due
+
+    def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            if now >= self._next_sync:
+                self.sync(now)
+                self._next_sync = now + self.base_interval
+
+            with self._lock:
+                if not self._running:
+                    return
+                batch = self._pop_due(now)
+                if not batch:
+                    timeout = self._next_sync - now
+                    if self._heap:
+                        timeout = min(timeout, self._heap[0][0] - now)
+                    self._wakeup.wait(max(timeout, 0.0))
+                    continue
+                self._running_ids.update(batch)
+
+            # Bounded pool: wait for a free worker rather than queueing unboundedly
+            self._inflight.acquire()
+            self._pool.submit(self._evaluate, batch)
+
+    def _evaluate(self, batch: List[str]):
+        try:
+            results = self.engine.evaluate_intents(batch)
+            self.on_results(results)
+        except Exception as e:
+            logger.error(f"Error evaluating intents: {e}", exc_info=True)
+        finally:
+            self._inflight.release()
+            finished = time.monotonic()
+            with self._lock:
+                for intent_id in batch:
+                    self._running_ids.discard(intent_id)
+                    deadline = self._deadline.pop(intent_id, finished)
+                    if intent_id not in self._intervals:
+                        continue
+                    self._last_run[intent_id] = finished
+                    if intent_id in self._rerun:
+                        self._rerun.discard(intent_id)
+                        self._push(intent_id, finished + self.min_retrigger, 'trigger')
+                    elif intent_id not in self._due:
+                        # Anchored to the deadline, not the finish time, so cadence does not
+                        # drift with evaluation time; missed slots are skipped, not queued
+                        self._push(intent_id, max(deadline + self._intervals[intent_id], finished),
+                                   'scheduled')
+                self._wakeup.notify()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Metrics Sources - Where the feedback engine gets its metrics from
+Prometheus over HTTP, a recorded time-series file replayed in process, or a synthetic generator
+"""
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# PromQL per metric: (single node, one series per node, fleet-wide)
+METRIC_QUERIES = {
+    'latency': ('avg(iot_latency_ms{{node_id="{node_id}"}})',
+                'avg by (node_id) (iot_latency_ms)',
+                'avg(iot_latency_ms)'),
+    'throughput': ('sum(rate(iot_messages_sent_total{{node_id="{node_id}"}}[1m]))',
+                   'sum by (node_id) (rate(iot_messages_sent_total[1m]))',
+                   'sum(rate(iot_messages_sent_total[1m]))'),
+    'bandwidth': ('sum(iot_bandwidth_bytes{{node_id="{node_id}"}})',
+                  'sum by (node_id) (iot_bandwidth_bytes)',
+                  'sum(iot_bandwidth_bytes)'),
+}
+
+# How per-node values combine into one fleet value
+FLEET_AGGREGATION = {'latency': np.mean, 'throughput': np.sum, 'bandwidth': np.sum}
+
+
+# Exact query -> (metric, 'node' | 'fleet')
+_EXACT_QUERIES = {}
+for _metric, (_, _per_node, _fleet) in METRIC_QUERIES.items():
+    _EXACT_QUERIES[_per_node] = (_metric, 'node')
+    _EXACT_QUERIES[_fleet] = (_metric, 'fleet')
+
+# (prefix, suffix, metric) around the node ID of single-node queries
+_SINGLE_NODE_QUERIES = [
+    tuple(single.format(node_id='\0').split('\0')) + (metric,)
+    for metric, (single, _, _) in METRIC_QUERIES.items()
+]
+
+
+def parse_query(query: str) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    Map one of the engine's PromQL expressions back to what it asks for
+
+    Returns:
+        (metric, 'node' | 'fleet' | 'single', node_id) or None if unknown
+    """
+    if query in _EXACT_QUERIES:
+        metric, mode = _EXACT_QUERIES[query]
+        return metric, mode, None
+    for prefix, suffix, metric in _SINGLE_NODE_QUERIES:
+        if query.startswith(prefix) and query.endswith(suffix) and len(query) > len(prefix) + len(suffix):
+            return metric, 'single', query[len(prefix):len(query) - len(suffix)]
+    return None
+
+
+class MetricsSource:
+    """Answers PromQL instant queries with the Prometheus API 'data' payload"""
+
+    # Whether independent queries benefit from running concurrently
+    concurrent = False
+
+    def query(self, query: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PrometheusSource(MetricsSource):
+    """Live Prometheus over HTTP with a pooled keep-alive session"""
+
+    concurrent = True
+
+    def __init__(self, url: str = 'http://localhost:9090', pool_size: int = 8, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def query(self, query: str) -> Dict[str, Any]:
+        try:
+            response = self.session.get(f"{self.url}/api/v1/query", params={'query': query},
+                                        timeout=self.timeout)
+            response.raise_for_status()
+
+            data = response.json()
+
+            if data['status'] == 'success':
+                return data['data']
+            else:
+                logger.error(f"Prometheus query failed: {data}")
+                return {}
+
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to query Prometheus: {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"Error querying Prometheus: {e}")
+            return {}
+
+    def close(self):
+        self.session.close()
+
+
+class InProcessSource(MetricsSource):
+    """Answers the engine's queries from per-node values computed in process"""
+
+    def __init__(self, clock: Callable[[], float] = None):
+        self.clock = clock or time.time
+
+    def values(self, metric: str, at: float) -> Dict[str, float]:
+        """Per-node values of a metric at a point in time"""
+        raise NotImplementedError
+
+    def query(self, query: str) -> Dict[str, Any]:
+        parsed = parse_query(query)
+        if parsed is None:
+            logger.warning(f"Unsupported query for in-process metrics: {query}")
+            return {}
+
+        metric, mode, node_id = parsed
+        now = self.clock()
+        values = self.values(metric, now)
+
+        if mode == 'node':
+            series = [({'node_id': node}, value) for node, value in values.items()]
+        elif mode == 'single':
+            series = [({}, values[node_id])] if node_id in values else []
+        else:
+            series = [({}, float(FLEET_AGGREGATION[metric](list(values.values()))))] if values else []
+
+        return {
+            'resultType': 'vector',
+            'result': [{'metric': labels, 'value': [now, repr(float(value))]} for labels, value in series]
+        }
+
+
+class RecordedSource(InProcessSource):
+    """
+    Replays a recorded time-series file
+
+    The file holds one JSON sample per line:
+        {"ts": 1700000000.0, "metric": "latency", "node_id": "node-1", "value": 42.0}
+
+    Replay time starts at the first recorded timestamp when the source is
+    created and advances with the clock times `speed`; each query returns the
+    latest sample at or before the replay time. With loop=True the recording
+    repeats once it runs out.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True,
+                 clock: Callable[[], float] = None):
+        super().__init__(clock)
+        self.speed = speed
+        self.loop = loop
+
+        samples: Dict[Tuple[str, str], List[Tuple[float, float]]] = {}
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                sample = json.loads(line)
+                key = (sample['metric'], sample['node_id'])
+                samples.setdefault(key, []).append((float(sample['ts']), float(sample['value'])))
+
+        # metric -> [(node_id, timestamps, values)], columns sorted by time
+        self._series: Dict[str, List[Tuple[str, np.ndarray, np.ndarray]]] = {}
+        starts, ends = [], []
+        for (metric, node_id), points in samples.items():
+            points.sort()
+            ts = np.array([p[0] for p in points])
+            vs = np.array([p[1] for p in points])
+            self._series.setdefault(metric, []).append((node_id, ts, vs))
+            starts.append(ts[0])
+            ends.append(ts[-1])
+
+        self.start = min(starts) if starts else 0.0
+        self.duration = (max(ends) - self.start) if ends else 0.0
+        self._origin = self.clock()
+        logger.info(f"Loaded {sum(len(s[1]) for v in self._series.values() for s in v)} recorded samples "
+                    f"({self.duration:.0f}s) from {path}")
+
+    def replay_time(self, now: float) -> float:
+        """Recorded timestamp that corresponds to clock time `now`"""
+        elapsed = (now - self._origin) * self.speed
+        if self.loop and self.duration > 0:
+            elapsed %= self.duration + 1e-9
+        return self.start + elapsed
+
+    def values(self, metric: str, at: float) -> Dict[str, float]:
+        t = self.replay_time(at)
+        values = {}
+        for node_id, ts, vs in self._series.get(metric, ()):
+            i = int(np.searchsorted(ts, t, side='right')) - 1
+            if i >= 0:
+                values[node_id] = float(vs[i])
+        return values
+
+
+class SyntheticSource(InProcessSource):
+    """
+    Generates metrics for a virtual fleet
+
+    Each node's value is its baseline plus Gaussian noise (a fraction of the
+    baseline), plus any step changes whose start time has passed. Steps are
+    (seconds after start, metric, node_id or None for every node, delta).
+    """
+
+    DEFAULT_BASELINES = {'latency': 20.0, 'throughput': 10.0, 'bandwidth': 50000.0}
+
+    def __init__(self, nodes: Iterable[str], baselines: Dict[str, float] = None, noise: float = 0.05,
+                 steps: Iterable[Tuple[float, str, Optional[str], float]] = (), seed: int = 0,
+                 clock: Callable[[], float] = None):
+        super().__init__(clock)
+        self.nodes = list(nodes)
+        self.baselines = dict(self.DEFAULT_BASELINES, **(baselines or {}))
+        self.noise = noise
+        self.steps = sorted(steps, key=lambda s: s[0])
+        self.rng = np.random.default_rng(seed)
+        self._origin = self.clock()
+        self._node_index = {node: i for i, node in enumerate(self.nodes)}
+
+    def values(self, metric: str, at: float) -> Dict[str, float]:
+        base = self.baselines.get(metric, 0.0)
+        values = base + self.rng.normal(0.0, abs(base) * self.noise, len(self.nodes))
+
+        elapsed = at - self._origin
+        for start, step_metric, node_id, delta in self.steps:
+            if start > elapsed:
+                break
+            if step_metric != metric:
+                continue
+            if node_id is None:
+                values += delta
+            elif node_id in self._node_index:
+                values[self._node_index[node_id]] += delta
+
+        return dict(zip(self.nodes, np.maximum(values, 0.0).tolist()))
+
+
+def create_source(kind: str = 'prometheus', prometheus_url: str = 'http://localhost:9090',
+                  pool_size: int = 8, path: str = None, nodes: Iterable[str] = None) -> MetricsSource:
+    """Build a metrics source from configuration ('prometheus', 'recorded' or 'synthetic')"""
+    if kind == 'recorded':
+        if not path:
+            raise ValueError("Recorded metrics source needs a file path")
+        return RecordedSource(path)
+    if kind == 'synthetic':
+        return SyntheticSource(nodes or [f"node-{i}" for i in range(1, 11)])
+    if kind != 'prometheus':
+        raise ValueError(f"Unknown metrics source: {kind}")
+    return PrometheusSource(prometheus_url, pool_size=pool_size)
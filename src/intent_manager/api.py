@@ -3,9 +3,12 @@
 Intent Manager - REST API for Intent Acquisition
 Handles user intent submission and parsing
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, current_app, request, jsonify
 from flask_cors import CORS
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import sys
 import os
@@ -13,42 +16,59 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from controller_metrics import instrument_flask, intent_stage_duration
 from intent_manager.parser import IntentParser
-from policy_engine.engine import PolicyEngine
-from database import DatabaseManager
-from auth import AuthManager, create_default_admin
-from rate_limiter import RateLimiter
-from intent_manager.auth_endpoints import init_auth_endpoints
-
-app = Flask(__name__)
-CORS(app)
+from policy_engine.engine import PolicyEngine, normalize_target, policy_key
+from tracing import get_tracer, parse_traceparent
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize security and database components
-db_manager = DatabaseManager(db_path=os.getenv('DATABASE_PATH', 'data/imperium.db'))
-auth_manager = AuthManager(db_manager=db_manager)
-rate_limiter = RateLimiter()
+# Policy types applied by the network enforcer (tc / iptables)
+NETWORK_POLICY_TYPES = ('traffic_shaping', 'bandwidth_limit', 'routing_priority')
+
 
-# Create default admin user if not exists
-try:
-    create_default_admin(auth_manager)
-except Exception as e:
-    logger.warning(f"Could not create default admin: {e}")
+@contextmanager
+def intent_stage(stage):
+    """Time one stage of handling an intent, as a metric and as a span of its trace"""
+    with get_tracer().span(f"intent.{stage}"), intent_stage_duration.labels(stage).time():
+        yield
 
 
 class IntentManager:
     """Manages intent acquisition and validation"""
     
-    def __init__(self, db_manager=None):
+    def __init__(self, db_manager=None, event_bus=None, policy_engine=None, status_flush_interval=0.5):
         self.intents = []  # In-memory cache for backwards compatibility
         self.parser = IntentParser()
-        self.policy_engine = PolicyEngine()
-        self.db_manager = db_manager or DatabaseManager()
+        self.policy_engine = policy_engine or PolicyEngine()
+        if db_manager is None:
+            from database import DatabaseManager
+            db_manager = DatabaseManager()
+        self.db_manager = db_manager
         # Enforcement modules (set by main.py)
         self.device_enforcer = None
         self.network_enforcer = None
+        self.feedback_engine = None
+        self.feedback_scheduler = None
+        # Intent IDs and the cache are shared by concurrent request threads
+        self._lock = threading.Lock()
+        # State changes streamed to /api/v1/events
+        self.event_bus = event_bus
+        
+        # Policy status changes, written to the database in batches by the lifecycle worker
+        self.status_flush_interval = status_flush_interval
+        self._status_updates = {}
+        self._lifecycle = threading.Condition()
+        self._lifecycle_worker = None
+        self._woken = False
+        self._running = True
+        self.policy_engine.status_listeners.append(self._queue_status)
+    
+    def publish(self, event_type, data):
+        """Publish a state change event, if an event bus is attached"""
+        if self.event_bus:
+            self.event_bus.publish(event_type, data)
     
     def submit_intent(self, intent_data):
         """
@@ -60,66 +80,114 @@ class IntentManager:
         Returns:
             dict: Intent ID, status, and generated policies
         """
-        intent_id = f"intent-{len(self.intents) + 1}-{int(datetime.now().timestamp())}"
+        intent, parsed, policies = self.prepare_intent(intent_data)
+        if intent['status'] == 'invalid':
+            return intent
+        
+        # Persist to database
+        try:
+            self.persist_intent(intent)
+        except Exception as e:
+            logger.warning(f"Failed to persist intent to database: {e}")
         
+        self.activate_intent(intent, parsed, policies)
+        return intent
+    
+    def prepare_intent(self, intent_data):
+        """
+        Parse and validate an intent and generate its policies (no side effects
+        beyond the in-memory cache)
+        
+        Returns:
+            (intent, parsed, policies); intent['status'] is 'invalid' on failure
+        """
         # Parse the intent
         description = intent_data.get('description', '')
-        parsed = self.parser.parse(description)
-        
-        # Validate parsed intent
-        is_valid, msg = self.parser.validate(parsed)
+        with intent_stage('parse'):
+            parsed = self.parser.parse(description)
+            
+            # Validate parsed intent
+            is_valid, msg = self.parser.validate(parsed)
         
-        if not is_valid:
-            return {
+        with self._lock:
+            intent_id = f"intent-{len(self.intents) + 1}-{int(datetime.now().timestamp())}"
+            
+            if not is_valid:
+                self.publish('intent', {'id': intent_id, 'status': 'invalid', 'error': msg})
+                return {
+                    'id': intent_id,
+                    'status': 'invalid',
+                    'error': msg
+                }, parsed, []
+            
+            ttl = intent_data.get('ttl')
+            if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0):
+                msg = "ttl must be a positive number of seconds"
+                self.publish('intent', {'id': intent_id, 'status': 'invalid', 'error': msg})
+                return {
+                    'id': intent_id,
+                    'status': 'invalid',
+                    'error': msg
+                }, parsed, []
+            
+            # Generate policies
+            with intent_stage('policy_generation'):
+                policies = self.policy_engine.generate_policies(parsed, ttl=ttl)
+            
+            intent = {
                 'id': intent_id,
-                'status': 'invalid',
-                'error': msg
+                'timestamp': datetime.now().isoformat(),
+                'description': description,
+                'type': intent_data.get('type', parsed.get('type', 'general')),
+                'parameters': intent_data.get('parameters', {}),
+                'parsed': parsed,
+                'policies': [p.to_dict() for p in policies],
+                'status': 'active'
             }
+            
+            self.intents.append(intent)
         
-        # Generate policies
-        policies = self.policy_engine.generate_policies(parsed)
-        
-        intent = {
-            'id': intent_id,
-            'timestamp': datetime.now().isoformat(),
-            'description': description,
-            'type': intent_data.get('type', parsed.get('type', 'general')),
-            'parameters': intent_data.get('parameters', {}),
-            'parsed': parsed,
-            'policies': [p.to_dict() for p in policies],
-            'status': 'active'
-        }
-        
-        self.intents.append(intent)
-        
-        # Persist to database
-        try:
+        # The in-memory lists serve reads when the database is unavailable
+        self.db_manager.generations.bump('intents', 'policies')
+        return intent, parsed, policies
+    
+    def persist_intent(self, intent):
+        """Save an intent and its policies to the database"""
+        with intent_stage('persist'):
             self.db_manager.add_intent(
-                intent_id=intent_id,
-                original_intent=description,
-                parsed_intent=parsed,
+                intent_id=intent['id'],
+                original_intent=intent['description'],
+                parsed_intent=intent['parsed'],
                 status='active'
             )
             
             # Save policies to database
-            for policy in policies:
-                policy_dict = policy.to_dict()
+            for policy_dict in intent['policies']:
                 self.db_manager.add_policy(
                     policy_id=policy_dict['policy_id'],
-                    intent_id=intent_id,
+                    intent_id=intent['id'],
                     policy_type=policy_dict['policy_type'],
                     parameters=policy_dict['parameters'],
                     status='pending'
                 )
-        except Exception as e:
-            logger.warning(f"Failed to persist intent to database: {e}")
-        
+    
+    def activate_intent(self, intent, parsed, policies):
+        """Enforce an intent's policies and start monitoring its goals"""
         # Enforce policies
-        self._enforce_policies(policies, parsed)
+        with intent_stage('enforce'):
+            self.enforce_policies(policies, parsed, intent_id=intent['id'])
         
-        logger.info(f"Intent {intent_id} created with {len(policies)} policies")
+        # Monitor the intent's goals against its target device
+        self._register_feedback(intent['id'], parsed, policies)
         
-        return intent
+        logger.info(f"Intent {intent['id']} created with {len(policies)} policies")
+        self.publish('intent', {
+            'id': intent['id'],
+            'status': intent['status'],
+            'type': intent['type'],
+            'description': intent['description'],
+            'policies': [p['policy_id'] for p in intent['policies']]
+        })
     
     def get_intent(self, intent_id):
         """Retrieve specific intent by ID"""
@@ -128,57 +196,396 @@ class IntentManager:
                 return intent
         return None
     
-    def _enforce_policies(self, policies, parsed):
-        """Enforce generated policies via MQTT and network"""
-        target_device = parsed.get('parameters', {}).get('target_device', '')
+    @staticmethod
+    def _target_device(parsed):
+        """Target device of a parsed intent, in node-X / esp32-... form"""
+        return normalize_target(parsed.get('parameters', {}).get('target_device', ''))
+    
+    def _register_feedback(self, intent_id, parsed, policies):
+        """Register measurable goals of an intent with the feedback engine"""
+        if not self.feedback_engine:
+            return
         
-        # Normalize target (ensure node-X format for simulated nodes only, preserve esp32- prefix)
-        if target_device and not target_device.startswith(('node-', 'esp32-')):
-            target_device = f"node-{target_device}"
+        params = parsed.get('parameters', {})
+        goals = {}
+        for name in ('latency_target', 'latency_threshold'):
+            if params.get(name) and params[name][0]:
+                goals['max_latency'] = float(params[name][0])
         
+        if goals:
+            self.feedback_engine.register_intent(
+                intent_id, goals, targets=self._target_device(parsed) or None,
+                priority=max((p.priority for p in policies), default=5)
+            )
+            # First check right after enforcement instead of waiting for the next interval
+            if self.feedback_scheduler:
+                self.feedback_scheduler.trigger(intent_id, reason='enforced')
+    
+    def enforce_policies(self, policies, parsed, intent_id=None):
+        """
+        Enforce generated policies via MQTT and network
+        
+        Only keys whose effective policy changed are enforced: a policy that
+        loses a conflict, or repeats the parameters already in effect, causes
+        no tc or MQTT operation and is reported as superseded or unchanged.
+        """
+        target_device = self._target_device(parsed)
+        index = self.policy_engine.index
+        
+        changes = index.pending([policy_key(policy) for policy in policies])
+        changed = {policy.policy_id for policy in changes}
         for policy in policies:
-            policy_dict = policy.to_dict()
-            policy_type = policy_dict.get('policy_type', '')  # Fixed: was 'type'
-            
-            # Build enforcement policy
-            enforce_policy = {
-                'policy_type': policy_type,
-                'target': target_device or policy_dict.get('target', ''),
-                'parameters': policy_dict.get('parameters', {})  # Fixed: was 'config'
-            }
-            
-            logger.info(f"Enforcing policy: {enforce_policy}")
-            
-            # Apply via device enforcer (MQTT) - includes ESP32 controls
-            if self.device_enforcer and policy_type in ['qos_control', 'device_config', 'sample_rate', 'audio_gain', 'publish_interval']:
-                try:
-                    success = self.device_enforcer.apply_policy(enforce_policy)
-                    logger.info(f"Device enforcement {'succeeded' if success else 'failed'}")
-                except Exception as e:
-                    logger.error(f"Device enforcement error: {e}")
+            if policy.policy_id not in changed:
+                self.policy_engine.mark_not_enforced(policy)
+                effective = index.effective(policy.target, policy.policy_type)
+                status = 'unchanged' if effective is policy else 'superseded'
+                logger.info(f"Policy {policy.policy_id} not enforced ({status}, "
+                            f"effective: {effective.policy_id if effective else None})")
+                self.publish('policy', {
+                    'policy_id': policy.policy_id,
+                    'intent_id': intent_id,
+                    'policy_type': policy.policy_type.value,
+                    'target': target_device or policy.target,
+                    'status': status,
+                    'effective_policy_id': effective.policy_id if effective else None
+                })
+        
+        for policy in changes:
+            self._enforce_policy(policy, target_device or normalize_target(policy.target), intent_id)
+        
+        # Remediation enforces policies that were never persisted
+        self.db_manager.generations.bump('policies')
+    
+    def withdraw_policy(self, policy_id):
+        """
+        Take a policy out of effect (e.g. a rolled-back remediation)
+        
+        Its device settings are withdrawn, and the policy next in line for the
+        same target and type, if different, is enforced in its place.
+        """
+        policy = self.policy_engine.active.get(policy_id)
+        key = self.policy_engine.remove_policy(policy_id)
+        if self.device_enforcer:
+            self.device_enforcer.shadows.withdraw(policy_id)
+        if key is None:
+            return
+        self._undo_network(policy, key)
+        for policy in self.policy_engine.index.pending([key]):
+            self._enforce_policy(policy, key[0], None)
+        self.db_manager.generations.bump('policies')
+    
+    def expire_policies(self, now=None):
+        """
+        Take policies past their TTL out of effect
+        
+        Like a withdrawal: device settings are withdrawn and the policy next in
+        line for each target and type takes over.
+        
+        Returns:
+            Number of policies expired
+        """
+        expired = self.policy_engine.expire(now)
+        if not expired:
+            return 0
+        for policy, _ in expired:
+            if self.device_enforcer:
+                self.device_enforcer.shadows.withdraw(policy.policy_id)
+            self.publish('policy', {
+                'policy_id': policy.policy_id,
+                'intent_id': None,
+                'policy_type': policy.policy_type.value,
+                'target': policy.target,
+                'status': 'expired'
+            })
+        for policy, key in expired:
+            self._undo_network(policy, key)
+        keys = [key for _, key in expired if key is not None]
+        for policy in self.policy_engine.index.pending(keys):
+            self._enforce_policy(policy, policy_key(policy)[0], None)
+        logger.info(f"Expired {len(expired)} policies")
+        self.db_manager.generations.bump('policies')
+        return len(expired)
+    
+    def _undo_network(self, policy, key):
+        """Remove the tc / iptables rules of a policy that left with nothing in line to replace it"""
+        index = self.policy_engine.index
+        if (self.network_enforcer is None or policy is None or key is None
+                or policy.policy_type.value not in NETWORK_POLICY_TYPES):
+            return
+        if index.effective(*key) is None and index.enforced(*key) is policy:
+            self.network_enforcer.remove_policy(dict(policy.to_dict(), target=key[0]))
+    
+    def _queue_status(self, policy):
+        with self._lifecycle:
+            # New policies are persisted as pending; they only wake the worker for their expiry
+            if policy.status != 'pending':
+                self._status_updates[policy.policy_id] = policy.status
+            self._woken = True
+            self._ensure_lifecycle_worker()
+            self._lifecycle.notify()
+    
+    def flush_policy_statuses(self):
+        """Write queued policy status changes to the database"""
+        with self._lifecycle:
+            updates, self._status_updates = self._status_updates, {}
+        if not updates:
+            return
+        try:
+            self.db_manager.update_policy_statuses(updates)
+        except Exception as e:
+            # Status history is best effort; the active set in memory stays authoritative
+            logger.warning(f"Failed to record {len(updates)} policy statuses: {e}")
+    
+    def close(self):
+        """Stop the lifecycle worker and record pending status changes"""
+        with self._lifecycle:
+            self._running = False
+            self._lifecycle.notify()
+        if self._lifecycle_worker is not None:
+            self._lifecycle_worker.join(timeout=5)
+        self.flush_policy_statuses()
+    
+    def _ensure_lifecycle_worker(self):
+        if self._running and (self._lifecycle_worker is None or not self._lifecycle_worker.is_alive()):
+            self._lifecycle_worker = threading.Thread(target=self._run_lifecycle, name='policy-lifecycle',
+                                                      daemon=True)
+            self._lifecycle_worker.start()
+    
+    def _run_lifecycle(self):
+        """Expire policies when their TTL passes, and flush status changes at most every status_flush_interval"""
+        flush_at = None
+        while True:
+            # Read outside the condition: engine listeners take it while holding the engine's lock
+            expiry = self.policy_engine.next_expiry()
+            with self._lifecycle:
+                if not self._running:
+                    return
+                now = time.time()
+                if self._status_updates and flush_at is None:
+                    flush_at = now + self.status_flush_interval
+                deadline = min((t for t in (flush_at, expiry) if t is not None), default=None)
+                woken, self._woken = self._woken, False
+                if deadline is None or deadline > now:
+                    # Unless a policy changed since next_expiry() was read
+                    if not woken:
+                        self._lifecycle.wait(None if deadline is None else deadline - now)
+                    continue
             
-            # Apply via network enforcer (tc)
-            if self.network_enforcer and policy_type in ['bandwidth', 'latency', 'traffic_shaping']:
-                try:
-                    success = self.network_enforcer.apply_policy(enforce_policy)
-                    logger.info(f"Network enforcement {'succeeded' if success else 'failed'}")
-                except Exception as e:
-                    logger.error(f"Network enforcement error: {e}")
+            try:
+                if expiry is not None and expiry <= now:
+                    self.expire_policies(now)
+                if flush_at is not None and flush_at <= now:
+                    flush_at = None
+                    self.flush_policy_statuses()
+            except Exception as e:
+                logger.error(f"Policy lifecycle error: {e}")
+    
+    def _enforce_policy(self, policy, target, intent_id):
+        """Apply one effective policy and record it as enforced if that succeeded"""
+        policy_dict = policy.to_dict()
+        policy_type = policy_dict.get('policy_type', '')  # Fixed: was 'type'
+        
+        # Build enforcement policy
+        enforce_policy = {
+            'policy_id': policy_dict.get('policy_id'),
+            'policy_type': policy_type,
+            'target': target or policy_dict.get('target', ''),
+            'parameters': policy_dict.get('parameters', {}),  # Fixed: was 'config'
+            'priority': policy_dict.get('priority', 5)
+        }
+        
+        logger.info(f"Enforcing policy: {enforce_policy}")
+        success = True
+        
+        # Apply via device enforcer (MQTT) - includes ESP32 controls
+        if self.device_enforcer and policy_type in ['qos_control', 'device_config', 'sample_rate', 'audio_gain', 'publish_interval']:
+            try:
+                success = self.device_enforcer.apply_policy(enforce_policy)
+                logger.info(f"Device enforcement {'succeeded' if success else 'failed'}")
+            except Exception as e:
+                success = False
+                logger.error(f"Device enforcement error: {e}")
+            self._publish_enforcement(intent_id, enforce_policy, 'device', success)
+        
+        # Apply via network enforcer (tc)
+        if self.network_enforcer and policy_type in NETWORK_POLICY_TYPES:
+            try:
+                success = self.network_enforcer.apply_policy(enforce_policy)
+                logger.info(f"Network enforcement {'succeeded' if success else 'failed'}")
+            except Exception as e:
+                success = False
+                logger.error(f"Network enforcement error: {e}")
+            self._publish_enforcement(intent_id, enforce_policy, 'network', success)
+        
+        # A failed policy stays pending, so the next intent for this key retries it
+        if success:
+            replaced = self.policy_engine.mark_enforced(policy)
+            if replaced and self.device_enforcer:
+                # The overridden policy's device settings no longer count towards the shadow
+                self.device_enforcer.shadows.withdraw(replaced)
+    
+    def _publish_enforcement(self, intent_id, policy, enforcer, success):
+        self.publish('policy', {
+            'policy_id': policy['policy_id'],
+            'intent_id': intent_id,
+            'policy_type': policy['policy_type'],
+            'target': policy['target'],
+            'enforcer': enforcer,
+            'status': 'enforced' if success else 'failed'
+        })
     
     def list_intents(self):
         """List all submitted intents"""
         return self.intents
 
 
-# Global intent manager instance
-intent_manager = IntentManager(db_manager=db_manager)
+def create_app(db_path: str = None, create_admin: bool = True) -> Flask:
+    """
+    Build the API application and its components
+    
+    Nothing is created at import time: the database, auth and intent manager
+    are set up here, so tools that only need part of the stack (and tests)
+    do not pay for all of it.
+    
+    Args:
+        db_path: SQLite database file (default: DATABASE_PATH)
+        create_admin: Create the default admin user if it does not exist
+    
+    Returns:
+        Flask app; its components are in app.extensions['imperium']
+    """
+    from database import DatabaseManager
+    from auth import AuthManager, create_default_admin
+    from rate_limiter import RateLimiter
+    from intent_manager.auth_endpoints import init_auth_endpoints
+    from event_bus import EventBus, StreamLimit
+    from response_cache import ResponseCache
+    
+    app = Flask(__name__)
+    CORS(app)
+    
+    # Initialize security and database components
+    db_manager = DatabaseManager(db_path=db_path or os.getenv('DATABASE_PATH', 'data/imperium.db'))
+    auth_manager = AuthManager(db_manager=db_manager,
+                               token_cache_size=int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024')),
+                               stream_ticket_seconds=float(os.getenv('EVENTS_TICKET_SECONDS', '30')))
+    rate_limiter = RateLimiter(enabled=os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true')
+    
+    # Create default admin user if not exists
+    if create_admin:
+        try:
+            create_default_admin(auth_manager)
+        except Exception as e:
+            logger.warning(f"Could not create default admin: {e}")
+    
+    event_bus = EventBus(buffer_size=int(os.getenv('EVENTS_BUFFER_SIZE', '1000')))
+    
+    app.extensions['imperium'] = {
+        'db_manager': db_manager,
+        'auth_manager': auth_manager,
+        'rate_limiter': rate_limiter,
+        'event_bus': event_bus,
+        # Each open stream holds a request thread: keep some free for everything else
+        'stream_limit': StreamLimit(int(os.getenv('EVENTS_MAX_STREAMS', '4'))),
+        'response_cache': ResponseCache(
+            max_entries=int(os.getenv('API_RESPONSE_CACHE_SIZE', '256')),
+            enabled=os.getenv('API_RESPONSE_CACHE', 'true').lower() == 'true'
+        ),
+        'intent_manager': IntentManager(
+            db_manager=db_manager, event_bus=event_bus,
+            policy_engine=PolicyEngine(
+                default_ttl=float(os.getenv('POLICY_TTL_SECONDS', '0')) or None,
+                max_per_key=int(os.getenv('POLICY_MAX_PER_TARGET', '16')),
+                max_active=int(os.getenv('MAX_POLICIES', '5000'))
+            )
+        )
+    }
+    
+    # Initialize authentication endpoints
+    init_auth_endpoints(app, auth_manager, rate_limiter)
+    
+    # Request latency per route, and /metrics for Prometheus
+    instrument_flask(app)
+    
+    def protected(view, limit_type):
+        return rate_limiter.limit(limit_type)(auth_manager.require_auth(view))
+    
+    app.add_url_rule('/health', view_func=rate_limiter.limit('default')(health_check), methods=['GET'])
+    app.add_url_rule('/api/v1/intents', view_func=protected(submit_intent, 'intents'), methods=['POST'])
+    app.add_url_rule('/api/v1/intents', view_func=protected(list_intents, 'default'), methods=['GET'])
+    app.add_url_rule('/api/v1/intents/<intent_id>', view_func=protected(get_intent, 'default'), methods=['GET'])
+    app.add_url_rule('/api/v1/policies', view_func=protected(list_policies, 'default'), methods=['GET'])
+    app.add_url_rule('/api/v1/events', view_func=rate_limiter.limit('default')(stream_events), methods=['GET'])
+    app.add_url_rule('/api/v1/events/ticket', view_func=protected(stream_ticket, 'default'), methods=['POST'])
+    app.add_url_rule('/api/v1/admin/profile',
+                     view_func=rate_limiter.limit('default')(auth_manager.require_admin(profile)), methods=['GET'])
+    
+    return app
+
+
+_app = None
+_app_lock = threading.Lock()
+
+_COMPONENTS = ('db_manager', 'auth_manager', 'rate_limiter', 'event_bus', 'response_cache', 'intent_manager')
+
 
-# Initialize authentication endpoints
-init_auth_endpoints(app, auth_manager, rate_limiter)
+def get_app() -> Flask:
+    """The process-wide API app, created on first use"""
+    global _app
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
+    return _app
+
+
+def __getattr__(name):
+    # `app`, `intent_manager` etc. stay importable from this module, but are only built when first used
+    if name == 'app':
+        return get_app()
+    if name in _COMPONENTS:
+        return get_app().extensions['imperium'][name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _intent_manager() -> IntentManager:
+    return current_app.extensions['imperium']['intent_manager']
+
+
+def cached_json(collections, build):
+    """
+    JSON response for a read endpoint, revalidated by generation
+    
+    The ETag is derived from the generations of `collections` alone, so a
+    matching If-None-Match is answered with 304 before any query runs; on a
+    mismatch the serialized body comes from the response cache when it was
+    already built for this URL and generation. Disabled (API_RESPONSE_CACHE)
+    the body is always rebuilt and no ETag is sent.
+    
+    Args:
+        collections: Collections the response is built from
+        build: Returns (payload, status) from the database
+    """
+    from response_cache import dumps, etag_matches
+    
+    components = current_app.extensions['imperium']
+    cache = components['response_cache']
+    if not cache.enabled:
+        payload, status = build()
+        return Response(dumps(payload), status=status, mimetype='application/json')
+    
+    etag = components['db_manager'].generations.etag(collections)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers=headers)
+    
+    key = (request.path, request.query_string, etag)
+    body, status = cache.get_or_build(key, build)
+    if status != 200:
+        headers = {}
+    return Response(body, status=status, mimetype='application/json', headers=headers)
 
 
-@app.route('/health', methods=['GET'])
-@rate_limiter.limit('default')
 def health_check():
     """Health check endpoint"""
     return jsonify({
@@ -192,11 +599,10 @@ def health_check():
     })
 
 
-@app.route('/api/v1/intents', methods=['POST'])
-@rate_limiter.limit('intents')
-@auth_manager.require_auth
 def submit_intent():
     """Submit a new intent (requires authentication)"""
+    intent_manager = _intent_manager()
+    
     try:
         intent_data = request.get_json()
         
@@ -206,80 +612,209 @@ def submit_intent():
         if 'description' not in intent_data:
             return jsonify({'error': 'Intent description is required'}), 400
         
-        intent = intent_manager.submit_intent(intent_data)
+        # Continues the caller's trace if it sent a traceparent header
+        with get_tracer().span('POST /api/v1/intents',
+                               parent=parse_traceparent(request.headers.get('traceparent'))) as span:
+            intent = intent_manager.submit_intent(intent_data)
+            span.set('intent_id', intent.get('id'))
+            span.set('intent_status', intent.get('status'))
+        headers = {'traceresponse': span.traceparent}
         
         if intent.get('status') == 'invalid':
             return jsonify({
                 'success': False,
                 'intent': intent
-            }), 400
+            }), 400, headers
         
         return jsonify({
             'success': True,
             'intent': intent
-        }), 201
+        }), 201, headers
         
     except Exception as e:
         logger.error(f"Error submitting intent: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/v1/intents', methods=['GET'])
-@rate_limiter.limit('default')
-@auth_manager.require_auth
 def list_intents():
     """List all intents (requires authentication)"""
-    # Try to get from database first
-    try:
-        db_intents = intent_manager.db_manager.get_all_intents(limit=100)
-        if db_intents:
-            return jsonify({'intents': db_intents, 'count': len(db_intents)})
-    except Exception as e:
-        logger.warning(f"Failed to retrieve from database: {e}")
+    intent_manager = _intent_manager()
     
-    # Fall back to in-memory cache
-    intents = intent_manager.list_intents()
-    return jsonify({'intents': intents, 'count': len(intents)})
+    def build():
+        # Try to get from database first
+        try:
+            db_intents = intent_manager.db_manager.get_all_intents(limit=100)
+            if db_intents:
+                return {'intents': db_intents, 'count': len(db_intents)}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+        
+        # Fall back to in-memory cache
+        intents = intent_manager.list_intents()
+        return {'intents': intents, 'count': len(intents)}, 200
+    
+    # Intents embed their policies
+    return cached_json(('intents', 'policies'), build)
 
 
-@app.route('/api/v1/intents/<intent_id>', methods=['GET'])
-@rate_limiter.limit('default')
-@auth_manager.require_auth
 def get_intent(intent_id):
     """Get specific intent (requires authentication)"""
-    # Try database first
-    try:
-        db_intent = intent_manager.db_manager.get_intent(intent_id)
-        if db_intent:
-            return jsonify({'intent': db_intent})
-    except Exception as e:
-        logger.warning(f"Failed to retrieve from database: {e}")
+    intent_manager = _intent_manager()
     
-    # Fall back to in-memory
-    intent = intent_manager.get_intent(intent_id)
+    def build():
+        # Try database first
+        try:
+            db_intent = intent_manager.db_manager.get_intent(intent_id)
+            if db_intent:
+                return {'intent': db_intent}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+        
+        # Fall back to in-memory
+        intent = intent_manager.get_intent(intent_id)
+        
+        if intent:
+            return {'intent': intent}, 200
+        else:
+            return {'error': 'Intent not found'}, 404
     
-    if intent:
-        return jsonify({'intent': intent})
-    else:
-        return jsonify({'error': 'Intent not found'}), 404
+    return cached_json(('intents', 'policies'), build)
 
 
-@app.route('/api/v1/policies', methods=['GET'])
-@rate_limiter.limit('default')
-@auth_manager.require_auth
 def list_policies():
     """List all generated policies (requires authentication)"""
-    # Try database first
+    intent_manager = _intent_manager()
+    
+    def build():
+        # Try database first
+        try:
+            db_policies = intent_manager.db_manager.get_all_policies(limit=100)
+            if db_policies:
+                return {'policies': db_policies, 'count': len(db_policies)}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+        
+        # Fall back to in-memory
+        policies = intent_manager.policy_engine.get_policies()
+        return {'policies': policies, 'count': len(policies)}, 200
+    
+    return cached_json(('policies',), build)
+
+
+def stream_events():
+    """
+    Stream state changes as server-sent events (requires authentication)
+    
+    Event types: intent, policy, device, feedback, and reset when the
+    requested resume point is older than the replay buffer. Clients resume
+    with the Last-Event-ID header, or ?last_event_id= on first connect.
+    EventSource cannot send headers, so a single-use ?ticket= from
+    POST /api/v1/events/ticket is also accepted. Beyond EVENTS_MAX_STREAMS
+    open streams the answer is 503.
+    """
+    from event_bus import parse_last_event_id
+    
+    components = current_app.extensions['imperium']
+    auth_manager = components['auth_manager']
+    auth_header = request.headers.get('Authorization', '')
+    if ' ' in auth_header:
+        user = auth_manager.decode_token(auth_header.split(' ')[1])
+    elif request.args.get('ticket'):
+        user = auth_manager.redeem_stream_ticket(request.args['ticket'])
+    else:
+        return jsonify({'error': 'Authentication token is missing'}), 401
+    if not user:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    
+    stream_limit = components['stream_limit']
+    if not stream_limit.acquire():
+        return jsonify({
+            'error': 'Too many open event streams',
+            'message': 'Retry later, or serve the API with API_SERVER=uvicorn'
+        }), 503, {'Retry-After': '5'}
+    
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID'), request.args.get('last_event_id'))
+    stream = components['event_bus'].stream(
+        last_id, keepalive=float(os.getenv('EVENTS_KEEPALIVE_SECONDS', '15'))
+    )
+    response = Response(stream, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(stream_limit.release)
+    return response
+
+
+def stream_ticket():
+    """Issue a short-lived, single-use ticket for opening an event stream (requires authentication)"""
+    auth_manager = current_app.extensions['imperium']['auth_manager']
+    return jsonify({
+        'ticket': auth_manager.issue_stream_ticket(request.current_user),
+        'expires_in': auth_manager.stream_ticket_seconds
+    }), 201
+
+
+def profile_options(args):
+    """
+    Validated options of a profile request
+    
+    Args:
+        args: Query parameters
+    
+    Returns:
+        (options, error) - error is a message for a 400 response, or None
+    """
+    max_seconds = float(os.getenv('PROFILER_MAX_SECONDS', '60'))
     try:
-        db_policies = intent_manager.db_manager.get_all_policies(limit=100)
-        if db_policies:
-            return jsonify({'policies': db_policies, 'count': len(db_policies)})
-    except Exception as e:
-        logger.warning(f"Failed to retrieve from database: {e}")
+        options = {
+            'mode': args.get('mode', 'cpu'),
+            'format': args.get('format', 'collapsed'),
+            'seconds': float(args.get('seconds', '10')),
+            'interval': float(args.get('interval', '0.01')),
+            'top': int(args.get('top', '25')),
+            'frames': int(args.get('frames', '1')),
+        }
+    except ValueError:
+        return None, 'seconds, interval, top and frames must be numbers'
+    if options['mode'] not in ('cpu', 'memory') or options['format'] not in ('collapsed', 'json'):
+        return None, 'mode must be cpu or memory, format collapsed or json'
+    if not 0 < options['seconds'] <= max_seconds or not 0.001 <= options['interval'] <= 1:
+        return None, f'seconds must be in (0, {max_seconds:g}] and interval in [0.001, 1]'
+    if options['top'] < 1 or not 1 <= options['frames'] <= 50:
+        return None, 'top must be at least 1 and frames in [1, 50]'
+    return options, None
+
+
+def profile():
+    """
+    Profile this process for a while (requires admin)
+    
+    Query parameters:
+        mode: cpu (default) samples every thread's stack; memory reports the
+            lines whose allocations grew during the window
+        seconds: Duration, at most PROFILER_MAX_SECONDS (default 10)
+        interval: cpu: seconds between samples (default 0.01)
+        format: cpu: collapsed (default, flamegraph input) or json
+        top, frames: memory: lines reported (default 25) and stack depth (default 1)
+    """
+    import profiler
+    
+    options, error = profile_options(request.args)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    logger.info(f"{options['mode']} profile for {options['seconds']:g}s "
+                f"requested by {request.current_user['username']}")
+    try:
+        if options['mode'] == 'memory':
+            return jsonify(profiler.allocation_growth(options['seconds'], options['top'], options['frames']))
+        result = profiler.sample_stacks(options['seconds'], options['interval'])
+    except profiler.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
     
-    # Fall back to in-memory
-    policies = intent_manager.policy_engine.get_policies()
-    return jsonify({'policies': policies, 'count': len(policies)})
+    if options['format'] == 'json':
+        result['stacks'] = dict(result['stacks'].most_common())
+        return jsonify(result)
+    return Response(profiler.collapse(result['stacks']), mimetype='text/plain',
+                    headers={'X-Profile-Samples': str(result['samples'])})
 
 
 if __name__ == '__main__':
@@ -289,5 +824,8 @@ if __name__ == '__main__':
     logger.info("  GET    /api/v1/intents - List all intents")
     logger.info("  GET    /api/v1/intents/<id> - Get specific intent")
     logger.info("  GET    /api/v1/policies - List all policies")
+    logger.info("  GET    /api/v1/events - Stream state changes (SSE)")
+    logger.info("  POST   /api/v1/events/ticket - Ticket for opening an event stream")
+    logger.info("  GET    /api/v1/admin/profile - Profile the running process (admin)")
     logger.info("  GET    /health - Health check")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+"""
+Intent Manager (ASGI) - Asyncio variant of the REST API
+Same routes and JSON shapes as api.py, served from an event loop; blocking work runs in executors
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial, wraps
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controller_metrics import ASGIMetricsMiddleware, render_metrics
+from database import AsyncDatabaseManager
+from event_bus import StreamLimit, parse_last_event_id
+from intent_manager.api import get_app, intent_stage, profile_options
+from response_cache import dumps, etag_matches
+from tracing import get_tracer, parse_traceparent
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Build the components and open the async database and executors for the lifetime of the server"""
+    # The intent manager, auth and caches are shared with the WSGI app of this process (built on first use)
+    components = get_app().extensions['imperium']
+    for name in ('auth_manager', 'rate_limiter', 'event_bus', 'response_cache', 'intent_manager'):
+        setattr(app.state, name, components[name])
+    # Streams here are coroutines, not threads: the cap only bounds open connections
+    app.state.stream_limit = StreamLimit(int(os.getenv('EVENTS_MAX_STREAMS_ASYNC', '1000')))
+    # Shares change counters with the intent manager's in-memory fallback
+    app.state.db = AsyncDatabaseManager(db_path=os.getenv('DATABASE_PATH', 'data/imperium.db'),
+                                        generations=components['db_manager'].generations)
+    await app.state.db.create_tables()
+    # Parsing, policy generation and bcrypt (which releases the GIL while hashing)
+    app.state.cpu_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv('API_CPU_WORKERS', '4')), thread_name_prefix='api-cpu'
+    )
+    # Enforcement: tc subprocesses and the hand-off to the MQTT network thread
+    app.state.enforce_executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv('API_ENFORCE_WORKERS', '4')), thread_name_prefix='api-enforce'
+    )
+    try:
+        yield
+    finally:
+        app.state.cpu_executor.shutdown(wait=False)
+        app.state.enforce_executor.shutdown(wait=True)
+        await app.state.db.close()
+
+
+async def run_blocking(executor, func, *args, **kwargs):
+    """Run a blocking call on an executor without holding up the event loop"""
+    # Executor threads do not inherit context variables; the current span goes along explicitly
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(context.run, func, *args, **kwargs))
+
+
+async def get_json(request: Request):
+    """Request body as JSON, or None if missing or malformed"""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def rate_limit(limit_type='default'):
+    """Async counterpart of RateLimiter.limit"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request: Request):
+            rate_limiter = request.app.state.rate_limiter
+            if not rate_limiter.enabled:
+                return await handler(request)
+
+            client_id = f"ip:{request.client.host if request.client else 'unknown'}"
+            is_limited, remaining, reset_time = rate_limiter.is_rate_limited(client_id, limit_type)
+
+            if is_limited:
+                return JSONResponse({
+                    'error': 'Rate limit exceeded',
+                    'message': f'Too many requests. Try again after {reset_time.isoformat()}',
+                    'retry_after': reset_time.isoformat()
+                }, status_code=429)
+
+            response = await handler(request)
+            response.headers['X-RateLimit-Limit'] = str(rate_limiter.limits[limit_type]['requests'])
+            response.headers['X-RateLimit-Remaining'] = str(remaining)
+            response.headers['X-RateLimit-Reset'] = reset_time.isoformat()
+            return response
+        return wrapper
+    return decorator
+
+
+def require_auth(handler):
+    """Async counterpart of AuthManager.require_auth; sets request.state.current_user"""
+    @wraps(handler)
+    async def wrapper(request: Request):
+        token = None
+
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            try:
+                token = auth_header.split(' ')[1]  # Format: "Bearer <token>"
+            except IndexError:
+                return JSONResponse({'error': 'Invalid authorization header format'}, status_code=401)
+
+        if not token:
+            return JSONResponse({'error': 'Authentication token is missing'}, status_code=401)
+
+        payload = request.app.state.auth_manager.decode_token(token)
+        if not payload:
+            return JSONResponse({'error': 'Invalid or expired token'}, status_code=401)
+
+        request.state.current_user = payload
+        return await handler(request)
+    return wrapper
+
+
+def require_admin(handler):
+    """Async counterpart of AuthManager.require_admin"""
+    @require_auth
+    @wraps(handler)
+    async def wrapper(request: Request):
+        if request.state.current_user.get('role') != 'admin':
+            return JSONResponse({'error': 'Admin privileges required'}, status_code=403)
+        return await handler(request)
+    return wrapper
+
+
+async def cached_json(request: Request, collections, build):
+    """Async counterpart of api.cached_json; `build` is a coroutine function"""
+    cache = request.app.state.response_cache
+    if not cache.enabled:
+        payload, status = await build()
+        return Response(dumps(payload), status_code=status, media_type='application/json')
+
+    etag = request.app.state.db.generations.etag(collections)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (request.url.path, request.url.query.encode(), etag)
+    body = cache.get(key)
+    if body is None:
+        payload, status = await build()
+        body = dumps(payload)
+        if status != 200:
+            return Response(body, status_code=status, media_type='application/json')
+        cache.put(key, body)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+@rate_limit('default')
+async def health_check(request: Request):
+    """Health check endpoint"""
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'intent-manager',
+        'features': {
+            'authentication': True,
+            'rate_limiting': True,
+            'database': True
+        }
+    })
+
+
+@rate_limit('intents')
+@require_auth
+async def submit_intent(request: Request):
+    """Submit a new intent (requires authentication)"""
+    state = request.app.state
+    try:
+        intent_data = await get_json(request)
+
+        if not intent_data:
+            return JSONResponse({'error': 'No intent data provided'}, status_code=400)
+
+        if 'description' not in intent_data:
+            return JSONResponse({'error': 'Intent description is required'}, status_code=400)
+
+        with get_tracer().span('POST /api/v1/intents',
+                               parent=parse_traceparent(request.headers.get('traceparent'))) as span:
+            intent, parsed, policies = await run_blocking(
+                state.cpu_executor, state.intent_manager.prepare_intent, intent_data
+            )
+            span.set('intent_id', intent.get('id'))
+            span.set('intent_status', intent.get('status'))
+
+            if intent.get('status') == 'invalid':
+                return JSONResponse({'success': False, 'intent': intent}, status_code=400,
+                                    headers={'traceresponse': span.traceparent})
+
+            try:
+                with intent_stage('persist'):
+                    await state.db.add_intent(intent['id'], intent['description'], intent['parsed'],
+                                              status='active', policies=intent['policies'])
+            except Exception as e:
+                logger.warning(f"Failed to persist intent to database: {e}")
+
+            await run_blocking(state.enforce_executor, state.intent_manager.activate_intent, intent, parsed, policies)
+
+        return JSONResponse({'success': True, 'intent': intent}, status_code=201,
+                            headers={'traceresponse': span.traceparent})
+
+    except Exception as e:
+        logger.error(f"Error submitting intent: {e}", exc_info=True)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+@rate_limit('default')
+@require_auth
+async def list_intents(request: Request):
+    """List all intents (requires authentication)"""
+    async def build():
+        try:
+            db_intents = await request.app.state.db.get_all_intents(limit=100)
+            if db_intents:
+                return {'intents': db_intents, 'count': len(db_intents)}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+
+        intents = request.app.state.intent_manager.list_intents()
+        return {'intents': intents, 'count': len(intents)}, 200
+
+    return await cached_json(request, ('intents', 'policies'), build)
+
+
+@rate_limit('default')
+@require_auth
+async def get_intent(request: Request):
+    """Get specific intent (requires authentication)"""
+    intent_id = request.path_params['intent_id']
+
+    async def build():
+        try:
+            db_intent = await request.app.state.db.get_intent(intent_id)
+            if db_intent:
+                return {'intent': db_intent}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+
+        intent = request.app.state.intent_manager.get_intent(intent_id)
+
+        if intent:
+            return {'intent': intent}, 200
+        else:
+            return {'error': 'Intent not found'}, 404
+
+    return await cached_json(request, ('intents', 'policies'), build)
+
+
+@rate_limit('default')
+@require_auth
+async def list_policies(request: Request):
+    """List all generated policies (requires authentication)"""
+    async def build():
+        try:
+            db_policies = await request.app.state.db.get_all_policies(limit=100)
+            if db_policies:
+                return {'policies': db_policies, 'count': len(db_policies)}, 200
+        except Exception as e:
+            logger.warning(f"Failed to retrieve from database: {e}")
+
+        policies = request.app.state.intent_manager.policy_engine.get_policies()
+        return {'policies': policies, 'count': len(policies)}, 200
+
+    return await cached_json(request, ('policies',), build)
+
+
+@rate_limit('default')
+async def stream_events(request: Request):
+    """Stream state changes as server-sent events (see api.stream_events)"""
+    auth_manager = request.app.state.auth_manager
+    auth_header = request.headers.get('Authorization', '')
+    if ' ' in auth_header:
+        user = auth_manager.decode_token(auth_header.split(' ')[1])
+    elif request.query_params.get('ticket'):
+        user = auth_manager.redeem_stream_ticket(request.query_params['ticket'])
+    else:
+        return JSONResponse({'error': 'Authentication token is missing'}, status_code=401)
+    if not user:
+        return JSONResponse({'error': 'Invalid or expired token'}, status_code=401)
+
+    stream_limit = request.app.state.stream_limit
+    if not stream_limit.acquire():
+        return JSONResponse({'error': 'Too many open event streams', 'message': 'Retry later'},
+                            status_code=503, headers={'Retry-After': '5'})
+
+    last_id = parse_last_event_id(request.headers.get('Last-Event-ID'),
+                                  request.query_params.get('last_event_id'))
+    keepalive = float(os.getenv('EVENTS_KEEPALIVE_SECONDS', '15'))
+    event_bus = request.app.state.event_bus
+
+    async def events():
+        # Publishers run on other threads: they only wake this stream's event
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        listener = partial(loop.call_soon_threadsafe, wakeup.set)
+        event_bus.add_listener(listener)
+        current = event_bus.last_id if last_id is None else last_id
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                wakeup.clear()
+                result = event_bus.since(current)
+                if not result[0]:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), keepalive)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                chunk, current = event_bus.next_chunk(current, result)
+                yield chunk
+        finally:
+            event_bus.remove_listener(listener)
+            stream_limit.release()
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@rate_limit('default')
+@require_auth
+async def stream_ticket(request: Request):
+    """Issue a short-lived, single-use ticket for opening an event stream"""
+    auth_manager = request.app.state.auth_manager
+    return JSONResponse({
+        'ticket': auth_manager.issue_stream_ticket(request.state.current_user),
+        'expires_in': auth_manager.stream_ticket_seconds
+    }, status_code=201)
+
+
+@rate_limit('auth')
+async def register(request: Request):
+    """Register a new user account"""
+    state = request.app.state
+    data = await get_json(request)
+
+    if not data or not data.get('username') or not data.get('password'):
+        return JSONResponse({
+            'error': 'Missing required fields',
+            'message': 'Username and password are required'
+        }, status_code=400)
+
+    username = data['username']
+    password = data['password']
+
+    if len(username) < 3 or len(username) > 50:
+        return JSONResponse({
+            'error': 'Invalid username',
+            'message': 'Username must be between 3 and 50 characters'
+        }, status_code=400)
+
+    if len(password) < 8:
+        return JSONResponse({
+            'error': 'Weak password',
+            'message': 'Password must be at least 8 characters'
+        }, status_code=400)
+
+    if await state.db.get_user_by_username(username):
+        return JSONResponse({
+            'error': 'Username already exists',
+            'message': f'User "{username}" is already registered'
+        }, status_code=409)
+
+    try:
+        password_hash = await run_blocking(state.cpu_executor, state.auth_manager.hash_password, password)
+        user = await state.db.add_user(username, password_hash, email=data.get('email'), role='user')
+    except Exception as e:
+        logger.error(f"User registration failed: {e}")
+        return JSONResponse({
+            'error': 'Registration failed',
+            'message': 'Could not create user account'
+        }, status_code=500)
+
+    logger.info(f"New user registered: {username}")
+    return JSONResponse({
+        'message': 'User registered successfully',
+        'user': {
+            'id': user['id'],
+            'username': user['username'],
+            'email': user['email'],
+            'role': user['role']
+        }
+    }, status_code=201)
+
+
+@rate_limit('auth')
+async def login(request: Request):
+    """Authenticate user and generate JWT token"""
+    state = request.app.state
+    data = await get_json(request)
+
+    if not data or not data.get('username') or not data.get('password'):
+        return JSONResponse({
+            'error': 'Missing credentials',
+            'message': 'Username and password are required'
+        }, status_code=400)
+
+    username = data['username']
+    user = await state.db.get_user_by_username(username)
+
+    if user and user.is_active and await run_blocking(
+            state.cpu_executor, state.auth_manager.verify_password, data['password'], user.password_hash):
+        await state.db.update_last_login(username)
+        logger.info(f"User logged in: {username}")
+        return JSONResponse({
+            'message': 'Login successful',
+            'token': state.auth_manager.generate_token(user.username, user.role),
+            'token_type': 'Bearer',
+            'expires_in': state.auth_manager.token_expiry_hours * 3600  # seconds
+        })
+
+    logger.warning(f"Failed login attempt for user: {username}")
+    return JSONResponse({
+        'error': 'Authentication failed',
+        'message': 'Invalid username or password'
+    }, status_code=401)
+
+
+async def verify_token(request: Request):
+    """Verify JWT token validity"""
+    auth_header = request.headers.get('Authorization')
+
+    if not auth_header:
+        return JSONResponse({
+            'error': 'No token provided',
+            'message': 'Authorization header is missing'
+        }, status_code=401)
+
+    try:
+        token = auth_header.split(' ')[1]
+    except IndexError:
+        return JSONResponse({
+            'error': 'Invalid authorization header',
+            'message': 'Format should be: Bearer <token>'
+        }, status_code=401)
+
+    payload = request.app.state.auth_manager.decode_token(token)
+
+    if payload:
+        return JSONResponse({
+            'valid': True,
+            'user': {
+                'username': payload['username'],
+                'role': payload['role'],
+                'expires_at': payload['exp']
+            }
+        })
+    return JSONResponse({'valid': False, 'error': 'Invalid or expired token'}, status_code=401)
+
+
+@require_auth
+async def get_profile(request: Request):
+    """Get current user profile"""
+    user = await request.app.state.db.get_user_by_username(request.state.current_user['username'])
+
+    if user:
+        return JSONResponse({'user': user.to_dict()})
+    return JSONResponse({'error': 'User not found'}, status_code=404)
+
+
+async def metrics(request: Request):
+    """Prometheus metrics of this process (or of all workers, in multiprocess mode)"""
+    body, content_type = render_metrics()
+    return Response(body, headers={'Content-Type': content_type})
+
+
+@rate_limit('default')
+@require_admin
+async def profile(request: Request):
+    """Profile this process for a while (requires admin); see api.profile for the parameters"""
+    import profiler
+
+    options, error = profile_options(request.query_params)
+    if error:
+        return JSONResponse({'error': error}, status_code=400)
+
+    logger.info(f"{options['mode']} profile for {options['seconds']:g}s "
+                f"requested by {request.state.current_user['username']}")
+    try:
+        # On a thread of its own so the event loop is among the sampled stacks, not blocked by them
+        if options['mode'] == 'memory':
+            return JSONResponse(await asyncio.to_thread(
+                profiler.allocation_growth, options['seconds'], options['top'], options['frames']))
+        result = await asyncio.to_thread(profiler.sample_stacks, options['seconds'], options['interval'])
+    except profiler.ProfilerBusy as e:
+        return JSONResponse({'error': str(e)}, status_code=409)
+
+    if options['format'] == 'json':
+        result['stacks'] = dict(result['stacks'].most_common())
+        return JSONResponse(result)
+    return Response(profiler.collapse(result['stacks']), media_type='text/plain',
+                    headers={'X-Profile-Samples': str(result['samples'])})
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/api/v1/intents', submit_intent, methods=['POST']),
+    Route('/api/v1/intents', list_intents, methods=['GET']),
+    Route('/api/v1/intents/{intent_id}', get_intent, methods=['GET']),
+    Route('/api/v1/policies', list_policies, methods=['GET']),
+    Route('/api/v1/events', stream_events, methods=['GET']),
+    Route('/api/v1/events/ticket', stream_ticket, methods=['POST']),
+    Route('/api/v1/admin/profile', profile, methods=['GET']),
+    Route('/api/v1/auth/register', register, methods=['POST']),
+    Route('/api/v1/auth/login', login, methods=['POST']),
+    Route('/api/v1/auth/verify', verify_token, methods=['GET']),
+    Route('/api/v1/auth/profile', get_profile, methods=['GET']),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(ASGIMetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
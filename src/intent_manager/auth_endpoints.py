@@ -9,10 +9,6 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-# Create authentication blueprint
-auth_bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
-
-
 def init_auth_endpoints(app, auth_manager, rate_limiter):
     """Initialize authentication endpoints.
     
@@ -21,6 +17,8 @@ def init_auth_endpoints(app, auth_manager, rate_limiter):
         auth_manager: AuthManager instance
         rate_limiter: RateLimiter instance
     """
+    # Created per app so create_app() can be called more than once
+    auth_bp = Blueprint('auth', __name__, url_prefix='/api/v1/auth')
     
     @auth_bp.route('/register', methods=['POST'])
     @rate_limiter.limit('auth')
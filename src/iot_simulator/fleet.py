@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+IoT Fleet Simulator - Thousands of virtual IoT nodes in one asyncio process
+Nodes share MQTT connections, publish from a single timer heap and expose
+their metrics through one Prometheus endpoint
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+from prometheus_client import CollectorRegistry, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Add parent directory to path for the shared node behaviour and control codec
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from control_codec import decode_control
+from iot_simulator.node import CONTROL_ENCODINGS, PRIORITY_LEVELS, apply_control, default_config, sensor_reading
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class VirtualNode:
+    """State of one simulated node; behaves like iot_simulator.node.IoTNode on the wire"""
+
+    __slots__ = ('node_id', 'config', 'connection', 'generation', 'published', 'failed',
+                 'received', 'control_bytes', 'bytes_sent', 'last_payload_bytes', 'reading')
+
+    def __init__(self, node_id: str):
+        self.node_id = node_id
+        self.config = default_config()
+        self.connection: Optional['SharedConnection'] = None
+        # Bumped when the schedule changes; older heap entries are then skipped
+        self.generation = 0
+        self.published = 0
+        self.failed = 0
+        self.received = 0
+        self.control_bytes = 0
+        self.bytes_sent = 0
+        self.last_payload_bytes = 0
+        self.reading: Dict = {}
+
+    @property
+    def data_topic(self) -> str:
+        return f"iot/{self.node_id}/data"
+
+    @property
+    def control_topic(self) -> str:
+        return f"iot/{self.node_id}/control"
+
+    @property
+    def status_topic(self) -> str:
+        return f"iot/{self.node_id}/status"
+
+    def status(self, online: bool = True, traceparent: Optional[str] = None) -> Dict:
+        status = {
+            'node_id': self.node_id,
+            'timestamp': datetime.now().isoformat(),
+            'config': self.config,
+            'status': 'online' if online else 'offline',
+            'encodings': CONTROL_ENCODINGS
+        }
+        if traceparent:
+            status['traceparent'] = traceparent
+        return status
+
+
+class SharedConnection:
+    """
+    One MQTT client carrying many virtual nodes
+
+    The broker sees one session per connection rather than per node, so a
+    node's retained 'offline' status is published on clean shutdown only
+    (there is a single last will per connection).
+    """
+
+    def __init__(self, client_id: str, nodes: List[VirtualNode], broker_host: str, broker_port: int,
+                 on_control: Callable[[VirtualNode, bytes], None], client_factory=mqtt.Client):
+        self.client_id = client_id
+        self.nodes = {node.control_topic: node for node in nodes}
+        self.broker_host = broker_host
+        self.broker_port = broker_port
+        self.on_control = on_control
+        self.connected = False
+
+        self.client = client_factory(client_id=client_id)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        # QoS 1/2 publishes of every node share the connection's in-flight window
+        self.client.max_inflight_messages_set(max(20, len(nodes)))
+        for node in nodes:
+            node.connection = self
+
+    def start(self):
+        """Connect in the background; paho keeps reconnecting on its network thread"""
+        self.client.connect_async(self.broker_host, self.broker_port, 60)
+        self.client.loop_start()
+
+    def stop(self):
+        for node in self.nodes.values():
+            self.publish_status(node, online=False)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error(f"{self.client_id}: connection failed with code {rc}")
+            return
+        self.connected = True
+        topics = [(topic, 1) for topic in self.nodes]
+        # Keep SUBSCRIBE packets small for brokers with a packet size limit
+        for i in range(0, len(topics), 100):
+            client.subscribe(topics[i:i + 100])
+        for node in self.nodes.values():
+            self.publish_status(node)
+        logger.info(f"{self.client_id}: connected, {len(self.nodes)} nodes online")
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+
+    def on_message(self, client, userdata, msg):
+        node = self.nodes.get(msg.topic)
+        if node:
+            self.on_control(node, msg.payload)
+
+    def publish_status(self, node: VirtualNode, online: bool = True, traceparent: Optional[str] = None):
+        self.client.publish(node.status_topic, json.dumps(node.status(online, traceparent)), qos=1, retain=True)
+
+
+class FleetSimulator:
+    """
+    Hosts many virtual nodes on one event loop
+
+    Every node's next publish sits on one heap ordered by due time; a single
+    scheduler task pops what is due, publishes it and pushes the node back
+    one sampling interval later. A node's simulated latency delays its
+    publishes relative to when the reading was taken.
+    """
+
+    def __init__(self, node_count: int, broker_host: str = 'localhost', broker_port: int = 1883,
+                 nodes_per_connection: int = 500, prefix: str = 'node', first_index: int = 1,
+                 client_factory=mqtt.Client):
+        self.nodes = [VirtualNode(f"{prefix}-{first_index + i}") for i in range(node_count)]
+        self.connections = [
+            SharedConnection(f"fleet-{prefix}-{first_index + i}", self.nodes[i:i + nodes_per_connection],
+                             broker_host, broker_port, self._on_control, client_factory=client_factory)
+            for i in range(0, node_count, nodes_per_connection)
+        ]
+        self._heap: List[Tuple[float, int, int]] = []
+        self._index = {node.node_id: i for i, node in enumerate(self.nodes)}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.running = False
+
+    def schedule_all(self, now: float):
+        """Spread first publishes over one interval so nodes do not publish in lockstep"""
+        self._heap = [
+            (now + random.uniform(0, node.config['sampling_rate']) + node.config['latency'] / 1000.0,
+             i, node.generation)
+            for i, node in enumerate(self.nodes)
+        ]
+        heapq.heapify(self._heap)
+
+    def tick(self, now: float) -> Optional[float]:
+        """
+        Publish everything due at `now`
+
+        Returns:
+            When the next publish is due (None if nothing is scheduled)
+        """
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, i, generation = heapq.heappop(heap)
+            node = self.nodes[i]
+            if generation != node.generation:
+                continue
+            self.publish_data(node)
+            heapq.heappush(heap, (due + node.config['sampling_rate'], i, generation))
+        return heap[0][0] if heap else None
+
+    def publish_data(self, node: VirtualNode):
+        if not node.config['enabled']:
+            return
+        data = sensor_reading(node.node_id)
+        payload = json.dumps(data)
+        result = node.connection.client.publish(node.data_topic, payload, qos=node.config['qos'])
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            node.published += 1
+            node.last_payload_bytes = len(payload)
+            node.bytes_sent += node.last_payload_bytes
+            node.reading = data
+        else:
+            node.failed += 1
+
+    def _on_control(self, node: VirtualNode, payload: bytes):
+        # Called on a paho network thread; node state is only touched on the loop
+        if self._loop:
+            self._loop.call_soon_threadsafe(self.apply_control, node, payload, self._loop.time())
+        else:
+            self.apply_control(node, payload, time.monotonic())
+
+    def apply_control(self, node: VirtualNode, payload: bytes, now: float):
+        """Apply a control message and reschedule the node if its timing changed"""
+        try:
+            message = decode_control(payload)
+            changes = apply_control(node.config, message)
+        except Exception as e:
+            logger.error(f"{node.node_id}: invalid control message: {e}")
+            return
+        node.received += 1
+        node.control_bytes += len(payload)
+
+        if 'sampling_rate' in changes or 'latency' in changes or 'enabled' in changes:
+            node.generation += 1
+            heapq.heappush(self._heap, (now + node.config['latency'] / 1000.0,
+                                        self._index[node.node_id], node.generation))
+            if self._wakeup:
+                self._wakeup.set()
+        # Acknowledge, echoing the controller's trace context
+        node.connection.publish_status(node, traceparent=message.get('traceparent'))
+
+    async def run(self, duration: Optional[float] = None):
+        """Connect all shared connections and publish until stopped (or for `duration` seconds)"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.running = True
+        for connection in self.connections:
+            connection.start()
+
+        started = self._loop.time()
+        self.schedule_all(started)
+        logger.info(f"Fleet of {len(self.nodes)} nodes on {len(self.connections)} MQTT connections")
+        try:
+            while self.running and (duration is None or self._loop.time() - started < duration):
+                next_due = self.tick(self._loop.time())
+                delay = 1.0 if next_due is None else max(0.0, next_due - self._loop.time())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.running = False
+            for connection in self.connections:
+                connection.stop()
+
+    def stop(self):
+        self.running = False
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+
+class FleetCollector:
+    """
+    Prometheus collector for every node of a fleet
+
+    Exports the per-node series of iot_simulator.node (labelled by node_id)
+    plus the series the feedback engine queries (iot_latency_ms,
+    iot_messages_sent_total, iot_bandwidth_bytes). Values are read from
+    node state at scrape time, so publishing costs no metric updates.
+    """
+
+    def __init__(self, fleet: FleetSimulator):
+        self.fleet = fleet
+
+    def collect(self):
+        nodes = self.fleet.nodes
+        labels = ['node_id']
+
+        def counter(name, documentation, value):
+            family = CounterMetricFamily(name, documentation, labels=labels)
+            for node in nodes:
+                family.add_metric([node.node_id], value(node))
+            return family
+
+        def gauge(name, documentation, value):
+            family = GaugeMetricFamily(name, documentation, labels=labels)
+            for node in nodes:
+                family.add_metric([node.node_id], value(node))
+            return family
+
+        yield counter('mqtt_messages_published', 'Total MQTT messages published', lambda n: n.published)
+        yield counter('mqtt_messages_received', 'Total MQTT control messages received', lambda n: n.received)
+        yield counter('control_bytes_received', 'Total bytes of control messages received',
+                      lambda n: n.control_bytes)
+        yield counter('node_bytes_sent', 'Total bytes sent via MQTT', lambda n: n.bytes_sent)
+        yield gauge('mqtt_qos_level', 'Current MQTT QoS level (0, 1, or 2)', lambda n: n.config['qos'])
+        yield gauge('mqtt_publish_interval_seconds', 'Seconds between data publishes (sampling rate)',
+                    lambda n: n.config['sampling_rate'])
+        yield gauge('node_enabled', 'Whether node is enabled (1) or disabled (0)',
+                    lambda n: 1 if n.config['enabled'] else 0)
+        yield gauge('node_latency_milliseconds', 'Simulated network latency in milliseconds',
+                    lambda n: n.config['latency'])
+
+        priority = GaugeMetricFamily('node_priority', 'Node priority level (1=low, 2=normal, 3=high)',
+                                     labels=['node_id', 'priority'])
+        for node in nodes:
+            priority.add_metric([node.node_id, node.config['priority']],
+                                PRIORITY_LEVELS.get(node.config['priority'], 2))
+        yield priority
+
+        for name, key, documentation in (('iot_temperature_celsius', 'temperature', 'Current temperature reading'),
+                                         ('iot_humidity_percent', 'humidity', 'Current humidity reading'),
+                                         ('iot_pressure_hpa', 'pressure', 'Current pressure reading'),
+                                         ('iot_battery_percent', 'battery', 'Current battery level')):
+            family = GaugeMetricFamily(name, documentation, labels=labels)
+            for node in nodes:
+                if key in node.reading:
+                    family.add_metric([node.node_id], node.reading[key])
+            yield family
+
+        # Series read by the controller's feedback engine
+        yield gauge('iot_latency_ms', 'Simulated latency in milliseconds', lambda n: n.config['latency'])
+        yield counter('iot_messages_sent', 'Total data messages sent', lambda n: n.published)
+        yield gauge('iot_bandwidth_bytes', 'Data bytes per second at the current sampling rate',
+                    lambda n: n.last_payload_bytes / n.config['sampling_rate'] if n.config['enabled'] else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a fleet of IoT nodes in one process')
+    parser.add_argument('--nodes', type=int, default=int(os.getenv('FLEET_NODES', '1000')))
+    parser.add_argument('--prefix', default=os.getenv('FLEET_NODE_PREFIX', 'node'),
+                        help='Node IDs are <prefix>-<n>')
+    parser.add_argument('--first-index', type=int, default=int(os.getenv('FLEET_FIRST_INDEX', '1')))
+    parser.add_argument('--nodes-per-connection', type=int,
+                        default=int(os.getenv('FLEET_NODES_PER_CONNECTION', '500')))
+    parser.add_argument('--broker', default=os.getenv('MQTT_BROKER', 'localhost'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MQTT_PORT', '1883')))
+    parser.add_argument('--metrics-port', type=int, default=int(os.getenv('FLEET_METRICS_PORT', '8000')))
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds')
+    args = parser.parse_args()
+
+    fleet = FleetSimulator(args.nodes, args.broker, args.port,
+                           nodes_per_connection=args.nodes_per_connection,
+                           prefix=args.prefix, first_index=args.first_index)
+
+    registry = CollectorRegistry()
+    registry.register(FleetCollector(fleet))
+    start_http_server(args.metrics_port, registry=registry)
+    logger.info(f"Metrics for all nodes at http://localhost:{args.metrics_port}/metrics")
+
+    try:
+        asyncio.run(fleet.run(args.duration))
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,18 @@ import json
 import time
 import random
 import logging
+import heapq
+import itertools
 import os
+import sys
+import threading
 from datetime import datetime
-from prometheus_client import start_http_server, Counter, Gauge, Info
+from prometheus_client import start_http_server, Counter, Gauge, Histogram, Info
+
+# Add parent directory to path for the shared control codec
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from control_codec import SUPPORTED_ENCODINGS, decode_control
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,6 +28,9 @@ logger = logging.getLogger(__name__)
 # Get node ID early for metric labels
 NODE_ID = os.getenv('NODE_ID', 'node-1')
 
+# Control message encodings advertised to the controller (json is always accepted)
+CONTROL_ENCODINGS = [e for e in os.getenv('CONTROL_ENCODINGS', ','.join(SUPPORTED_ENCODINGS)).split(',') if e]
+
 # ============== Prometheus Metrics ==============
 # These metrics match what's documented in MONITORING_GUIDE.md
 
@@ -33,6 +45,11 @@ mqtt_messages_received_total = Counter(
     'Total MQTT control messages received', 
     ['node_id']
 )
+control_bytes_received_total = Counter(
+    'control_bytes_received_total',
+    'Total bytes of control messages received',
+    ['node_id']
+)
 
 # Configuration gauges (set via intents)
 mqtt_qos_level = Gauge(
@@ -67,6 +84,17 @@ node_latency_milliseconds = Gauge(
     'Simulated network latency in milliseconds',
     ['node_id']
 )
+node_send_delay_milliseconds = Histogram(
+    'node_send_delay_milliseconds',
+    'Simulated delay between taking a reading and publishing it (latency + jitter)',
+    ['node_id'],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+node_messages_dropped_total = Counter(
+    'node_messages_dropped_total',
+    'Readings dropped by simulated packet loss',
+    ['node_id']
+)
 
 # Sensor data gauges
 iot_temperature_celsius = Gauge(
@@ -93,6 +121,124 @@ iot_battery_percent = Gauge(
 # Node info
 node_info = Info('iot_node', 'IoT node information')
 
+# Priority as exported by node_priority
+PRIORITY_LEVELS = {'low': 1, 'normal': 2, 'high': 3}
+
+
+JITTER_DISTRIBUTIONS = ('none', 'uniform', 'normal', 'exponential')
+
+
+def default_config():
+    """Configuration a node starts with (modifiable via MQTT control messages)"""
+    return {
+        'sampling_rate': 5,  # seconds
+        'qos': 0,
+        'priority': 'normal',
+        'bandwidth_limit': None,
+        'enabled': True,
+        'latency': int(os.getenv('NODE_LATENCY_MS', '10')),  # simulated latency in ms
+        'jitter': float(os.getenv('NODE_JITTER_MS', '0')),  # spread of the latency in ms
+        'jitter_distribution': os.getenv('NODE_JITTER_DISTRIBUTION', 'uniform'),
+        'packet_loss': float(os.getenv('NODE_PACKET_LOSS', '0')),  # fraction of readings lost
+        'loss_burst': float(os.getenv('NODE_LOSS_BURST', '1'))  # mean consecutive losses
+    }
+
+
+def apply_control(config, payload):
+    """
+    Apply a decoded control message to a node configuration
+    
+    Returns:
+        dict: The settings that were present in the message, with their new values
+    """
+    changes = {}
+    if payload.get('sampling_rate') is not None:
+        changes['sampling_rate'] = int(payload['sampling_rate'])
+    if 'qos' in payload:
+        changes['qos'] = int(payload['qos'])
+    if 'priority' in payload:
+        changes['priority'] = payload['priority']
+    if 'enabled' in payload:
+        changes['enabled'] = payload['enabled']
+    if 'latency' in payload:
+        changes['latency'] = int(payload['latency'])
+    if 'jitter' in payload:
+        changes['jitter'] = max(0.0, float(payload['jitter']))
+    if payload.get('jitter_distribution') in JITTER_DISTRIBUTIONS:
+        changes['jitter_distribution'] = payload['jitter_distribution']
+    if 'packet_loss' in payload:
+        changes['packet_loss'] = min(max(float(payload['packet_loss']), 0.0), 1.0)
+    if 'loss_burst' in payload:
+        changes['loss_burst'] = max(1.0, float(payload['loss_burst']))
+    config.update(changes)
+    return changes
+
+
+class LatencyModel:
+    """
+    Per-reading network delay and loss, drawn from a node's configuration
+    
+    Delay is `latency` plus jitter drawn from `jitter_distribution`:
+    uniform in ±jitter, normal with standard deviation jitter, or
+    exponential with mean jitter (a long tail, never early). Loss is
+    independent per reading when `loss_burst` is 1; above that it follows a
+    two-state (Gilbert) model whose bursts average `loss_burst` readings
+    while the long-run loss rate stays `packet_loss`.
+    """
+    
+    def __init__(self, rng=None):
+        self.rng = rng or random.Random()
+        self._in_burst = False
+    
+    def delay(self, config):
+        """Seconds between taking a reading and publishing it"""
+        delay_ms = config['latency']
+        jitter = config.get('jitter', 0)
+        distribution = config.get('jitter_distribution', 'uniform')
+        if jitter > 0:
+            if distribution == 'uniform':
+                delay_ms += self.rng.uniform(-jitter, jitter)
+            elif distribution == 'normal':
+                delay_ms += self.rng.gauss(0, jitter)
+            elif distribution == 'exponential':
+                delay_ms += self.rng.expovariate(1.0 / jitter)
+        return max(delay_ms, 0.0) / 1000.0
+    
+    def dropped(self, config):
+        """Whether the next reading is lost"""
+        loss = config.get('packet_loss', 0.0)
+        if loss <= 0:
+            self._in_burst = False
+            return False
+        if loss >= 1:
+            return True
+        
+        burst = config.get('loss_burst', 1.0)
+        if burst <= 1:
+            return self.rng.random() < loss
+        
+        # Leave a burst with probability 1/burst; enter one so that the
+        # stationary share of lost readings is `loss`
+        leave = 1.0 / burst
+        enter = min(1.0, loss * leave / (1.0 - loss))
+        if self._in_burst:
+            self._in_burst = self.rng.random() >= leave
+        else:
+            self._in_burst = self.rng.random() < enter
+        return self._in_burst
+
+
+def sensor_reading(node_id):
+    """Generate simulated sensor data"""
+    return {
+        'node_id': node_id,
+        'timestamp': datetime.now().isoformat(),
+        'temperature': round(20 + random.uniform(-5, 5), 2),
+        'humidity': round(50 + random.uniform(-10, 10), 2),
+        'pressure': round(1013 + random.uniform(-20, 20), 2),
+        'battery': round(random.uniform(80, 100), 1)
+    }
+
 
 class IoTNode:
     """Simulates an IoT device with Prometheus metrics"""
@@ -103,14 +249,7 @@ class IoTNode:
         self.broker_port = broker_port
         
         # Node configuration (modifiable via MQTT control messages)
-        self.config = {
-            'sampling_rate': 5,  # seconds
-            'qos': 0,
-            'priority': 'normal',
-            'bandwidth_limit': None,
-            'enabled': True,
-            'latency': 10  # simulated latency in ms
-        }
+        self.config = default_config()
         
         # Initialize Prometheus metrics with current config
         self._update_prometheus_metrics()
@@ -132,6 +271,17 @@ class IoTNode:
         self.control_topic = f"iot/{node_id}/control"
         self.status_topic = f"iot/{node_id}/status"
         
+        # Readings are taken on a fixed grid and published after their
+        # simulated delay; nothing in the loop sleeps for latency
+        self.latency_model = LatencyModel()
+        self._pending = []  # heap of (send_at, seq, reading)
+        self._seq = itertools.count()
+        self._next_sample = None
+        self._last_sample = None
+        self._rate_changed = False
+        # Set by control messages so the loop reacts without waiting out an interval
+        self._wakeup = threading.Event()
+        
         self.running = False
     
     def _update_prometheus_metrics(self):
@@ -143,8 +293,7 @@ class IoTNode:
         mqtt_publish_interval_seconds.labels(node_id=self.node_id).set(self.config['sampling_rate'])
         
         # Priority (convert to numeric: low=1, normal=2, high=3)
-        priority_map = {'low': 1, 'normal': 2, 'high': 3}
-        priority_val = priority_map.get(self.config['priority'], 2)
+        priority_val = PRIORITY_LEVELS.get(self.config['priority'], 2)
         node_priority.labels(node_id=self.node_id, priority=self.config['priority']).set(priority_val)
         
         # Enabled status
@@ -167,48 +316,39 @@ class IoTNode:
     def on_message(self, client, userdata, msg):
         """Handle incoming control messages"""
         try:
-            payload = json.loads(msg.payload.decode())
+            payload = decode_control(msg.payload)
             logger.info(f"Received control message: {payload}")
             mqtt_messages_received_total.labels(node_id=self.node_id).inc()
+            control_bytes_received_total.labels(node_id=self.node_id).inc(len(msg.payload))
             
             # Update configuration
-            if 'sampling_rate' in payload:
-                self.config['sampling_rate'] = int(payload['sampling_rate'])
-                logger.info(f"Updated sampling rate to {payload['sampling_rate']}s")
-            
-            if 'qos' in payload:
-                self.config['qos'] = int(payload['qos'])
-                logger.info(f"Updated QoS to {payload['qos']}")
-            
-            if 'priority' in payload:
-                self.config['priority'] = payload['priority']
-                logger.info(f"Updated priority to {payload['priority']}")
-            
-            if 'enabled' in payload:
-                self.config['enabled'] = payload['enabled']
-                logger.info(f"Node enabled: {payload['enabled']}")
-            
-            if 'latency' in payload:
-                self.config['latency'] = int(payload['latency'])
-                logger.info(f"Updated latency to {payload['latency']}ms")
+            changes = apply_control(self.config, payload)
+            for key, value in changes.items():
+                logger.info(f"Updated {key} to {value}")
+            if 'sampling_rate' in changes:
+                self._rate_changed = True
+                self._wakeup.set()
             
             # Update Prometheus metrics with new config
             self._update_prometheus_metrics()
             
-            # Acknowledge configuration change
-            self.publish_status()
+            # Acknowledge configuration change, echoing the controller's trace context
+            self.publish_status(traceparent=payload.get('traceparent'))
             
         except Exception as e:
             logger.error(f"Error processing control message: {e}")
     
-    def publish_status(self):
+    def publish_status(self, traceparent=None):
         """Publish current node status"""
         status = {
             'node_id': self.node_id,
             'timestamp': datetime.now().isoformat(),
             'config': self.config,
-            'status': 'online' if self.running else 'offline'
+            'status': 'online' if self.running else 'offline',
+            'encodings': CONTROL_ENCODINGS
         }
+        if traceparent:
+            status['traceparent'] = traceparent
         
         self.client.publish(
             self.status_topic,
@@ -219,27 +359,64 @@ class IoTNode:
     
     def generate_sensor_data(self):
         """Generate simulated sensor data"""
-        return {
-            'node_id': self.node_id,
-            'timestamp': datetime.now().isoformat(),
-            'temperature': round(20 + random.uniform(-5, 5), 2),
-            'humidity': round(50 + random.uniform(-10, 10), 2),
-            'pressure': round(1013 + random.uniform(-20, 20), 2),
-            'battery': round(random.uniform(80, 100), 1)
-        }
+        return sensor_reading(self.node_id)
     
-    def publish_data(self):
-        """Publish sensor data and update Prometheus metrics"""
+    def sample(self, now):
+        """Take a reading and schedule its publish after the simulated delay"""
         if not self.config['enabled']:
             return
         
-        data = self.generate_sensor_data()
+        if self.latency_model.dropped(self.config):
+            node_messages_dropped_total.labels(node_id=self.node_id).inc()
+            return
+        
+        delay = self.latency_model.delay(self.config)
+        node_send_delay_milliseconds.labels(node_id=self.node_id).observe(delay * 1000.0)
+        heapq.heappush(self._pending, (now + delay, next(self._seq), self.generate_sensor_data()))
+    
+    def step(self, now):
+        """
+        Take the reading due at `now` and publish readings whose delay has passed
+        
+        Readings are due at fixed multiples of the sampling rate from the
+        first one, so the publish rate matches the configured rate exactly
+        however long each step takes. A changed rate applies from the last
+        reading.
+        
+        Returns:
+            float: Time of the next reading or publish
+        """
+        rate = self.config['sampling_rate']
+        if self._next_sample is None:
+            self._next_sample = now
+        elif self._rate_changed:
+            self._rate_changed = False
+            self._next_sample = max(now, self._last_sample + rate)
+        
+        if now >= self._next_sample:
+            self._last_sample = self._next_sample
+            self.sample(now)
+            self._next_sample += rate
+            if self._next_sample <= now:
+                # Fell a whole interval behind (e.g. suspended): skip, do not burst
+                missed = int((now - self._next_sample) // rate) + 1
+                self._next_sample += missed * rate
+        
+        while self._pending and self._pending[0][0] <= now:
+            _, _, data = heapq.heappop(self._pending)
+            self.publish_data(data)
+        
+        return min(self._next_sample, self._pending[0][0]) if self._pending else self._next_sample
+    
+    def publish_data(self, data=None):
+        """Publish sensor data and update Prometheus metrics"""
+        if data is None:
+            if not self.config['enabled']:
+                return
+            data = self.generate_sensor_data()
         payload = json.dumps(data)
         payload_bytes = len(payload.encode())
         
-        # Simulate latency
-        time.sleep(self.config['latency'] / 1000.0)
-        
         result = self.client.publish(
             self.data_topic,
             payload,
@@ -279,8 +456,9 @@ class IoTNode:
             
             # Main data publishing loop
             while self.running:
-                self.publish_data()
-                time.sleep(self.config['sampling_rate'])
+                self._wakeup.clear()
+                wake_at = self.step(time.monotonic())
+                self._wakeup.wait(max(0.0, wake_at - time.monotonic()))
                 
         except KeyboardInterrupt:
             logger.info("Shutting down...")
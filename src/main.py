@@ -8,18 +8,21 @@ import sys
 import signal
 import logging
 import threading
-import time
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 import yaml
 
 # Add src to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from intent_manager.api import app as flask_app, intent_manager
-from enforcement.network import NetworkEnforcer
-from enforcement.device import DeviceEnforcer
-from feedback.monitor import FeedbackEngine
+# Components are imported when they are initialized, so loading the controller
+# (e.g. for --check-config, or from wsgi.py before a fork) stays cheap
+if TYPE_CHECKING:
+    from enforcement.network import NetworkEnforcer
+    from enforcement.device import DeviceEnforcer
+    from feedback.monitor import FeedbackEngine
+    from feedback.remediation import RemediationExecutor
+    from feedback.scheduler import FeedbackScheduler
 
 # Setup logging
 logging.basicConfig(
@@ -32,23 +35,36 @@ logger = logging.getLogger(__name__)
 class ImperiumController:
     """Main controller for the Imperium IBN system"""
     
-    def __init__(self, config_path: str = None):
-        """Initialize the controller"""
+    def __init__(self, config_path: str = None, handle_signals: bool = True):
+        """
+        Initialize the controller
+        
+        Args:
+            config_path: Optional configuration file
+            handle_signals: Install SIGINT/SIGTERM handlers (off when a WSGI
+                server such as gunicorn owns the process's signals)
+        """
         self.config = self._load_config(config_path)
         self.running = False
         
         # Components
-        self.network_enforcer: Optional[NetworkEnforcer] = None
-        self.device_enforcer: Optional[DeviceEnforcer] = None
-        self.feedback_engine: Optional[FeedbackEngine] = None
+        self.network_enforcer: Optional['NetworkEnforcer'] = None
+        self.device_enforcer: Optional['DeviceEnforcer'] = None
+        self.feedback_engine: Optional['FeedbackEngine'] = None
+        self.remediation_executor: Optional['RemediationExecutor'] = None
         
         # Threads
-        self.feedback_thread: Optional[threading.Thread] = None
+        self.feedback_scheduler: Optional['FeedbackScheduler'] = None
         self.api_thread: Optional[threading.Thread] = None
+        self.api_server = None
+        
+        # Last feedback state published per intent (only changes are streamed)
+        self._feedback_states: dict = {}
         
         # Setup signal handlers
-        signal.signal(signal.SIGINT, self._signal_handler)
-        signal.signal(signal.SIGTERM, self._signal_handler)
+        if handle_signals:
+            signal.signal(signal.SIGINT, self._signal_handler)
+            signal.signal(signal.SIGTERM, self._signal_handler)
     
     def _load_config(self, config_path: str = None) -> dict:
         """Load configuration from .env or config file"""
@@ -56,6 +72,15 @@ class ImperiumController:
             # MQTT
             'mqtt_broker_host': os.getenv('MQTT_BROKER_HOST', 'localhost'),
             'mqtt_broker_port': int(os.getenv('MQTT_BROKER_PORT', '1883')),
+            'mqtt_client_id': os.getenv('MQTT_CLIENT_ID', 'device-enforcer'),
+            'mqtt_reconnect_min_delay': int(os.getenv('MQTT_RECONNECT_MIN_DELAY', '1')),
+            'mqtt_reconnect_max_delay': int(os.getenv('MQTT_RECONNECT_MAX_DELAY', '60')),
+            'mqtt_outbox_path': os.getenv('MQTT_OUTBOX_PATH', 'data/mqtt_outbox.json'),
+            'mqtt_outbox_size': int(os.getenv('MQTT_OUTBOX_SIZE', '1000')),
+            'device_stale_after': float(os.getenv('DEVICE_STALE_AFTER_SECONDS', '0')) or None,
+            'device_max_devices': int(os.getenv('DEVICE_REGISTRY_MAX', '100000')),
+            'control_encoding': os.getenv('CONTROL_ENCODING', 'auto'),
+            'command_debounce_ms': int(os.getenv('DEVICE_COMMAND_DEBOUNCE_MS', '200')),
             
             # Network
             'network_interface': os.getenv('NETWORK_INTERFACE', 'eth0'),
@@ -64,11 +89,35 @@ class ImperiumController:
             # API
             'api_host': os.getenv('API_HOST', '0.0.0.0'),
             'api_port': int(os.getenv('API_PORT', '5000')),
-            'api_debug': os.getenv('API_DEBUG', 'true').lower() == 'true',
+            'api_debug': os.getenv('API_DEBUG', 'false').lower() == 'true',
+            'api_server': os.getenv('API_SERVER', 'waitress'),
+            'api_threads': int(os.getenv('API_THREADS', '8')),
+            'api_workers': int(os.getenv('API_WORKERS', '1')),
+            'api_keepalive': int(os.getenv('API_KEEPALIVE_SECONDS', '5')),
+            'api_backlog': int(os.getenv('API_BACKLOG', '1024')),
+            'api_max_connections': int(os.getenv('API_MAX_CONNECTIONS', '1000')),
             
             # Feedback
             'feedback_enabled': os.getenv('FEEDBACK_ENABLED', 'true').lower() == 'true',
             'feedback_interval': int(os.getenv('FEEDBACK_CHECK_INTERVAL_SECONDS', '30')),
+            'feedback_query_workers': int(os.getenv('FEEDBACK_QUERY_WORKERS', '8')),
+            'feedback_scheduler_workers': int(os.getenv('FEEDBACK_SCHEDULER_WORKERS', '4')),
+            'feedback_min_retrigger': float(os.getenv('FEEDBACK_MIN_RETRIGGER_SECONDS', '5')),
+            'feedback_history_size': int(os.getenv('FEEDBACK_HISTORY_SIZE', '1000')),
+            'feedback_metrics_source': os.getenv('FEEDBACK_METRICS_SOURCE', 'prometheus'),
+            'feedback_metrics_file': os.getenv('FEEDBACK_METRICS_FILE', 'data/recorded_metrics.jsonl'),
+            'feedback_violation_threshold': int(os.getenv('FEEDBACK_VIOLATION_THRESHOLD', '3')),
+            'feedback_min_breach_seconds': float(os.getenv('FEEDBACK_MIN_BREACH_SECONDS', '0')),
+            'feedback_hysteresis': float(os.getenv('FEEDBACK_HYSTERESIS', '0.1')),
+            'feedback_ewma_alpha': float(os.getenv('FEEDBACK_EWMA_ALPHA', '1.0')),
+            'feedback_trend_horizon': float(os.getenv('FEEDBACK_TREND_HORIZON_SECONDS', '120')),
+            'auto_remediate': os.getenv('FEEDBACK_AUTO_REMEDIATE', 'false').lower() == 'true',
+            'remediation_cooldown': float(os.getenv('REMEDIATION_COOLDOWN_SECONDS', '300')),
+            'remediation_max_actions': int(os.getenv('REMEDIATION_MAX_ACTIONS_PER_HOUR', '4')),
+            'remediation_max_step': float(os.getenv('REMEDIATION_MAX_STEP', '0.5')),
+            'remediation_verify_window': float(os.getenv('REMEDIATION_VERIFY_SECONDS', '120')),
+            'remediation_rollback_tolerance': float(os.getenv('REMEDIATION_ROLLBACK_TOLERANCE', '0.1')),
+            'remediation_default_rate': float(os.getenv('REMEDIATION_DEFAULT_RATE_MBPS', '10')),
             
             # Prometheus
             'prometheus_url': os.getenv('PROMETHEUS_URL', 'http://localhost:9090'),
@@ -91,6 +140,14 @@ class ImperiumController:
     
     def initialize_components(self):
         """Initialize all system components"""
+        from intent_manager.api import intent_manager
+        from enforcement.network import NetworkEnforcer
+        from enforcement.device import DeviceEnforcer
+        from feedback.monitor import FeedbackEngine
+        from feedback.detection import ViolationDetector
+        from feedback.remediation import RemediationExecutor
+        from feedback.sources import create_source
+        
         logger.info("Initializing Imperium components...")
         
         # 1. Network Enforcer
@@ -104,21 +161,50 @@ class ImperiumController:
         logger.info("Initializing Device Enforcer...")
         self.device_enforcer = DeviceEnforcer(
             broker_host=self.config['mqtt_broker_host'],
-            broker_port=self.config['mqtt_broker_port']
+            broker_port=self.config['mqtt_broker_port'],
+            client_id=self.config['mqtt_client_id'],
+            outbox_path=self.config['mqtt_outbox_path'],
+            outbox_size=self.config['mqtt_outbox_size'],
+            reconnect_min_delay=self.config['mqtt_reconnect_min_delay'],
+            reconnect_max_delay=self.config['mqtt_reconnect_max_delay'],
+            device_stale_after=self.config['device_stale_after'],
+            device_max_devices=self.config['device_max_devices'],
+            control_encoding=self.config['control_encoding'],
+            command_debounce=self.config['command_debounce_ms'] / 1000.0
         )
+        self.device_enforcer.registry.register_from_config(self.config.get('devices'))
         
         try:
-            self.device_enforcer.connect()
-            logger.info("✓ Device Enforcer connected to MQTT broker")
+            if self.device_enforcer.connect():
+                logger.info("✓ Device Enforcer connected to MQTT broker")
+            else:
+                logger.warning("MQTT broker unreachable, Device Enforcer will keep retrying "
+                               "and replay queued control messages on reconnect")
         except Exception as e:
-            logger.error(f"Failed to connect Device Enforcer: {e}")
+            logger.error(f"Failed to start Device Enforcer: {e}")
             logger.warning("Continuing without MQTT enforcement...")
         
         # 3. Feedback Engine
         if self.config['feedback_enabled']:
             logger.info("Initializing Feedback Engine...")
             self.feedback_engine = FeedbackEngine(
-                prometheus_url=self.config['prometheus_url']
+                prometheus_url=self.config['prometheus_url'],
+                max_workers=self.config['feedback_query_workers'],
+                source=create_source(
+                    self.config['feedback_metrics_source'],
+                    prometheus_url=self.config['prometheus_url'],
+                    pool_size=self.config['feedback_query_workers'],
+                    path=self.config['feedback_metrics_file'],
+                    nodes=list((self.config.get('devices') or {}).get('devices', {})) or None
+                ),
+                history_size=self.config['feedback_history_size'],
+                detector=ViolationDetector(
+                    min_breach_samples=self.config['feedback_violation_threshold'],
+                    min_breach_seconds=self.config['feedback_min_breach_seconds'],
+                    hysteresis=self.config['feedback_hysteresis'],
+                    ewma_alpha=self.config['feedback_ewma_alpha'],
+                    trend_horizon=self.config['feedback_trend_horizon']
+                )
             )
             logger.info("✓ Feedback Engine initialized")
         else:
@@ -129,64 +215,175 @@ class ImperiumController:
         intent_manager.network_enforcer = self.network_enforcer
         intent_manager.device_enforcer = self.device_enforcer
         intent_manager.feedback_engine = self.feedback_engine
+        self.device_enforcer.change_listeners.append(
+            lambda record: intent_manager.publish('device', record.to_dict())
+        )
         logger.info("✓ Components integrated")
         
+        # 5. Auto-remediation (closes the feedback loop)
+        if self.feedback_engine and self.config['auto_remediate']:
+            self.remediation_executor = RemediationExecutor(
+                generate=intent_manager.policy_engine.generate_policies,
+                enforce=intent_manager.enforce_policies,
+                withdraw=intent_manager.withdraw_policy,
+                cooldown=self.config['remediation_cooldown'],
+                max_actions=self.config['remediation_max_actions'],
+                max_step=self.config['remediation_max_step'],
+                verify_window=self.config['remediation_verify_window'],
+                rollback_tolerance=self.config['remediation_rollback_tolerance'],
+                default_rate=self.config['remediation_default_rate'],
+                current_rate=intent_manager.policy_engine.effective_rate
+            )
+            logger.info("✓ Auto-remediation enabled")
+        
         logger.info("=" * 60)
         logger.info("All components initialized successfully!")
         logger.info("=" * 60)
     
     def start_feedback_loop(self):
-        """Start the feedback monitoring loop"""
+        """Start event-driven feedback scheduling"""
         if not self.feedback_engine or not self.config['feedback_enabled']:
             return
         
-        def feedback_loop():
-            logger.info("Feedback loop started")
-            interval = self.config['feedback_interval']
+        from intent_manager.api import intent_manager
+        from feedback.scheduler import FeedbackScheduler
+        
+        self.feedback_scheduler = FeedbackScheduler(
+            self.feedback_engine,
+            on_results=self._handle_feedback_results,
+            base_interval=self.config['feedback_interval'],
+            max_workers=self.config['feedback_scheduler_workers'],
+            min_retrigger=self.config['feedback_min_retrigger']
+        )
+        
+        # Re-check intents as soon as their policies are enforced or their devices report
+        intent_manager.feedback_scheduler = self.feedback_scheduler
+        if self.device_enforcer:
+            self.device_enforcer.status_listeners.append(
+                lambda node_id: self.feedback_scheduler.trigger(target=node_id, reason='device_status')
+            )
+        
+        self.feedback_scheduler.start()
+        logger.info(f"✓ Feedback loop started (base interval: {self.config['feedback_interval']}s, "
+                    f"{self.config['feedback_scheduler_workers']} workers)")
+    
+    def _handle_feedback_results(self, results):
+        """Act on one evaluation batch: roll back, recommend and remediate"""
+        # Roll back remediations that made things worse
+        if self.remediation_executor:
+            self.remediation_executor.verify(results)
+        
+        self._publish_feedback_changes(results)
+        
+        for intent_id, satisfaction in results.items():
+            if satisfaction['satisfied'] and not satisfaction.get('warnings'):
+                continue
             
-            while self.running:
-                try:
-                    # Check all registered intents
-                    for intent_id in list(self.feedback_engine.intent_goals.keys()):
-                        satisfaction = self.feedback_engine.check_intent_satisfaction(intent_id)
-                        
-                        if not satisfaction['satisfied']:
-                            logger.warning(f"Intent {intent_id} not satisfied!")
-                            logger.warning(f"Violations: {satisfaction['violations']}")
-                            
-                            # Get recommendations
-                            recommendations = self.feedback_engine.recommend_adjustments(intent_id)
-                            
-                            if recommendations:
-                                logger.info(f"Applying {len(recommendations)} adjustments...")
-                                # TODO: Auto-apply adjustments if enabled
-                                for rec in recommendations:
-                                    logger.info(f"  - {rec['action']}: {rec['reason']}")
-                    
-                    # Sleep until next check
-                    time.sleep(interval)
-                    
-                except Exception as e:
-                    logger.error(f"Error in feedback loop: {e}", exc_info=True)
-                    time.sleep(interval)
-        
-        self.feedback_thread = threading.Thread(target=feedback_loop, daemon=True)
-        self.feedback_thread.start()
-        logger.info(f"✓ Feedback loop started (interval: {self.config['feedback_interval']}s)")
+            if satisfaction['satisfied']:
+                logger.info(f"Intent {intent_id} at risk: {satisfaction['warnings']}")
+            else:
+                logger.warning(f"Intent {intent_id} not satisfied!")
+                logger.warning(f"Violations: {satisfaction['violations']}")
+            
+            # Get recommendations
+            recommendations = self.feedback_engine.recommend_adjustments(
+                intent_id, satisfaction=satisfaction
+            )
+            
+            if recommendations and self.remediation_executor:
+                logger.info(f"Applying {len(recommendations)} adjustments...")
+                outcomes = self.remediation_executor.execute(
+                    intent_id, recommendations, satisfaction
+                )
+                for rec, outcome in zip(recommendations, outcomes):
+                    logger.info(f"  - {rec['action']}: {rec['reason']} "
+                                f"[{outcome['status']}{': ' + outcome['reason'] if 'reason' in outcome else ''}]")
+            elif recommendations:
+                logger.info(f"{len(recommendations)} adjustments recommended (auto-remediation disabled)")
+                for rec in recommendations:
+                    logger.info(f"  - {rec['action']}: {rec['reason']}")
+    
+    def _publish_feedback_changes(self, results):
+        """Stream feedback state when an intent's satisfaction or violated metrics change"""
+        from intent_manager.api import intent_manager
+        
+        for intent_id, satisfaction in results.items():
+            state = (
+                satisfaction['satisfied'],
+                frozenset((v['metric'], v['target']) for v in satisfaction['violations']),
+                frozenset((w['metric'], w['target'], w['state']) for w in satisfaction.get('warnings', []))
+            )
+            if self._feedback_states.get(intent_id) == state:
+                continue
+            self._feedback_states[intent_id] = state
+            intent_manager.publish('feedback', {
+                'intent_id': intent_id,
+                'satisfied': satisfaction['satisfied'],
+                'violations': satisfaction['violations'],
+                'warnings': satisfaction.get('warnings', [])
+            })
     
     def start_api_server(self):
-        """Start the Flask API server in a separate thread"""
-        def run_api():
-            flask_app.run(
+        """
+        Start the API server in a separate thread
+        
+        API_SERVER=waitress (default) serves on a multi-threaded production
+        WSGI server; API_SERVER=uvicorn serves the asyncio variant of the API
+        (intent_manager.asgi_api) from an event loop; API_SERVER=development
+        uses Flask's built-in server.
+        Multi-process serving (API_SERVER=gunicorn) is started by main()
+        instead, with components initialized in each worker (see wsgi.py).
+        """
+        from intent_manager.api import app as flask_app
+        
+        server = self.config['api_server']
+        if server == 'waitress':
+            try:
+                from waitress import create_server
+            except ImportError:
+                logger.warning("waitress is not installed, falling back to the Flask development server")
+                server = 'development'
+        
+        if server == 'waitress':
+            self.api_server = create_server(
+                flask_app,
                 host=self.config['api_host'],
                 port=self.config['api_port'],
-                debug=self.config['api_debug'],
-                use_reloader=False  # Disable reloader in thread
+                threads=self.config['api_threads'],
+                backlog=self.config['api_backlog'],
+                channel_timeout=self.config['api_keepalive'],
+                connection_limit=self.config['api_max_connections'],
+                ident='imperium'
             )
+            run_api = self.api_server.run
+        elif server == 'uvicorn':
+            import uvicorn
+            from intent_manager.asgi_api import app as asgi_app
+            
+            self.api_server = uvicorn.Server(uvicorn.Config(
+                asgi_app,
+                host=self.config['api_host'],
+                port=self.config['api_port'],
+                backlog=self.config['api_backlog'],
+                timeout_keep_alive=self.config['api_keepalive'],
+                limit_concurrency=self.config['api_max_connections'],
+                log_level='info'
+            ))
+            run_api = self.api_server.run
+        else:
+            def run_api():
+                flask_app.run(
+                    host=self.config['api_host'],
+                    port=self.config['api_port'],
+                    debug=self.config['api_debug'],
+                    threaded=True,
+                    use_reloader=False  # Disable reloader in thread
+                )
         
         self.api_thread = threading.Thread(target=run_api, daemon=False)
         self.api_thread.start()
-        logger.info(f"✓ Intent Manager API started on {self.config['api_host']}:{self.config['api_port']}")
+        logger.info(f"✓ Intent Manager API started on {self.config['api_host']}:{self.config['api_port']} "
+                    f"({server}{', %d threads' % self.config['api_threads'] if server == 'waitress' else ''})")
     
     def start(self):
         """Start the Imperium system"""
@@ -231,6 +428,7 @@ class ImperiumController:
         logger.info(f"Prometheus:          {self.config['prometheus_url']}")
         logger.info(f"Network Interface:   {self.config['network_interface']}")
         logger.info(f"Feedback Loop:       {'Enabled' if self.config['feedback_enabled'] else 'Disabled'}")
+        logger.info(f"Auto-Remediation:    {'Enabled' if self.remediation_executor else 'Disabled'}")
         
         if self.config.get('devices'):
             device_count = len(self.config['devices'].get('devices', {}))
@@ -249,8 +447,14 @@ class ImperiumController:
         logger.info("System is ready! Press Ctrl+C to shutdown.")
         logger.info("")
     
-    def shutdown(self):
-        """Shutdown the system gracefully"""
+    def shutdown(self, exit_process: bool = True):
+        """
+        Shutdown the system gracefully
+        
+        Args:
+            exit_process: Exit once shut down (False inside a WSGI worker,
+                whose server handles the exit)
+        """
         if not self.running:
             return
         
@@ -261,10 +465,27 @@ class ImperiumController:
         
         self.running = False
         
+        # Stop accepting API requests
+        if self.api_server:
+            if hasattr(self.api_server, 'should_exit'):
+                self.api_server.should_exit = True  # uvicorn
+            else:
+                self.api_server.close()
+        
         # Stop feedback loop
-        if self.feedback_thread and self.feedback_thread.is_alive():
+        if self.feedback_scheduler:
             logger.info("Stopping feedback loop...")
-            self.feedback_thread.join(timeout=5)
+            self.feedback_scheduler.stop(timeout=5)
+        
+        if self.feedback_engine:
+            self.feedback_engine.close()
+        
+        # Record the last policy status changes
+        try:
+            from intent_manager.api import intent_manager
+            intent_manager.close()
+        except Exception as e:
+            logger.error(f"Error recording policy statuses: {e}")
         
         # Disconnect device enforcer
         if self.device_enforcer:
@@ -289,14 +510,31 @@ class ImperiumController:
         logger.info("=" * 60)
         
         # Exit
-        sys.exit(0)
+        if exit_process:
+            sys.exit(0)
 
 
 def main():
     """Main entry point"""
+    # Validate configuration without starting (or importing) any component
+    if '--check-config' in sys.argv[1:]:
+        args = [arg for arg in sys.argv[1:] if arg != '--check-config']
+        controller = ImperiumController(config_path=args[0] if args else None, handle_signals=False)
+        for key, value in sorted(controller.config.items()):
+            if key != 'devices':
+                print(f"{key:32} {value}")
+        print(f"{'devices':32} {len((controller.config.get('devices') or {}).get('devices', {}))}")
+        return
+    
     # Check for config file argument
     config_path = sys.argv[1] if len(sys.argv) > 1 else None
     
+    # Multi-process serving: gunicorn forks workers that each build their own components
+    if os.getenv('API_SERVER') == 'gunicorn':
+        gunicorn_config = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       'config', 'gunicorn.conf.py')
+        os.execvp(sys.executable, [sys.executable, '-m', 'gunicorn', '-c', gunicorn_config, 'wsgi:application'])
+    
     # Create and start controller
     controller = ImperiumController(config_path=config_path)
     
@@ -2,9 +2,16 @@
 """
 Policy Engine - Transforms intents into actionable policies
 """
+import heapq
 import logging
-from typing import Dict, Any, List
-from dataclasses import dataclass, asdict
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 
 logging.basicConfig(level=logging.INFO)
@@ -32,6 +39,10 @@ class Policy:
     target: str
     parameters: Dict[str, Any]
     priority: int = 5
+    # pending -> enforced -> superseded -> expired (or withdrawn)
+    status: str = 'pending'
+    created_at: float = field(default_factory=time.time)
+    expires_at: Optional[float] = None
     
     def to_dict(self):
         return {
@@ -39,311 +50,409 @@ class Policy:
             'policy_type': self.policy_type.value,
             'target': self.target,
             'parameters': self.parameters,
-            'priority': self.priority
+            'priority': self.priority,
+            'status': self.status,
+            'expires_at': self.expires_at
         }
 
 
+_id_lock = threading.Lock()
+_last_id_ms = 0
+_id_seq = 0
+
+
+def new_policy_id() -> str:
+    """
+    Time-ordered unique policy ID, e.g. policy-0192c3e5a1f7000-9f86d081
+    
+    Millisecond timestamp and a per-process sequence keep IDs sorted by
+    creation; the random suffix keeps them unique across restarts and
+    across worker processes sharing one database.
+    """
+    global _last_id_ms, _id_seq
+    with _id_lock:
+        ms = int(time.time() * 1000)
+        if ms <= _last_id_ms:
+            ms, _id_seq = _last_id_ms, _id_seq + 1
+            if _id_seq > 0xfff:
+                ms, _id_seq = ms + 1, 0
+        else:
+            _id_seq = 0
+        _last_id_ms = ms
+        seq = _id_seq
+    return f"policy-{ms:012x}{seq:03x}-{secrets.token_hex(4)}"
+
+
+class Resolution(Enum):
+    """How the effective policy is chosen among conflicting ones"""
+    PRIORITY = "priority"                  # Highest priority, then most recent
+    RECENCY = "recency"                    # Most recent
+    MOST_RESTRICTIVE = "most_restrictive"  # Lowest rate, then highest priority, then most recent
+
+
+# Policy types not listed resolve by priority
+RESOLUTION_RULES = {
+    # A limit set by one intent is not lifted by another (or by auto-remediation)
+    PolicyType.BANDWIDTH_LIMIT: Resolution.MOST_RESTRICTIVE,
+    # Explicit device commands: the latest one is what the operator wants now
+    PolicyType.DEVICE_CONTROL: Resolution.RECENCY,
+    PolicyType.SAMPLE_RATE: Resolution.RECENCY,
+    PolicyType.PUBLISH_INTERVAL: Resolution.RECENCY,
+    PolicyType.AUDIO_GAIN: Resolution.RECENCY,
+}
+
+_RATE_UNITS = {'kbit': 1e3, 'kbps': 1e3, 'mbit': 1e6, 'mbps': 1e6, 'gbit': 1e9, 'gbps': 1e9}
+
+PolicyKey = Tuple[str, PolicyType]
+
+
+def normalize_target(target: str) -> str:
+    """Device ID in node-X / esp32-... form ('1' -> 'node-1'); fleet-wide targets are kept"""
+    if target and target not in ('all', 'unknown') and not target.startswith(('node-', 'esp32-')):
+        return f"node-{target}"
+    return target
+
+
+def policy_key(policy: Policy) -> PolicyKey:
+    """Index key of a policy: policies with the same key conflict"""
+    return normalize_target(policy.target), policy.policy_type
+
+
+def _rate_bps(rate) -> float:
+    """'15mbps' -> 15e6; unparseable rates are treated as unlimited"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$', str(rate).lower())
+    if not match or (match.group(2) or 'mbps') not in _RATE_UNITS:
+        return float('inf')
+    return float(match.group(1)) * _RATE_UNITS[match.group(2) or 'mbps']
+
+
+class PolicyIndex:
+    """
+    Active policies keyed by (target, policy type), one effective policy per key
+    
+    Conflicting policies stay indexed, so when the effective one is removed the
+    next in line takes over. The index also remembers which policy was last
+    enforced per key, so enforcement only sees keys whose outcome changed.
+    """
+    
+    def __init__(self, rules: Optional[Dict[PolicyType, Resolution]] = None, max_per_key: int = 16):
+        """
+        Args:
+            rules: Resolution per policy type, merged over RESOLUTION_RULES
+            max_per_key: Policies kept per key; beyond that the lowest-ranked one is evicted
+        """
+        self.rules = dict(RESOLUTION_RULES, **(rules or {}))
+        self.max_per_key = max_per_key
+        self._seq = 0
+        # key -> {policy_id: (policy, seq)}
+        self._entries: Dict[PolicyKey, Dict[str, Tuple[Policy, int]]] = {}
+        self._effective: Dict[PolicyKey, Policy] = {}
+        self._enforced: Dict[PolicyKey, Policy] = {}
+        self._keys: Dict[str, PolicyKey] = {}
+        self._lock = threading.RLock()
+    
+    def _rank(self, policy_type: PolicyType, entry: Tuple[Policy, int]):
+        policy, seq = entry
+        rule = self.rules.get(policy_type, Resolution.PRIORITY)
+        if rule is Resolution.RECENCY:
+            return (seq,)
+        if rule is Resolution.MOST_RESTRICTIVE:
+            return (-_rate_bps(policy.parameters.get('rate')), policy.priority, seq)
+        return (policy.priority, seq)
+    
+    def _resolve(self, key: PolicyKey):
+        entries = self._entries.get(key)
+        if entries:
+            self._effective[key] = max(entries.values(), key=lambda e: self._rank(key[1], e))[0]
+        else:
+            self._entries.pop(key, None)
+            self._effective.pop(key, None)
+    
+    def add(self, policy: Policy) -> List[Policy]:
+        """
+        Index a policy and re-resolve its key
+        
+        Returns:
+            Policies evicted to keep the key within max_per_key (never the effective one)
+        """
+        key = policy_key(policy)
+        evicted = []
+        with self._lock:
+            self._seq += 1
+            entries = self._entries.setdefault(key, {})
+            entries[policy.policy_id] = (policy, self._seq)
+            self._keys[policy.policy_id] = key
+            self._resolve(key)
+            while len(entries) > self.max_per_key:
+                effective = self._effective[key].policy_id
+                loser = min((entry for policy_id, entry in entries.items() if policy_id != effective),
+                            key=lambda e: self._rank(key[1], e))[0]
+                del entries[loser.policy_id]
+                del self._keys[loser.policy_id]
+                evicted.append(loser)
+        return evicted
+    
+    def remove(self, policy_id: str) -> Optional[PolicyKey]:
+        """
+        Drop a policy (withdrawn or expired) and re-resolve its key
+        
+        Returns:
+            The key it was indexed under, or None if unknown
+        """
+        with self._lock:
+            key = self._keys.pop(policy_id, None)
+            if key is not None:
+                self._entries[key].pop(policy_id, None)
+                self._resolve(key)
+            return key
+    
+    def effective(self, target: str, policy_type: PolicyType) -> Optional[Policy]:
+        """The policy in effect for a target and type"""
+        return self._effective.get((normalize_target(target), policy_type))
+    
+    def enforced(self, target: str, policy_type: PolicyType) -> Optional[Policy]:
+        """The policy last enforced for a target and type (possibly since removed)"""
+        return self._enforced.get((normalize_target(target), policy_type))
+    
+    def effective_policies(self) -> List[Policy]:
+        with self._lock:
+            return list(self._effective.values())
+    
+    def conflicts(self) -> Dict[PolicyKey, List[str]]:
+        """Keys with more than one policy: effective policy ID first, then the overridden ones"""
+        with self._lock:
+            return {
+                key: [self._effective[key].policy_id] +
+                     [pid for pid in entries if pid != self._effective[key].policy_id]
+                for key, entries in self._entries.items() if len(entries) > 1
+            }
+    
+    def pending(self, keys: Iterable[PolicyKey]) -> List[Policy]:
+        """
+        Effective policies of `keys` that differ from what was last enforced
+        
+        A policy with the same parameters as the enforced one is not returned,
+        so repeated or overridden intents cause no tc or MQTT operations.
+        """
+        changes = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                effective = self._effective.get(key)
+                enforced = self._enforced.get(key)
+                if effective is None:
+                    self._enforced.pop(key, None)
+                elif (enforced is None or enforced.policy_id not in self._keys
+                      or enforced.parameters != effective.parameters):
+                    changes.append(effective)
+        return changes
+    
+    def mark_enforced(self, policy: Policy) -> Optional[str]:
+        """
+        Record a successfully enforced policy
+        
+        Returns:
+            ID of the policy it replaces for its key, if any
+        """
+        key = policy_key(policy)
+        with self._lock:
+            previous = self._enforced.get(key)
+            self._enforced[key] = policy
+        if previous is not None and previous.policy_id != policy.policy_id:
+            return previous.policy_id
+        return None
+
+
 class PolicyEngine:
-    """Generates policies from parsed intents"""
+    """
+    Generates policies from parsed intents and tracks the active ones
+    
+    Only active policies are kept in memory: pending, enforced, or superseded
+    but still next in line. Expired, withdrawn and evicted policies leave, and
+    their history is in the database (via status_listeners).
+    """
     
-    def __init__(self):
-        self.policies = []
-        self.policy_counter = 0
+    def __init__(self, resolution: Optional[Dict[PolicyType, Resolution]] = None,
+                 templates_path: Optional[str] = None, default_ttl: Optional[float] = None,
+                 max_per_key: int = 16, max_active: int = 10000):
+        """
+        Args:
+            resolution: Conflict resolution per policy type (default RESOLUTION_RULES)
+            templates_path: Policy templates file (default: CONFIG_POLICY_TEMPLATES_PATH,
+                else config/policy_templates.yaml)
+            default_ttl: Seconds a policy stays in effect when its intent sets no TTL (None: no expiry)
+            max_per_key: Conflicting policies kept per (target, type)
+            max_active: Active policies kept at most; the oldest overridden ones expire first
+        """
+        from policy_engine.templates import DEFAULT_TEMPLATES_PATH, load_templates
+        
+        # Intent type -> compiled generator; compiled once per file and shared
+        self.templates = load_templates(templates_path or os.getenv('CONFIG_POLICY_TEMPLATES_PATH', DEFAULT_TEMPLATES_PATH))
+        self.default_ttl = default_ttl
+        self.max_active = max_active
+        # policy_id -> policy, oldest first
+        self.active: 'OrderedDict[str, Policy]' = OrderedDict()
+        # (expires_at, policy_id); entries of policies that left early are skipped
+        self._expiry: List[Tuple[float, str]] = []
+        # Called with each policy created (pending) or whose status changed
+        self.status_listeners: List[Callable[[Policy], None]] = []
+        self._lock = threading.RLock()
+        # Active policies by (target, type), resolved to the one in effect
+        self.index = PolicyIndex(resolution, max_per_key)
     
-    def generate_policies(self, parsed_intent: Dict[str, Any]) -> List[Policy]:
+    def generate_policies(self, parsed_intent: Dict[str, Any], ttl: Optional[float] = None) -> List[Policy]:
         """
         Generate policies from parsed intent
         
         Args:
             parsed_intent: Output from IntentParser
+            ttl: Seconds the policies stay in effect (default: default_ttl)
             
         Returns:
             List of Policy objects
         """
-        policies = []
-        intent_type = parsed_intent.get('type')
-        parameters = parsed_intent.get('parameters', {})
-        
-        # Generate policies based on intent type
-        if intent_type == 'priority':
-            policies.extend(self._generate_priority_policies(parameters))
-        
-        elif intent_type == 'bandwidth':
-            policies.extend(self._generate_bandwidth_policies(parameters))
-        
-        elif intent_type == 'latency':
-            policies.extend(self._generate_latency_policies(parameters))
-        
-        elif intent_type == 'qos':
-            policies.extend(self._generate_qos_policies(parameters))
-        
-        elif intent_type == 'sample_rate':
-            policies.extend(self._generate_sample_rate_policies(parameters))
-        
-        elif intent_type == 'device_control':
-            policies.extend(self._generate_device_control_policies(parameters))
-        
-        elif intent_type == 'publish_interval':
-            policies.extend(self._generate_publish_interval_policies(parameters))
-        
-        elif intent_type == 'audio_gain':
-            policies.extend(self._generate_audio_gain_policies(parameters))
+        template = self.templates.get(parsed_intent.get('type'))
+        if template is None:
+            logger.info("Generated 0 policies from intent")
+            return []
+        
+        ttl = ttl if ttl is not None else self.default_ttl
+        now = time.time()
+        policies = [
+            Policy(
+                policy_id=new_policy_id(),
+                policy_type=policy_type,
+                target=target,
+                parameters=parameters,
+                priority=priority,
+                created_at=now,
+                expires_at=now + ttl if ttl else None
+            )
+            for policy_type, target, parameters, priority in template.generate(parsed_intent.get('parameters', {}))
+        ]
         
         # Store generated policies
-        self.policies.extend(policies)
+        with self._lock:
+            for policy in policies:
+                self.active[policy.policy_id] = policy
+                if policy.expires_at is not None:
+                    heapq.heappush(self._expiry, (policy.expires_at, policy.policy_id))
+                for evicted in self.index.add(policy):
+                    self._retire(evicted, 'superseded')
+                self._notify(policy)
         
         logger.info(f"Generated {len(policies)} policies from intent")
         return policies
     
-    def _generate_priority_policies(self, params: Dict) -> List[Policy]:
-        """Generate priority-based policies"""
-        policies = []
-        target_device = params.get('target_device', params.get('device_id', ['unknown'])[0])
-        
-        # Traffic shaping policy
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.TRAFFIC_SHAPING,
-            target=target_device,
-            parameters={
-                'class': 'high_priority',
-                'rate': '100mbit',
-                'ceil': '200mbit',
-                'burst': '32k'
-            },
-            priority=9
-        )
-        policies.append(policy)
-        
-        # Routing priority
-        routing_policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.ROUTING_PRIORITY,
-            target=target_device,
-            parameters={
-                'tos': '0x10',
-                'priority': 'high'
-            },
-            priority=8
-        )
-        policies.append(routing_policy)
-        
-        return policies
+    def _set_status(self, policy: Policy, status: str):
+        if policy.status == status:
+            return
+        policy.status = status
+        self._notify(policy)
     
-    def _generate_bandwidth_policies(self, params: Dict) -> List[Policy]:
-        """Generate bandwidth control policies"""
-        policies = []
-        target_device = params.get('target_device', 'all')
-        
-        # Extract bandwidth limit
-        bandwidth_limit = None
-        if 'bandwidth_limit' in params:
-            value, unit = params['bandwidth_limit'][0], params['bandwidth_limit'][1] if len(params['bandwidth_limit']) > 1 else 'mbps'
-            bandwidth_limit = f"{value}{unit}"
-        elif 'throttle' in params:
-            bandwidth_limit = f"{params['throttle'][1]}mbps"
-        
-        if bandwidth_limit:
-            policy = Policy(
-                policy_id=self._get_next_policy_id(),
-                policy_type=PolicyType.BANDWIDTH_LIMIT,
-                target=target_device,
-                parameters={
-                    'rate': bandwidth_limit,
-                    'ceil': bandwidth_limit,
-                    'burst': '15k'
-                },
-                priority=7
-            )
-            policies.append(policy)
-        
-        return policies
+    def _notify(self, policy: Policy):
+        for listener in self.status_listeners:
+            try:
+                listener(policy)
+            except Exception as e:
+                logger.error(f"Policy status listener failed: {e}")
     
-    def _generate_latency_policies(self, params: Dict) -> List[Policy]:
-        """Generate latency reduction policies"""
-        policies = []
-        target_device = params.get('target_device', 'all')
-        
-        # Traffic prioritization for low latency
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.TRAFFIC_SHAPING,
-            target=target_device,
-            parameters={
-                'class': 'low_latency',
-                'netem_delay': '0ms',
-                'priority': 'express',
-                'queue': 'fq_codel'
-            },
-            priority=9
-        )
-        policies.append(policy)
-        
-        return policies
-    
-    def _generate_qos_policies(self, params: Dict) -> List[Policy]:
-        """Generate QoS policies"""
-        policies = []
-        target_device = params.get('target_device', 'all')
-        qos_level = params.get('qos_level', [1])[0]
-        
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.QOS_CONTROL,
-            target=target_device,
-            parameters={
-                'mqtt_qos': qos_level,
-                'reliable_delivery': True if qos_level in [1, 2] else False,
-                'retain': True
-            },
-            priority=6
-        )
-        policies.append(policy)
-        
-        return policies
+    def _retire(self, policy: Policy, status: str):
+        """Drop a policy from memory with its final status"""
+        self.active.pop(policy.policy_id, None)
+        self._set_status(policy, status)
     
-    def _generate_sample_rate_policies(self, params: Dict) -> List[Policy]:
-        """Generate sample rate policies for audio devices"""
-        policies = []
-        target_device = params.get('target_device', 'esp32-audio-1')
-        
-        # Extract sample rate value
-        sample_rate = 16000  # Default
-        if 'sample_rate' in params:
-            rate_tuple = params['sample_rate']
-            rate_str = rate_tuple[0] if isinstance(rate_tuple, tuple) else str(rate_tuple)
-            rate_val = int(rate_str)
-            # Handle kHz notation
-            if rate_val < 1000:
-                rate_val *= 1000
-            sample_rate = rate_val
-        
-        # Validate sample rate (supported: 8000, 16000, 44100, 48000)
-        valid_rates = [8000, 16000, 44100, 48000]
-        if sample_rate not in valid_rates:
-            # Find closest valid rate
-            sample_rate = min(valid_rates, key=lambda x: abs(x - sample_rate))
-            logger.warning(f"Adjusted sample rate to nearest valid value: {sample_rate}")
-        
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.SAMPLE_RATE,
-            target=target_device,
-            parameters={
-                'sample_rate': sample_rate,
-                'command': 'SET_SAMPLE_RATE'
-            },
-            priority=7
-        )
-        policies.append(policy)
+    def mark_enforced(self, policy: Policy) -> Optional[str]:
+        """
+        Record a successfully enforced policy
         
-        return policies
+        Returns:
+            ID of the policy it replaced for its target and type, now superseded
+        """
+        with self._lock:
+            replaced = self.index.mark_enforced(policy)
+            self._set_status(policy, 'enforced')
+            if replaced and replaced in self.active:
+                self._set_status(self.active[replaced], 'superseded')
+            return replaced
     
-    def _generate_device_control_policies(self, params: Dict) -> List[Policy]:
-        """Generate device enable/disable/reset policies"""
-        policies = []
-        
-        # Determine command type
-        command = 'ENABLE'
-        if 'enable_device' in params:
-            command = 'ENABLE'
-            target = params['enable_device'][0] if isinstance(params['enable_device'], tuple) else params.get('target_device', 'unknown')
-        elif 'disable_device' in params:
-            command = 'DISABLE'
-            target = params['disable_device'][0] if isinstance(params['disable_device'], tuple) else params.get('target_device', 'unknown')
-        elif 'reset_device' in params:
-            command = 'RESET'
-            target = params['reset_device'][0] if isinstance(params['reset_device'], tuple) else params.get('target_device', 'unknown')
-        else:
-            target = params.get('target_device', 'unknown')
-        
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.DEVICE_CONTROL,
-            target=target,
-            parameters={
-                'command': command
-            },
-            priority=8
-        )
-        policies.append(policy)
-        
-        return policies
+    def mark_not_enforced(self, policy: Policy):
+        """Record a policy that was not enforced because another one is in effect for its key"""
+        with self._lock:
+            effective = self.index.effective(policy.target, policy.policy_type)
+            # Identical to the enforced settings, it is in effect without a new operation
+            self._set_status(policy, 'enforced' if effective is policy else 'superseded')
     
-    def _generate_publish_interval_policies(self, params: Dict) -> List[Policy]:
-        """Generate publish interval policies"""
-        policies = []
-        target = params.get('target_device', 'esp32-audio-1')
-        
-        # Extract interval value (could be in seconds or ms)
-        interval_value = params.get('interval_value', ('10',))
-        if isinstance(interval_value, tuple):
-            interval_value = interval_value[0]
-        
-        # Convert to milliseconds
-        try:
-            interval_ms = int(interval_value)
-            # If value > 1000, assume it's already in ms, else convert from seconds
-            if interval_ms <= 60:
-                interval_ms = interval_ms * 1000
-            # Clamp to valid range (1-60 seconds)
-            interval_ms = max(1000, min(60000, interval_ms))
-        except (ValueError, TypeError):
-            interval_ms = 10000  # Default 10 seconds
-        
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.PUBLISH_INTERVAL,
-            target=target,
-            parameters={
-                'interval_ms': interval_ms,
-                'command': 'SET_PUBLISH_INTERVAL'
-            },
-            priority=5
-        )
-        policies.append(policy)
-        
-        return policies
+    def remove_policy(self, policy_id: str, status: str = 'withdrawn') -> Optional[PolicyKey]:
+        """Take a policy out of effect; the next conflicting policy, if any, takes over"""
+        with self._lock:
+            key = self.index.remove(policy_id)
+            policy = self.active.get(policy_id)
+            if policy is not None:
+                self._retire(policy, status)
+            return key
     
-    def _generate_audio_gain_policies(self, params: Dict) -> List[Policy]:
-        """Generate audio gain policies"""
-        policies = []
-        target = params.get('target_device', 'esp32-audio-1')
-        
-        # Extract gain value
-        gain_value = params.get('gain_value', ('1.0',))
-        if isinstance(gain_value, tuple):
-            gain_value = gain_value[0]
-        
-        # Convert to float and clamp to valid range (0.1-10x)
-        try:
-            gain = float(gain_value)
-            gain = max(0.1, min(10.0, gain))
-        except (ValueError, TypeError):
-            gain = 1.0  # Default no gain
+    def expire(self, now: Optional[float] = None) -> List[Tuple[Policy, PolicyKey]]:
+        """
+        Retire policies past their TTL, and the oldest beyond max_active
         
-        policy = Policy(
-            policy_id=self._get_next_policy_id(),
-            policy_type=PolicyType.AUDIO_GAIN,
-            target=target,
-            parameters={
-                'gain': gain,
-                'command': 'SET_AUDIO_GAIN'
-            },
-            priority=5
-        )
-        policies.append(policy)
+        Beyond max_active, overridden policies go before any policy in effect.
         
-        return policies
+        Returns:
+            (policy, key) of each expired policy; the keys need re-enforcing
+        """
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, policy_id = heapq.heappop(self._expiry)
+                policy = self.active.get(policy_id)
+                if policy is not None:
+                    expired.append((policy, self.index.remove(policy_id)))
+                    self._retire(policy, 'expired')
+            excess = len(self.active) - self.max_active
+            if excess > 0:
+                # Oldest overridden policies first; a policy in effect only once no other is left
+                overridden, in_effect = [], []
+                for policy in self.active.values():
+                    if self.index.effective(policy.target, policy.policy_type) is policy:
+                        in_effect.append(policy)
+                    else:
+                        overridden.append(policy)
+                        if len(overridden) == excess:
+                            break
+                for policy in (overridden + in_effect)[:excess]:
+                    expired.append((policy, self.index.remove(policy.policy_id)))
+                    self._retire(policy, 'expired')
+            
+            # Entries of policies that left early accumulate; rebuild from the active set
+            if len(self._expiry) > 2 * len(self.active) + 64:
+                self._expiry = [(p.expires_at, p.policy_id) for p in self.active.values() if p.expires_at is not None]
+                heapq.heapify(self._expiry)
+        return expired
     
-    def _get_next_policy_id(self) -> str:
-        """Generate unique policy ID"""
-        self.policy_counter += 1
-        return f"policy-{self.policy_counter}"
+    def next_expiry(self) -> Optional[float]:
+        """When the next policy expires (epoch seconds), or None"""
+        with self._lock:
+            while self._expiry and self._expiry[0][1] not in self.active:
+                heapq.heappop(self._expiry)
+            if len(self.active) > self.max_active:
+                return time.time()
+            return self._expiry[0][0] if self._expiry else None
     
     def get_policies(self) -> List[Dict]:
-        """Return all generated policies"""
-        return [p.to_dict() for p in self.policies]
+        """Return the active policies (history is in the database)"""
+        with self._lock:
+            return [p.to_dict() for p in self.active.values()]
+    
+    def get_effective_policies(self) -> List[Dict]:
+        """Return the policy in effect for each (target, type)"""
+        return [p.to_dict() for p in self.index.effective_policies()]
+    
+    def effective_rate(self, target: str) -> Optional[float]:
+        """Bandwidth limit in effect on a target in Mbit/s, or None if it has none"""
+        policy = self.index.effective(target, PolicyType.BANDWIDTH_LIMIT)
+        rate = _rate_bps(policy.parameters.get('rate')) if policy else float('inf')
+        return None if rate == float('inf') else rate / 1e6
 
 
 if __name__ == '__main__':
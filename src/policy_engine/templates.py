@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Policy Templates - Compiles config/policy_templates.yaml into policy generators
+Each intent type becomes an IntentTemplate: value extractors and parameter
+substitutions are resolved once at load, so generating is a dict lookup and a
+few precompiled calls per policy
+"""
+import logging
+import os
+import re
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+from policy_engine.engine import PolicyType
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATES_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'config', 'policy_templates.yaml'
+)
+
+_MISSING = object()
+
+# "name" (first element of a tuple), "name[1]" (element 1) or "name[:]" (the whole value)
+_SOURCE = re.compile(r'^(\w+)(?:\[(\d+|:)\])?$')
+_PLACEHOLDER = re.compile(r'^\{(\w+)\}$')
+
+
+# ============== Value steps ==============
+# Each takes the step's argument from the config and returns the conversion
+
+def _nearest(choices):
+    def step(value):
+        nearest = min(choices, key=lambda choice: abs(choice - value))
+        if nearest != value:
+            logger.warning(f"Adjusted {value} to nearest valid value: {nearest}")
+        return nearest
+    return step
+
+
+def _rate(_):
+    def step(value):
+        # (value, unit) from the parser, or a bare number in Mbit/s
+        if isinstance(value, (tuple, list)):
+            return f"{value[0]}{value[1] if len(value) > 1 else 'mbps'}"
+        return f"{value}mbps"
+    return step
+
+
+_STEPS: Dict[str, Callable[[Any], Callable[[Any], Any]]] = {
+    'int': lambda _: int,
+    'float': lambda _: float,
+    'khz': lambda _: lambda value: value * 1000 if value < 1000 else value,
+    'seconds_to_ms': lambda _: lambda value: value * 1000 if value <= 60 else value,
+    'clamp': lambda bounds: lambda value: max(bounds[0], min(bounds[1], value)),
+    'nearest': _nearest,
+    'rate': _rate,
+    'in': lambda choices: lambda value: value in choices,
+}
+
+
+def _compile_step(spec, where: str) -> Callable[[Any], Any]:
+    name, arg = (next(iter(spec.items())) if isinstance(spec, dict) else (spec, None))
+    if name not in _STEPS:
+        raise ValueError(f"{where}: unknown step '{name}' (known: {', '.join(_STEPS)})")
+    return _STEPS[name](arg)
+
+
+class ValueExtractor:
+    """
+    One named value of an intent, read from its parsed parameters
+
+    Sources are tried in order; the first parameter present is converted by
+    the steps. Missing, or failing a conversion, the value is `default`.
+    """
+
+    __slots__ = ('name', 'sources', 'steps', 'default', 'by_param')
+
+    def __init__(self, name: str, spec: Dict[str, Any], where: str):
+        self.name = name
+        sources = spec.get('from', [])
+        self.sources: List[Tuple[str, Any]] = []
+        for source in [sources] if isinstance(sources, str) else sources:
+            match = _SOURCE.match(source)
+            if not match:
+                raise ValueError(f"{where}: bad source '{source}'")
+            index = match.group(2)
+            self.sources.append((match.group(1), None if index == ':' else int(index or 0)))
+        self.steps = [_compile_step(step, where) for step in spec.get('steps', [])]
+        self.default = spec.get('default')
+        # Value chosen by which parameter is present, not by its content
+        self.by_param: Optional[Dict[str, Any]] = spec.get('by_param')
+
+    def extract(self, params: Dict[str, Any]) -> Any:
+        for param, index in self.sources:
+            value = params.get(param, _MISSING)
+            if value is _MISSING:
+                continue
+            if self.by_param is not None:
+                return self.by_param.get(param, self.default)
+            if index is not None and isinstance(value, (tuple, list)):
+                value = value[index] if len(value) > index else None
+            try:
+                for step in self.steps:
+                    value = step(value)
+            except (ValueError, TypeError, IndexError):
+                return self.default
+            return value
+        return self.default
+
+
+def _compile_value(template):
+    """Substitution for one parameter value: a placeholder-only string keeps the value's type"""
+    if not isinstance(template, str) or '{' not in template:
+        return lambda values: template
+    match = _PLACEHOLDER.match(template)
+    if match:
+        name = match.group(1)
+        return lambda values: values[name]
+    parts = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+    return lambda values: ''.join(literal + (str(values[field]) if field else '') for literal, field in parts)
+
+
+class PolicyGenerator:
+    """One policy of an intent type, with its parameters ready to substitute"""
+
+    __slots__ = ('policy_type', 'priority', 'target', 'when', 'parameters')
+
+    def __init__(self, spec: Dict[str, Any], templates: Dict[str, Any], values: Dict[str, ValueExtractor],
+                 where: str):
+        try:
+            self.policy_type = PolicyType(spec['policy_type'])
+        except (KeyError, ValueError):
+            raise ValueError(f"{where}: policy_type must be one of {', '.join(t.value for t in PolicyType)}")
+        self.priority = int(spec.get('priority', 5))
+        self.target = spec.get('target', 'target')
+        self.when = spec.get('when')
+
+        parameters = {}
+        if 'template' in spec:
+            section, _, name = spec['template'].partition('.')
+            template = templates.get(section, {}).get(name)
+            if template is None:
+                raise ValueError(f"{where}: unknown template '{spec['template']}'")
+            parameters.update(template.get('parameters', {}))
+        parameters.update(spec.get('parameters', {}))
+
+        for name in [self.target, self.when] + [
+                field for value in parameters.values() if isinstance(value, str)
+                for _, field, _, _ in Formatter().parse(value) if field]:
+            if name is not None and name not in values:
+                raise ValueError(f"{where}: '{name}' is not a value of this intent type")
+        self.parameters = [(key, _compile_value(value)) for key, value in parameters.items()]
+
+    def build(self, values: Dict[str, Any]) -> Optional[Tuple[PolicyType, str, Dict[str, Any], int]]:
+        """(policy_type, target, parameters, priority), or None if the `when` value is missing"""
+        if self.when and values[self.when] is None:
+            return None
+        return (self.policy_type, values[self.target],
+                {key: substitute(values) for key, substitute in self.parameters}, self.priority)
+
+
+class IntentTemplate:
+    """Compiled generation rules of one intent type"""
+
+    __slots__ = ('intent_type', 'values', 'policies')
+
+    def __init__(self, intent_type: str, spec: Dict[str, Any], templates: Dict[str, Any]):
+        where = f"intents.{intent_type}"
+        self.intent_type = intent_type
+        self.values = [ValueExtractor(name, value, f"{where}.values.{name}")
+                       for name, value in (spec.get('values') or {}).items()]
+        by_name = {value.name: value for value in self.values}
+        self.policies = [PolicyGenerator(policy, templates, by_name, f"{where}.policies[{i}]")
+                         for i, policy in enumerate(spec.get('policies') or [])]
+
+    def generate(self, params: Dict[str, Any]) -> List[Tuple[PolicyType, str, Dict[str, Any], int]]:
+        """(policy_type, target, parameters, priority) of each policy for the intent's parameters"""
+        values = {value.name: value.extract(params) for value in self.values}
+        return [built for built in (policy.build(values) for policy in self.policies) if built is not None]
+
+
+@lru_cache(maxsize=None)
+def load_templates(path: str = DEFAULT_TEMPLATES_PATH) -> Dict[str, IntentTemplate]:
+    """
+    Compile the intent section of a templates file (once per path)
+
+    Raises:
+        ValueError: The file names an unknown template, value, step or policy type
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    compiled = {intent_type: IntentTemplate(intent_type, spec, config)
+                for intent_type, spec in (config.get('intents') or {}).items()}
+    logger.info(f"Compiled policy templates for {len(compiled)} intent types from {path}")
+    return compiled
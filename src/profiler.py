@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Profiler - On-demand sampling of the running controller
+Samples the stacks of every thread (API workers, feedback loop, MQTT network thread)
+into collapsed stacks for flamegraph tools, or diffs tracemalloc snapshots to find
+where memory grows
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One profile at a time per process: overlapping runs would sample each other
+_running = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # First line of the function rather than the current line, so one function is one flamegraph box
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':')
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> Dict[str, Any]:
+    """
+    Sample the stack of every thread at a fixed interval
+
+    Wall-clock sampling: threads blocked on a lock, socket or sleep are counted
+    where they wait, which is what matters when a request is slow.
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples (0.01 = 100 Hz)
+
+    Returns:
+        Dict with 'stacks' (Counter of "thread;outer;...;inner" -> samples),
+        'samples', 'seconds' and 'interval'
+
+    Raises:
+        ProfilerBusy: Another profile is running in this process
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f'thread-{ident}').replace(';', ':').replace(' ', '_'))
+                stacks[';'.join(reversed(labels))] += 1
+            samples += 1
+
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(interval, deadline - now))
+
+        logger.info(f"Sampled {len(stacks)} distinct stacks in {samples} samples")
+        return {'stacks': stacks, 'samples': samples,
+                'seconds': round(time.perf_counter() - start, 3), 'interval': interval}
+    finally:
+        _running.release()
+
+
+def collapse(stacks: Counter) -> str:
+    """Collapsed-stack text ("frame;frame;frame count" per line), as read by flamegraph.pl and speedscope"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def allocation_growth(seconds: float, top: int = 25, frames: int = 1) -> Dict[str, Any]:
+    """
+    Memory allocated and not freed while waiting, by allocating line
+
+    Tracing is started for the window and stopped afterwards, unless it was
+    already on (PYTHONTRACEMALLOC), so it costs nothing outside a profile.
+
+    Args:
+        seconds: How long to watch
+        top: Lines reported, largest growth first
+        frames: Stack depth kept per allocation (more is slower but shows callers)
+
+    Returns:
+        Dict with the net growth, the traced total and peak, and the 'top' growing lines
+
+    Raises:
+        ProfilerBusy: Another profile is running in this process
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    started = not tracemalloc.is_tracing()
+    try:
+        if started:
+            tracemalloc.start(frames)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        # Leave out the snapshots' own bookkeeping
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        stats = after.filter_traces(ignore).compare_to(
+            before.filter_traces(ignore), 'traceback' if frames > 1 else 'lineno')
+        growing = [stat for stat in stats if stat.size_diff > 0][:top]
+
+        return {
+            'seconds': seconds,
+            'grown_bytes': sum(stat.size_diff for stat in stats),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'top': [{
+                'location': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                'size_diff_bytes': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size_bytes': stat.size,
+                'count': stat.count,
+            } for stat in growing],
+        }
+    finally:
+        if started:
+            tracemalloc.stop()
+        _running.release()
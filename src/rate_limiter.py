@@ -10,12 +10,19 @@ from collections import defaultdict
 from datetime import datetime, timedelta
 import threading
 
+from controller_metrics import rate_limited_total
+
 
 class RateLimiter:
     """In-memory rate limiter with configurable limits per endpoint."""
     
-    def __init__(self):
-        """Initialize rate limiter."""
+    def __init__(self, enabled=True):
+        """Initialize rate limiter.
+        
+        Args:
+            enabled: When False, limited endpoints are served without checks
+        """
+        self.enabled = enabled
         self.requests = defaultdict(list)  # {client_id: [timestamps]}
         self.lock = threading.Lock()
         
@@ -77,6 +84,8 @@ class RateLimiter:
             # Add current request if not limited
             if not is_limited:
                 request_times.append(now)
+            else:
+                rate_limited_total.labels(limit_type).inc()
             
             return is_limited, remaining, reset_time
     
@@ -95,6 +104,9 @@ class RateLimiter:
         def decorator(f):
             @wraps(f)
             def decorated_function(*args, **kwargs):
+                if not self.enabled:
+                    return f(*args, **kwargs)
+                
                 client_id = self.get_client_id()
                 is_limited, remaining, reset_time = self.is_rate_limited(client_id, limit_type)
                 
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Response Cache - Generation counters, ETags and serialized bodies for read endpoints
+Writes bump a per-collection generation; reads are answered from the generation
+alone (304) or from a cached body, and only rebuilt from the database when it changed
+"""
+import json
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: faster serialization
+    orjson = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize a response body (orjson when installed, else the standard library)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, default=str, sort_keys=True, separators=(',', ':')).encode()
+
+
+class Generations:
+    """
+    Per-collection change counters
+
+    Bump after a write is committed, never before: a reader that sees the old
+    generation may then have read new data (harmless, it is superseded at the
+    bump), but a reader that sees the new generation always reads new data.
+    Counters live in process memory, so they only see this process's writes.
+    """
+
+    def __init__(self):
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Distinguishes ETags across restarts, when counters start over
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def bump(self, *collections: str):
+        with self._lock:
+            for collection in collections:
+                self._counts[collection] = self._counts.get(collection, 0) + 1
+
+    def get(self, collections: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._counts.get(collection, 0) for collection in collections)
+
+    def etag(self, collections: Iterable[str]) -> str:
+        """Strong ETag for a representation built from `collections`"""
+        return f'"{self.epoch}-{"-".join(map(str, self.get(collections)))}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists `etag` (or is *)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison, as If-None-Match requires
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class ResponseCache:
+    """
+    Bounded LRU of serialized response bodies
+
+    Keys include the generations the body was built from, so entries are
+    never invalidated explicitly: after a write they simply stop matching
+    and age out.
+    """
+
+    def __init__(self, max_entries: int = 256, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled and max_entries > 0
+        self._entries: 'OrderedDict[Any, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any) -> Optional[bytes]:
+        """Cached body for `key`, if any"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Any, body: bytes):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key: Any, build: Callable[[], Tuple[Any, int]]) -> Tuple[bytes, int]:
+        """
+        Cached body for `key`, or build, serialize and (for 200s) cache it
+
+        Args:
+            key: Hashable key, including the generations the body depends on
+            build: Returns (payload, status)
+
+        Returns:
+            (body, status)
+        """
+        body = self.get(key)
+        if body is not None:
+            return body, 200
+
+        payload, status = build()
+        body = dumps(payload)
+        if status == 200:
+            self.put(key, body)
+        return body, status
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Tracing - W3C trace context spans from intent submission to device acknowledgement
+Spans nest through context variables within the controller, travel to devices in the
+control message's traceparent field and end when the device echoes it in its status
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# Private generator: unaffected by random.seed() elsewhere, and reseeded in forked workers
+_ids = random.Random()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_ids.seed)
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+
+class SpanContext:
+    """Identity of a span as carried across process boundaries"""
+
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """SpanContext from a traceparent header value, or None if absent or malformed"""
+    if not value or not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    # All-zero IDs are invalid
+    if trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 0x01))
+
+
+class Span:
+    """A timed operation; ended exactly once, then exported if sampled"""
+
+    __slots__ = ('tracer', 'name', 'context', 'parent_id', 'start', 'end_time', 'attributes', 'status')
+
+    def __init__(self, tracer: 'Tracer', name: str, context: SpanContext, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end_time: Optional[float] = None
+        self.attributes = attributes or {}
+        self.status = 'ok'
+
+    @property
+    def traceparent(self) -> str:
+        return self.context.traceparent
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self, status: Optional[str] = None):
+        if self.end_time is not None:
+            return
+        self.end_time = time.time()
+        if status:
+            self.status = status
+        if self.context.sampled:
+            self.tracer.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.context.trace_id,
+            'span_id': self.context.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'service': self.tracer.service,
+            'start': self.start,
+            'end': self.end_time,
+            'duration_ms': round((self.end_time - self.start) * 1000, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class JsonlExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Opened on first use; line at a time so workers appending to one file do not interleave
+                self._file = open(self.path, 'a', buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Tracer:
+    """
+    Creates spans and tracks those waiting for a device acknowledgement
+
+    Args:
+        exporter: Receives finished, sampled spans (None: nothing is recorded,
+            but trace context is still propagated)
+        service: Service name stamped on every span
+        sample_ratio: Fraction of new traces recorded; incoming context keeps its own decision
+        ack_timeout: Seconds a span may wait for a device echo before it ends as 'timeout'
+        max_pending: Spans awaiting an echo, at most (the oldest end as 'timeout')
+    """
+
+    def __init__(self, exporter=None, service: str = 'imperium-controller', sample_ratio: float = 1.0,
+                 ack_timeout: float = 300.0, max_pending: int = 10000):
+        self.exporter = exporter
+        self.service = service
+        self.sample_ratio = sample_ratio if exporter is not None else 0.0
+        self.ack_timeout = ack_timeout
+        self.max_pending = max_pending
+        self._pending: 'OrderedDict[str, Span]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[SpanContext] = None, **attributes) -> Span:
+        """
+        Start a span without making it current (end it with span.end())
+
+        Args:
+            name: Operation name
+            parent: Parent context (default: the current span, else a new trace)
+        """
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current else None
+
+        span_id = f"{_ids.getrandbits(64) or 1:016x}"
+        if parent is None:
+            context = SpanContext(f"{_ids.getrandbits(128) or 1:032x}", span_id,
+                                  _ids.random() < self.sample_ratio)
+            return Span(self, name, context, None, attributes)
+        return Span(self, name, SpanContext(parent.trace_id, span_id, parent.sampled), parent.span_id, attributes)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[SpanContext] = None, **attributes):
+        """Span around a block, current for everything called within it"""
+        span = self.start_span(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set('error', str(e))
+            span.status = 'error'
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def current_traceparent(self) -> Optional[str]:
+        """traceparent of the current span, to hand to work that continues elsewhere"""
+        current = _current_span.get()
+        return current.traceparent if current else None
+
+    def await_echo(self, span: Span):
+        """Keep `span` open until finish_remote() receives its traceparent back"""
+        if not span.context.sampled:
+            return
+        now = time.time()
+        expired = []
+        with self._lock:
+            self._pending[span.context.span_id] = span
+            while self._pending:
+                oldest = next(iter(self._pending.values()))
+                if len(self._pending) <= self.max_pending and now - oldest.start < self.ack_timeout:
+                    break
+                expired.append(self._pending.popitem(last=False)[1])
+        for stale in expired:
+            stale.end('timeout')
+
+    def finish_remote(self, traceparent: Optional[str], **attributes) -> bool:
+        """
+        End the waiting span a device echoed back
+
+        Returns:
+            Whether a waiting span matched (retained or repeated echoes do not)
+        """
+        context = parse_traceparent(traceparent)
+        if context is None:
+            return False
+        with self._lock:
+            span = self._pending.pop(context.span_id, None)
+        if span is None:
+            return False
+        span.attributes.update(attributes)
+        span.end()
+        return True
+
+    def abandon(self, span: Span, status: str):
+        """Stop waiting for an echo that will not come (e.g. the message was never sent)"""
+        with self._lock:
+            self._pending.pop(span.context.span_id, None)
+        span.end(status)
+
+    def export(self, span: Span):
+        if self.exporter is None:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.error(f"Failed to export span {span.name}: {e}")
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer, configured from TRACING_* environment variables on first use"""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            enabled = os.getenv('TRACING_ENABLED', 'true').lower() == 'true'
+            exporter = JsonlExporter(os.getenv('TRACING_EXPORT_PATH', 'data/traces.jsonl')) if enabled else None
+            _tracer = Tracer(
+                exporter=exporter,
+                service=os.getenv('TRACING_SERVICE_NAME', 'imperium-controller'),
+                sample_ratio=float(os.getenv('TRACING_SAMPLE_RATIO', '1.0')),
+                ack_timeout=float(os.getenv('TRACING_ACK_TIMEOUT_SECONDS', '300'))
+            )
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """Replace the process-wide tracer (e.g. to export elsewhere)"""
+    global _tracer
+    with _tracer_lock:
+        _tracer = tracer
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+WSGI Entry Point - Serves the Intent Manager API from a production WSGI server
+Each worker process builds its own enforcers, database connections and feedback loop
+"""
+import os
+import sys
+import threading
+import logging
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intent_manager import api
+from main import ImperiumController
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+controller: Optional[ImperiumController] = None
+_init_lock = threading.Lock()
+_init_pid: Optional[int] = None
+
+
+def init_worker(slot: Optional[int] = None):
+    """
+    Initialize the controller components for this worker process (idempotent)
+
+    Called from gunicorn's post_worker_init hook, or lazily on the first
+    request under other WSGI servers. Nothing created before a fork is
+    reused: the inherited SQLite connection pool is dropped. With a worker
+    slot, the MQTT client ID and outbox file get the slot as suffix, so
+    workers do not disconnect each other at the broker or overwrite each
+    other's queued messages, and a restarted worker restores what its
+    predecessor in the slot queued.
+
+    Args:
+        slot: Stable worker number from gunicorn (None: the process is the only worker)
+    """
+    global controller, _init_pid
+
+    with _init_lock:
+        if _init_pid == os.getpid():
+            return
+
+        # Connections opened in the parent (e.g. with preload_app) must not be shared
+        api.get_app().extensions['imperium']['db_manager'].engine.dispose(close=False)
+
+        controller = ImperiumController(handle_signals=False)
+        pid = os.getpid()
+        config = controller.config
+        if slot is not None:
+            config['mqtt_client_id'] = f"{config['mqtt_client_id']}-{slot}"
+            root, ext = os.path.splitext(config['mqtt_outbox_path'])
+            config['mqtt_outbox_path'] = f"{root}.{slot}{ext}"
+
+        controller.running = True
+        controller.initialize_components()
+        if config['feedback_enabled']:
+            controller.start_feedback_loop()
+
+        _init_pid = pid
+        logger.info(f"Worker {pid} initialized (slot {slot})")
+
+
+def shutdown_worker():
+    """Stop this worker's feedback loop and MQTT connection"""
+    if controller and _init_pid == os.getpid():
+        controller.shutdown(exit_process=False)
+
+
+def application(environ, start_response):
+    """WSGI callable: the Flask app, with this worker's components initialized"""
+    if _init_pid != os.getpid():
+        init_worker()
+    return api.get_app()(environ, start_response)
@@ -0,0 +1,6 @@
+# Imperium - Test configuration
+
+import os
+
+# Tests that trace install their own tracer; nothing else writes spans into data/
+os.environ.setdefault('TRACING_ENABLED', 'false')
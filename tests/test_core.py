@@ -1,14 +1,30 @@
 # Imperium - Test Suite
 
+import json
 import pytest
+import random
 import sys
 import os
+import threading
+import time
+from unittest.mock import Mock
 
 # Add src to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from intent_manager.parser import IntentParser
-from policy_engine.engine import PolicyEngine
+from policy_engine.engine import PolicyEngine, PolicyType, new_policy_id, policy_key
+from control_codec import (
+    BINARY_ENCODING, JSON_ENCODING, decode_control, encode_binary, encode_control
+)
+from feedback.history import MetricsHistory, RingBuffer
+from feedback.detection import GoalCheck, ViolationDetector
+from feedback.sources import RecordedSource, SyntheticSource, parse_query
+from event_bus import EventBus, parse_last_event_id
+from response_cache import Generations, ResponseCache, etag_matches
+from iot_simulator.node import LatencyModel, default_config
+from tracing import Tracer, parse_traceparent
+import profiler
 
 
 class TestIntentParser:
@@ -105,6 +121,598 @@ class TestPolicyEngine:
         assert 'target' in policy_dict
         assert 'parameters' in policy_dict
         assert 'priority' in policy_dict
+    
+    def test_new_intent_type_from_config(self, tmp_path):
+        """An intent type defined only in the templates file generates policies"""
+        templates = tmp_path / 'templates.yaml'
+        templates.write_text(
+            "traffic_shaping:\n"
+            "  medium_priority:\n"
+            "    parameters: {rate: 50mbit, ceil: 100mbit}\n"
+            "intents:\n"
+            "  fair_share:\n"
+            "    values:\n"
+            "      target: {from: target_device, default: all}\n"
+            "      weight: {from: weight, steps: [int, {clamp: [1, 10]}], default: 1}\n"
+            "    policies:\n"
+            "      - policy_type: traffic_shaping\n"
+            "        template: traffic_shaping.medium_priority\n"
+            "        parameters: {class: 'fair-{weight}', weight: '{weight}'}\n"
+            "        priority: 4\n"
+        )
+        engine = PolicyEngine(templates_path=str(templates))
+        
+        policy, = engine.generate_policies({'type': 'fair_share', 'parameters': {'target_device': 'node-4',
+                                                                                 'weight': ('40',)}})
+        assert policy.policy_type == PolicyType.TRAFFIC_SHAPING and policy.target == 'node-4'
+        assert policy.parameters == {'rate': '50mbit', 'ceil': '100mbit', 'class': 'fair-10', 'weight': 10}
+        assert policy.priority == 4
+        assert engine.generate_policies({'type': 'priority', 'parameters': {}}) == []
+    
+    def test_template_errors_are_reported_at_load(self, tmp_path):
+        """Unknown steps, values and policy types fail when the file is compiled"""
+        for body in ("values: {x: {from: a, steps: [cube]}}",
+                     "policies: [{policy_type: qos_control, parameters: {qos: '{missing}'}}]",
+                     "policies: [{policy_type: teleport}]"):
+            templates = tmp_path / f'bad{len(body)}.yaml'
+            templates.write_text(f"intents:\n  broken: {{{body}}}\n")
+            with pytest.raises(ValueError, match='intents.broken'):
+                PolicyEngine(templates_path=str(templates))
+    
+    def test_conflicts_resolve_to_one_effective_policy(self):
+        """Per (target, type): priority, then recency; most restrictive for bandwidth limits"""
+        def bandwidth(mbps):
+            return self.engine.generate_policies({'type': 'bandwidth', 'parameters': {
+                'target_device': '2', 'bandwidth_limit': (str(mbps), 'mbps')}})[0]
+        
+        low = bandwidth(10)
+        bandwidth(50)
+        assert self.engine.index.effective('node-2', PolicyType.BANDWIDTH_LIMIT) is low
+        
+        first = self.engine.generate_policies({'type': 'sample_rate', 'parameters': {
+            'target_device': 'esp32-audio-1', 'sample_rate': ('8000',)}})[0]
+        latest = self.engine.generate_policies({'type': 'sample_rate', 'parameters': {
+            'target_device': 'esp32-audio-1', 'sample_rate': ('48000',)}})[0]
+        assert self.engine.index.effective('esp32-audio-1', PolicyType.SAMPLE_RATE) is latest
+        assert self.engine.index.conflicts()[('esp32-audio-1', PolicyType.SAMPLE_RATE)] == [
+            latest.policy_id, first.policy_id]
+        
+        # The runner-up takes over when the effective policy goes
+        self.engine.remove_policy(latest.policy_id)
+        assert self.engine.index.effective('esp32-audio-1', PolicyType.SAMPLE_RATE) is first
+    
+    def test_pending_is_the_effective_delta(self):
+        """Only keys whose effective parameters changed need enforcing"""
+        qos = {'type': 'qos', 'parameters': {'target_device': 'node-1', 'qos_level': [2]}}
+        first = self.engine.generate_policies(qos)[0]
+        key = policy_key(first)
+        assert self.engine.index.pending([key]) == [first]
+        assert self.engine.index.mark_enforced(first) is None
+        
+        repeat = self.engine.generate_policies(qos)[0]
+        assert self.engine.index.effective('node-1', PolicyType.QOS_CONTROL) is repeat
+        assert self.engine.index.pending([key]) == []
+        
+        changed = self.engine.generate_policies(dict(qos, parameters={'target_device': 'node-1', 'qos_level': [0]}))[0]
+        assert self.engine.index.pending([key]) == [changed]
+        assert self.engine.index.mark_enforced(changed) == first.policy_id
+    
+    def test_policy_ids_are_time_ordered_and_unique(self):
+        """IDs sort by creation and do not repeat the way a restarted counter would"""
+        ids = [new_policy_id() for _ in range(5000)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        assert all(len(policy_id) <= 36 for policy_id in ids)
+    
+    def test_expired_policy_leaves_and_the_runner_up_takes_over(self):
+        """Policies past their TTL leave the active set; the statuses follow the lifecycle"""
+        changes = []
+        self.engine.status_listeners.append(lambda policy: changes.append((policy.policy_id, policy.status)))
+        qos = {'type': 'qos', 'parameters': {'target_device': 'node-1', 'qos_level': [2]}}
+        lasting = self.engine.generate_policies(qos)[0]
+        self.engine.mark_enforced(lasting)
+        brief = self.engine.generate_policies(dict(qos, parameters={'target_device': 'node-1', 'qos_level': [0]}),
+                                              ttl=30)[0]
+        assert self.engine.mark_enforced(brief) == lasting.policy_id
+        assert lasting.status == 'superseded'
+        
+        assert self.engine.expire(now=brief.expires_at - 1) == []
+        assert self.engine.expire(now=brief.expires_at) == [(brief, policy_key(brief))]
+        assert self.engine.index.pending([policy_key(brief)]) == [lasting]
+        assert [p['policy_id'] for p in self.engine.get_policies()] == [lasting.policy_id]
+        assert changes[-3:] == [(brief.policy_id, 'enforced'), (lasting.policy_id, 'superseded'),
+                                (brief.policy_id, 'expired')]
+        assert self.engine.next_expiry() is None
+    
+    def test_active_set_is_bounded(self):
+        """Overridden policies beyond the per-target limit, and the oldest beyond max_active, are dropped"""
+        engine = PolicyEngine(max_per_key=3, max_active=5)
+        rates = [engine.generate_policies({'type': 'sample_rate', 'parameters': {
+            'target_device': 'esp32-audio-1', 'sample_rate': (str(rate),)}})[0] for rate in (8000, 16000, 22050, 44100)]
+        assert rates[0].status == 'superseded'
+        assert len(engine.get_policies()) == 3
+        assert engine.index.effective('esp32-audio-1', PolicyType.SAMPLE_RATE) is rates[-1]
+        
+        for node in range(1, 4):
+            engine.generate_policies({'type': 'qos', 'parameters': {'target_device': str(node), 'qos_level': [1]}})
+        assert [policy for policy, _ in engine.expire()] == [rates[1]]
+        assert len(engine.get_policies()) == 5
+    
+    def test_policies_in_effect_are_evicted_last(self):
+        """Beyond max_active, newer overridden policies go before an older one in effect"""
+        engine = PolicyEngine(max_active=2)
+        def qos(node, level):
+            return engine.generate_policies({'type': 'qos', 'parameters': {'target_device': node, 'qos_level': [level]}})[0]
+        
+        lasting = qos('1', 2)
+        overridden = qos('2', 1)
+        latest = qos('2', 0)
+        assert [policy for policy, _ in engine.expire()] == [overridden]
+        assert engine.index.effective('node-1', PolicyType.QOS_CONTROL) is lasting
+        
+        engine.max_active = 1
+        assert [policy for policy, _ in engine.expire()] == [lasting]
+        assert [p['policy_id'] for p in engine.get_policies()] == [latest.policy_id]
+
+
+class TestControlCodec:
+    """Test JSON and binary control message encodings"""
+    
+    MESSAGES = [
+        {'command': 'SET_QOS', 'qos': 2},
+        {'command': 'SET_SAMPLE_RATE', 'sample_rate': 44100},
+        {'command': 'SET_PUBLISH_INTERVAL', 'interval_ms': 5000},
+        {'command': 'SET_AUDIO_GAIN', 'gain': 2.5},
+        {'command': 'RESET'},
+        {'type': 'qos_update', 'qos': 1, 'reliable_delivery': True},
+        {'type': 'config_update', 'sampling_rate': None, 'enabled': False, 'priority': 'low'},
+    ]
+    
+    def test_binary_round_trip(self):
+        """Every enforcer message survives a binary round trip"""
+        for message in self.MESSAGES:
+            payload, used = encode_control(message, BINARY_ENCODING)
+            assert used == BINARY_ENCODING
+            assert decode_control(payload) == message
+    
+    def test_binary_smaller_than_json(self):
+        """Binary frames are much smaller than the JSON equivalent"""
+        for message in self.MESSAGES:
+            binary, _ = encode_control(message, BINARY_ENCODING)
+            text, _ = encode_control(message, JSON_ENCODING)
+            assert len(binary) * 4 < len(text.encode())
+    
+    def test_json_fallback_for_unknown_messages(self):
+        """Messages without a binary layout fall back to JSON"""
+        message = {'command': 'SET_PRIORITY', 'priority': 'high'}
+        
+        assert encode_binary(message) is None
+        payload, used = encode_control(message, BINARY_ENCODING)
+        assert used == JSON_ENCODING
+        assert decode_control(payload.encode()) == message
+
+
+
+class TestMetricsHistory:
+    """Test bounded ring-buffer metrics history"""
+    
+    def test_ring_buffer_keeps_newest_samples(self):
+        """A full buffer overwrites the oldest samples in order"""
+        buffer = RingBuffer(capacity=4)
+        for t in range(10):
+            buffer.append(float(t), float(t * 10))
+        
+        ts, vs = buffer.window()
+        assert len(buffer) == 4
+        assert list(ts) == [6.0, 7.0, 8.0, 9.0]
+        assert list(vs) == [60.0, 70.0, 80.0, 90.0]
+        assert buffer.latest() == (9.0, 90.0)
+    
+    def test_tail_reads_newest_samples_across_wrap(self):
+        """tail() returns the newest samples in order without a full window copy"""
+        buffer = RingBuffer(capacity=4)
+        for t in range(6):
+            buffer.append(float(t), float(t * 10))
+        
+        ts, vs = buffer.tail(3)
+        assert list(ts) == [3.0, 4.0, 5.0]
+        assert list(vs) == [30.0, 40.0, 50.0]
+        assert len(buffer.tail(10)[1]) == 4
+        assert len(RingBuffer(capacity=4).tail(3)[1]) == 0
+    
+    def test_rolling_statistics(self):
+        """Mean, percentile, EWMA and slope over a time window"""
+        buffer = RingBuffer(capacity=100)
+        for t in range(20):
+            buffer.append(float(t), 5.0 + 2.0 * t)
+        
+        assert buffer.mean(seconds=4, now=19) == 39.0
+        assert buffer.slope() == pytest.approx(2.0)
+        assert buffer.percentile(50) == pytest.approx(24.0)
+        assert 39.0 < buffer.ewma(alpha=0.5) < 43.0
+    
+    def test_memory_stays_bounded(self):
+        """Samples and series are capped however long the history runs"""
+        history = MetricsHistory(capacity=10, max_series=3)
+        for cycle in range(1000):
+            for node in range(3):
+                history.record('latency', f'node-{node}', cycle, timestamp=cycle)
+        history.record('latency', 'node-3', 1.0, timestamp=1000)
+        
+        assert history.series_count() == 3
+        assert len(history) == 21
+        assert history.nbytes == 3 * 10 * 16
+        assert history.latest('latency', 'node-2') == 999.0
+        assert history.series('latency', 'node-0') is None
+    
+    def test_same_timestamp_replaces_sample(self):
+        """Recording the same cycle twice keeps one sample"""
+        history = MetricsHistory(capacity=10)
+        history.record('latency', None, 10.0, timestamp=1.0)
+        history.record('latency', None, 12.0, timestamp=1.0)
+        
+        assert len(history) == 1
+        assert history.latest('latency') == 12.0
+
+
+
+class TestViolationDetector:
+    """Test sustained-breach, hysteresis and trend detection"""
+    
+    def states(self, detector, values, goal='max_latency', threshold=100, slope=0.0):
+        return [detector.evaluate([GoalCheck('i-1', 'node-1', goal, threshold, v, slope)], now=t)[0]['state']
+                for t, v in enumerate(values)]
+    
+    def test_single_spike_is_not_a_violation(self):
+        """One noisy sample over the goal stays pending"""
+        detector = ViolationDetector(min_breach_samples=3)
+        
+        assert self.states(detector, [50, 150, 60, 50]) == ['ok', 'pending', 'ok', 'ok']
+    
+    def test_sustained_breach_becomes_violation(self):
+        """Consecutive breaching samples confirm a violation"""
+        detector = ViolationDetector(min_breach_samples=3)
+        
+        assert self.states(detector, [150, 150, 150]) == ['pending', 'pending', 'violation']
+    
+    def test_hysteresis_suppresses_flapping(self):
+        """A violation holds until the value clears the hysteresis band"""
+        detector = ViolationDetector(min_breach_samples=1, hysteresis=0.1)
+        
+        states = self.states(detector, [120, 95, 105, 95, 85, 95])
+        assert states == ['violation', 'violation', 'violation', 'violation', 'ok', 'ok']
+    
+    def test_smoothing_absorbs_single_spike(self):
+        """A lone spike on a smoothed series never raises a violation"""
+        detector = ViolationDetector(min_breach_samples=1, ewma_alpha=0.3)
+        
+        assert self.states(detector, [60, 60, 150, 60, 60]) == ['ok', 'ok', 'ok', 'ok', 'ok']
+    
+    def test_smoothed_value_drives_detection(self):
+        """A sustained breach still lifts the smoothed value over the goal"""
+        detector = ViolationDetector(min_breach_samples=1, ewma_alpha=0.3)
+        
+        states = self.states(detector, [60, 150, 150, 150])
+        assert states == ['ok', 'ok', 'violation', 'violation']
+    
+    def test_breach_must_last_min_seconds(self):
+        """Samples arriving quickly do not confirm a violation before min_breach_seconds"""
+        detector = ViolationDetector(min_breach_samples=2, min_breach_seconds=10)
+        check = lambda: [GoalCheck('i-1', 'node-1', 'max_latency', 100, 150)]
+        
+        assert [detector.evaluate(check(), now=t)[0]['state'] for t in (0, 1, 2, 5)] == ['pending'] * 4
+        result = detector.evaluate(check(), now=10)[0]
+        assert result['state'] == 'violation'
+        assert result['breach_seconds'] == 10.0
+    
+    def test_min_goal_direction(self):
+        """Throughput goals breach below the threshold"""
+        detector = ViolationDetector()
+        
+        assert self.states(detector, [20, 5], goal='min_throughput', threshold=10) == ['ok', 'violation']
+    
+    def test_trend_predicts_breach(self):
+        """A metric rising fast enough is flagged before it crosses the goal"""
+        detector = ViolationDetector(trend_horizon=60)
+        check = GoalCheck('i-1', 'node-1', 'max_latency', 100, 80, slope=0.5)
+        
+        result = detector.evaluate([check], now=0)[0]
+        assert result['state'] == 'predicted'
+        assert result['seconds_to_breach'] == pytest.approx(40.0)
+    
+    def test_vectorized_slopes(self):
+        """Trends of many series are fitted in one pass"""
+        history = MetricsHistory(capacity=50)
+        for t in range(20):
+            history.record('latency', 'node-1', 2.0 * t, timestamp=t)
+            history.record('latency', 'node-2', 7.0, timestamp=t)
+        history.record('latency', 'node-3', 1.0, timestamp=0)
+        
+        slopes = history.slopes([('latency', 'node-1'), ('latency', 'node-2'), ('latency', 'node-3')])
+        assert list(slopes) == pytest.approx([2.0, 0.0, 0.0])
+
+
+class TestMetricsSources:
+    """Test in-process metrics sources"""
+    
+    def test_parse_query(self):
+        """The engine's PromQL maps back to metric, scope and node"""
+        assert parse_query('avg by (node_id) (iot_latency_ms)') == ('latency', 'node', None)
+        assert parse_query('sum(rate(iot_messages_sent_total[1m]))') == ('throughput', 'fleet', None)
+        assert parse_query('sum(iot_bandwidth_bytes{node_id="node-7"})') == ('bandwidth', 'single', 'node-7')
+        assert parse_query('up') is None
+    
+    def test_synthetic_step_change(self):
+        """Step changes apply to their node once their start time passes"""
+        clock = Mock(return_value=0.0)
+        source = SyntheticSource(['node-1', 'node-2'], noise=0.0, clock=clock,
+                                 steps=[(60, 'latency', 'node-2', 100.0)])
+        
+        assert source.values('latency', 30.0) == {'node-1': 20.0, 'node-2': 20.0}
+        assert source.values('latency', 60.0) == {'node-1': 20.0, 'node-2': 120.0}
+        
+        clock.return_value = 60.0
+        fleet = source.query('avg(iot_latency_ms)')['result'][0]['value'][1]
+        assert float(fleet) == pytest.approx(70.0)
+    
+    def test_recorded_replay(self, tmp_path):
+        """Recorded samples replay relative to when the source was created"""
+        path = tmp_path / 'metrics.jsonl'
+        path.write_text('\n'.join(json.dumps(sample) for sample in [
+            {'ts': 1000.0, 'metric': 'latency', 'node_id': 'node-1', 'value': 10.0},
+            {'ts': 1010.0, 'metric': 'latency', 'node_id': 'node-1', 'value': 30.0},
+            {'ts': 1020.0, 'metric': 'latency', 'node_id': 'node-1', 'value': 50.0},
+        ]))
+        clock = Mock(return_value=500.0)
+        source = RecordedSource(str(path), clock=clock)
+        
+        assert source.values('latency', 505.0) == {'node-1': 10.0}
+        assert source.values('latency', 515.0) == {'node-1': 30.0}
+        # Loops back to the start once the recording runs out
+        assert source.values('latency', 521.0) == {'node-1': 10.0}
+        
+        clock.return_value = 510.0
+        result = source.query('avg by (node_id) (iot_latency_ms)')['result']
+        assert result == [{'metric': {'node_id': 'node-1'}, 'value': [510.0, '30.0']}]
+
+
+class TestEventBus:
+    """Test the server-sent event stream"""
+    
+    def test_resume_after_last_event_id(self):
+        """Clients get exactly the events after the ID they last saw"""
+        bus = EventBus(buffer_size=10)
+        for i in range(5):
+            bus.publish('intent', {'n': i})
+        
+        events, reset = bus.since(3)
+        assert not reset
+        assert [e.id for e in events] == [4, 5]
+        assert bus.since(5) == ([], False)
+        assert events[0].to_sse() == 'id: 4\nevent: intent\ndata: {"n": 3}\n\n'
+    
+    def test_reset_when_behind_buffer(self):
+        """A client older than the replay buffer is told to refetch state"""
+        bus = EventBus(buffer_size=3)
+        for i in range(10):
+            bus.publish('device', {'n': i})
+        
+        chunk, last_id = bus.next_chunk(2, bus.since(2))
+        assert last_id == 10
+        assert chunk.startswith('id: 10\nevent: reset\n')
+        # Nothing missed since the buffer's first event
+        assert [e.id for e in bus.since(7)[0]] == [8, 9, 10]
+    
+    def test_reset_when_resuming_from_before_a_restart(self):
+        """A Last-Event-ID above the newest ID came from a previous process"""
+        bus = EventBus(buffer_size=10)
+        chunk, last_id = bus.next_chunk(500, bus.wait(500, timeout=0.01))
+        assert chunk.startswith('id: 0\nevent: reset\n')
+        assert last_id == 0
+        
+        for i in range(3):
+            bus.publish('intent', {'n': i})
+        events, reset = bus.since(500)
+        assert reset and [e.id for e in events] == [1, 2, 3]
+        assert bus.next_chunk(500, bus.wait(500, timeout=5))[1] == 3
+    
+    def test_zero_buffer_size(self):
+        """A buffer size of 0 still keeps the newest event for live clients"""
+        bus = EventBus(buffer_size=0)
+        bus.publish('device', {'n': 1})
+        bus.publish('device', {'n': 2})
+        
+        assert [e.id for e in bus.since(1)[0]] == [2]
+        assert bus.since(0)[1]
+    
+    def test_stream_sends_keepalive_when_idle(self):
+        """Idle streams emit comments, then new events as they arrive"""
+        bus = EventBus()
+        stream = bus.stream(keepalive=0.01)
+        
+        assert next(stream) == 'retry: 3000\n\n'
+        assert next(stream) == ': keepalive\n\n'
+        bus.publish('policy', {'policy_id': 'policy-1'})
+        assert next(stream).startswith('id: 1\nevent: policy\n')
+    
+    def test_parse_last_event_id(self):
+        """The header takes precedence over the query parameter"""
+        assert parse_last_event_id('7', '3') == 7
+        assert parse_last_event_id(None, '3') == 3
+        assert parse_last_event_id('bogus', None) is None
+        assert parse_last_event_id(None, None) is None
+
+
+class TestResponseCache:
+    """Test generation-keyed response caching"""
+    
+    def test_etag_follows_generations(self):
+        """ETags change only when a collection they depend on is written"""
+        generations = Generations()
+        intents_etag = generations.etag(('intents', 'policies'))
+        
+        generations.bump('policies')
+        assert generations.etag(('intents', 'policies')) != intents_etag
+        policies_etag = generations.etag(('policies',))
+        generations.bump('intents')
+        assert generations.etag(('policies',)) == policies_etag
+        
+        assert etag_matches(f'"other", {policies_etag}', policies_etag)
+        assert etag_matches(f'W/{policies_etag}', policies_etag)
+        assert not etag_matches(None, policies_etag)
+    
+    def test_bodies_are_built_once_and_evicted(self):
+        """Only 200 responses are cached, least recently used first out"""
+        cache = ResponseCache(max_entries=2)
+        build = Mock(return_value=({'count': 1}, 200))
+        
+        body, status = cache.get_or_build('a', build)
+        assert cache.get_or_build('a', build) == (body, 200)
+        assert build.call_count == 1
+        assert json.loads(body) == {'count': 1}
+        
+        missing = Mock(return_value=({'error': 'not found'}, 404))
+        cache.get_or_build('b', missing)
+        cache.get_or_build('b', missing)
+        assert missing.call_count == 2
+        
+        cache.get_or_build('c', build)
+        cache.get_or_build('d', build)
+        assert cache.get('a') is None and cache.get('d') is not None
+
+
+class TestLatencyModel:
+    """Test simulated network delay and packet loss"""
+    
+    def test_jitter_distributions(self):
+        """Exponential jitter only ever adds delay; no jitter is exactly the latency"""
+        model = LatencyModel(rng=random.Random(7))
+        config = dict(default_config(), latency=20, jitter=0)
+        assert model.delay(config) == pytest.approx(0.020)
+        
+        config.update(jitter=5, jitter_distribution='exponential')
+        delays = [model.delay(config) for _ in range(2000)]
+        assert min(delays) >= 0.020
+        assert sum(delays) / len(delays) == pytest.approx(0.025, abs=0.001)
+        
+        config.update(jitter_distribution='uniform')
+        delays = [model.delay(config) for _ in range(2000)]
+        assert 0.015 <= min(delays) and max(delays) <= 0.025
+    
+    def test_burst_loss_keeps_long_run_rate(self):
+        """Bursty loss averages `loss_burst` consecutive drops at the configured rate"""
+        model = LatencyModel(rng=random.Random(11))
+        config = dict(default_config(), packet_loss=0.2, loss_burst=4)
+        drops = [model.dropped(config) for _ in range(50000)]
+        
+        assert sum(drops) / len(drops) == pytest.approx(0.2, abs=0.02)
+        bursts = ''.join('x' if d else '.' for d in drops).split('.')
+        bursts = [len(b) for b in bursts if b]
+        assert sum(bursts) / len(bursts) == pytest.approx(4, abs=0.4)
+        
+        config.update(packet_loss=0)
+        assert not any(model.dropped(config) for _ in range(100))
+
+
+class TestTracing:
+    """Test W3C trace context spans"""
+    
+    def test_traceparent_round_trip(self):
+        """Valid headers parse; malformed and all-zero ones are ignored"""
+        context = parse_traceparent('00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+        assert context.trace_id == '0af7651916cd43dd8448eb211c80319c' and context.sampled
+        assert context.traceparent == '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+        assert not parse_traceparent('00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-00').sampled
+        for bad in (None, '', 'garbage', '00-' + '0' * 32 + '-b7ad6b7169203331-01',
+                    '00-0af7651916cd43dd8448eb211c80319c-b7ad6b71692033-01'):
+            assert parse_traceparent(bad) is None
+    
+    def test_spans_nest_and_wait_for_echo(self):
+        """Nested spans share the trace; an awaited span ends on its echo, once"""
+        exporter = Mock()
+        tracer = Tracer(exporter=exporter)
+        
+        with tracer.span('root') as root:
+            with tracer.span('child') as child:
+                assert tracer.current_traceparent() == child.traceparent
+            ack = tracer.start_span('device.ack')
+            tracer.await_echo(ack)
+        assert tracer.current_traceparent() is None
+        assert child.context.trace_id == root.context.trace_id == ack.context.trace_id
+        assert child.parent_id == root.context.span_id == ack.parent_id
+        assert [call.args[0].name for call in exporter.export.call_args_list] == ['child', 'root']
+        
+        assert tracer.finish_remote(ack.traceparent, node_id='node-1')
+        assert not tracer.finish_remote(ack.traceparent)
+        assert exporter.export.call_args.args[0].to_dict()['attributes'] == {'node_id': 'node-1'}
+    
+    def test_unanswered_echoes_time_out(self):
+        """Spans nobody acknowledges end as 'timeout' once the pending limit is reached"""
+        exporter = Mock()
+        tracer = Tracer(exporter=exporter, max_pending=2)
+        spans = [tracer.start_span(f'ack-{i}') for i in range(3)]
+        for span in spans:
+            tracer.await_echo(span)
+        
+        assert exporter.export.call_count == 1
+        assert spans[0].status == 'timeout'
+        assert not tracer.finish_remote(spans[0].traceparent)
+    
+    def test_disabled_tracer_still_propagates(self):
+        """Without an exporter nothing is recorded, but context flows (unsampled)"""
+        tracer = Tracer(exporter=None)
+        with tracer.span('root') as root:
+            assert tracer.current_traceparent().endswith('-00')
+        assert not root.context.sampled
+
+
+
+class TestProfiler:
+    """Test the on-demand sampling profiler"""
+    
+    def test_samples_every_thread_as_collapsed_stacks(self):
+        """Other threads appear under their name, innermost frame last; overlapping runs are refused"""
+        stop = threading.Event()
+        
+        def busy_loop():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=busy_loop, name='feedback scheduler')
+        worker.start()
+        try:
+            with profiler._running:
+                with pytest.raises(profiler.ProfilerBusy):
+                    profiler.sample_stacks(0.01)
+            result = profiler.sample_stacks(0.1, interval=0.005)
+        finally:
+            stop.set()
+            worker.join()
+        
+        assert result['samples'] >= 2
+        ours = [stack for stack in result['stacks'] if stack.startswith('feedback_scheduler;')]
+        # Innermost is busy_loop, or a call it makes (e.g. Event.is_set)
+        assert ours and all(any(frame.startswith('busy_loop (test_core.py:') for frame in stack.split(';')[-2:])
+                            for stack in ours)
+        line = profiler.collapse(result['stacks']).splitlines()[0]
+        assert int(line.rsplit(' ', 1)[1]) == max(result['stacks'].values())
+    
+    def test_allocation_growth_points_at_the_growing_line(self):
+        """Memory kept during the window is attributed to the line that allocated it"""
+        kept = []
+        
+        def grow():
+            time.sleep(0.02)
+            kept.append(bytearray(2_000_000))
+        
+        grower = threading.Thread(target=grow)
+        grower.start()
+        result = profiler.allocation_growth(0.2, top=5)
+        grower.join()
+        
+        assert result['grown_bytes'] >= 2_000_000
+        assert 'test_core.py' in result['top'][0]['location'][0]
+        assert result['top'][0]['size_diff_bytes'] >= 2_000_000
 
 
 if __name__ == '__main__':
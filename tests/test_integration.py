@@ -3,6 +3,7 @@
 Integration Tests - End-to-end testing of the Imperium system
 Tests the complete workflow from intent submission to policy enforcement
 """
+import json
 import pytest
 import sys
 import os
@@ -14,19 +15,26 @@ from unittest.mock import Mock, patch
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from intent_manager.parser import IntentParser
-from intent_manager.api import IntentManager
+from intent_manager.api import IntentManager, create_app
 from policy_engine.engine import PolicyEngine, PolicyType
 from enforcement.network import NetworkEnforcer
 from enforcement.device import DeviceEnforcer
+from enforcement.shadow import DeviceShadowManager
 from feedback.monitor import FeedbackEngine
+from feedback.detection import ViolationDetector
+from feedback.remediation import RemediationExecutor
+from feedback.scheduler import FeedbackScheduler, interval_for_priority
+from feedback.sources import SyntheticSource
 
 
 class TestEndToEndWorkflow:
     """Test complete intent-to-enforcement workflow"""
     
-    def setup_method(self):
+    @pytest.fixture(autouse=True)
+    def setup_components(self, tmp_path):
         """Setup test environment"""
-        self.intent_manager = IntentManager()
+        from database import DatabaseManager
+        self.intent_manager = IntentManager(db_manager=DatabaseManager(db_path=str(tmp_path / 'imperium.db')))
         self.parser = IntentParser()
         self.policy_engine = PolicyEngine()
         self.network_enforcer = NetworkEnforcer()
@@ -198,6 +206,309 @@ class TestPolicyEnforcement:
         assert status['interface'] == 'eth0'
 
 
+class TestPolicyConflicts:
+    """Test that only the effective policy delta reaches the enforcers"""
+    
+    def setup_method(self):
+        self.intent_manager = IntentManager(db_manager=Mock())
+        self.intent_manager.device_enforcer = Mock()
+        self.intent_manager.device_enforcer.apply_policy.return_value = True
+    
+    def applied(self):
+        return [c.args[0]['parameters']['mqtt_qos'] for c in self.intent_manager.device_enforcer.apply_policy.call_args_list]
+    
+    def test_repeated_and_overridden_intents_are_not_re_enforced(self):
+        """Identical intents cause no MQTT operation; a changed one replaces the old in the shadow"""
+        first = self.intent_manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        self.intent_manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        assert self.applied() == ['2']
+        assert not self.intent_manager.device_enforcer.shadows.withdraw.called
+        
+        self.intent_manager.submit_intent({'description': 'Set QoS level 1 for node-1'})
+        assert self.applied() == ['2', '1']
+        self.intent_manager.device_enforcer.shadows.withdraw.assert_called_once_with(
+            first['policies'][0]['policy_id'])
+    
+    def test_withdrawn_policy_hands_over_to_the_next(self):
+        """Withdrawing the effective policy enforces the one it had overridden"""
+        self.intent_manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        latest = self.intent_manager.submit_intent({'description': 'Set QoS level 1 for node-1'})
+        
+        self.intent_manager.withdraw_policy(latest['policies'][0]['policy_id'])
+        assert self.applied() == ['2', '1', '2']
+    
+    def test_policy_lifecycle_is_recorded_in_the_database(self, tmp_path):
+        """An intent's TTL expires its policy; status changes reach the database in a batch"""
+        from database import DatabaseManager
+        db_manager = DatabaseManager(db_path=str(tmp_path / 'lifecycle.db'))
+        intent_manager = IntentManager(db_manager=db_manager)
+        intent_manager.device_enforcer = self.intent_manager.device_enforcer
+        
+        lasting = intent_manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        brief = intent_manager.submit_intent({'description': 'Set QoS level 1 for node-1', 'ttl': 60})
+        assert intent_manager.submit_intent({'description': 'Set QoS level 1 for node-1', 'ttl': -1})['status'] == 'invalid'
+        
+        brief_id = brief['policies'][0]['policy_id']
+        assert intent_manager.expire_policies(now=brief['policies'][0]['expires_at']) == 1
+        assert self.applied() == ['2', '1', '2']
+        intent_manager.close()
+        
+        statuses = {p['id']: p['status'] for p in db_manager.get_all_policies()}
+        assert statuses == {lasting['policies'][0]['policy_id']: 'enforced', brief_id: 'expired'}
+
+
+class TestDeviceEnforcerOutbox:
+    """Test offline queueing and replay of device control messages"""
+    
+    def setup_method(self):
+        self.enforcer = DeviceEnforcer('localhost', 1883)
+    
+    def _qos_policy(self, target, qos):
+        return {
+            'policy_type': 'qos_control',
+            'target': target,
+            'parameters': {'mqtt_qos': qos, 'reliable_delivery': True}
+        }
+    
+    def test_messages_queued_while_disconnected(self):
+        """Control messages are queued instead of failing when offline"""
+        assert self.enforcer.apply_policy(self._qos_policy('node-1', 1)) is True
+        assert len(self.enforcer.outbox) == 1
+    
+    def test_same_setting_coalesced(self):
+        """Only the latest command per device setting survives in the outbox"""
+        self.enforcer.apply_policy(self._qos_policy('node-1', 1))
+        self.enforcer.apply_policy(self._qos_policy('node-2', 1))
+        self.enforcer.apply_policy(self._qos_policy('node-1', 2))
+        
+        entries = self.enforcer.outbox.drain()
+        
+        assert [target for target, _ in entries] == ['node-2', 'node-1']
+        assert entries[1][1]['qos'] == 2
+    
+    def test_outbox_bounded(self):
+        """Oldest messages are dropped once the outbox is full"""
+        enforcer = DeviceEnforcer('localhost', 1883, outbox_size=2)
+        for i in range(3):
+            enforcer.apply_policy(self._qos_policy(f'node-{i}', 1))
+        
+        targets = [target for target, _ in enforcer.outbox.drain()]
+        assert targets == ['node-1', 'node-2']
+    
+    def test_outbox_persisted(self, tmp_path):
+        """Queued messages survive a controller restart"""
+        path = str(tmp_path / 'outbox.json')
+        enforcer = DeviceEnforcer('localhost', 1883, outbox_path=path)
+        enforcer.apply_policy(self._qos_policy('node-1', 2))
+        
+        restarted = DeviceEnforcer('localhost', 1883, outbox_path=path)
+        
+        assert len(restarted.outbox) == 1
+    
+    def test_replay_on_connect(self):
+        """Queued messages are published in order once connected"""
+        self.enforcer.apply_policy(self._qos_policy('node-1', 1))
+        self.enforcer.apply_policy(self._qos_policy('node-2', 2))
+        
+        published = []
+        with patch.object(self.enforcer.client, 'publish',
+                          side_effect=lambda topic, payload, qos: published.append(topic) or Mock(rc=0)):
+            with patch.object(self.enforcer.client, 'subscribe'):
+                self.enforcer.connection._handle_connect(self.enforcer.client, None, {}, 0)
+        
+        assert published == ['iot/node-1/control', 'iot/node-2/control']
+        assert len(self.enforcer.outbox) == 0
+        assert self.enforcer.connected is True
+
+
+class TestDeviceRegistry:
+    """Test the device status registry fed by MQTT status messages"""
+    
+    def setup_method(self):
+        self.enforcer = DeviceEnforcer('localhost', 1883, device_stale_after=60)
+        self.registry = self.enforcer.registry
+    
+    def _status_message(self, topic, payload):
+        msg = Mock()
+        msg.topic = topic
+        msg.payload = payload.encode()
+        return msg
+    
+    def test_simulator_status_parsed(self):
+        """Simulator status messages become parsed records"""
+        payload = '{"node_id": "node-1", "status": "online", "config": {"qos": 2, "sampling_rate": 5}}'
+        self.enforcer.on_message(None, None, self._status_message('iot/node-1/status', payload))
+        
+        status = self.enforcer.get_device_status('node-1')
+        assert status['status'] == 'online'
+        assert status['config']['qos'] == 2
+        assert status['last_seen'] > 0
+    
+    def test_malformed_encodings_ignored(self):
+        """Only a list of known encoding names replaces what a device advertised"""
+        self.registry.update_from_status({'node_id': 'node-1', 'encodings': ['json', 'binary-v1', 'zstd']})
+        assert self.registry.get('node-1').encodings == ('json', 'binary-v1')
+        for malformed in ('binary-v1', {'binary-v1': True}, ['json', 1]):
+            self.registry.update_from_status({'node_id': 'node-1', 'encodings': malformed})
+            assert self.registry.get('node-1').encodings == ('json', 'binary-v1')
+    
+    def test_esp32_status_parsed(self):
+        """ESP32 heartbeats and bare status strings are accepted"""
+        self.enforcer.on_message(None, None, self._status_message('iot/esp32-audio-1/status', 'online'))
+        assert self.registry.get('esp32-audio-1').online is True
+        
+        heartbeat = '{"device_id": "esp32-audio-1", "status": "online", "timestamp": 1000}'
+        self.enforcer.on_message(None, None, self._status_message('iot/esp32-audio-1/status', heartbeat))
+        assert self.registry.get('esp32-audio-1').reported_at == 1000
+    
+    def test_indexed_queries(self):
+        """Devices can be queried by type, location and online state"""
+        self.registry.register('node-1', 'temperature_sensor', 'rack-A-1')
+        self.registry.register('node-2', 'temperature_sensor', 'storage-B-2')
+        self.registry.register('esp32-audio-1', 'audio_sensor', 'rack-A-1')
+        self.registry.update_from_status({'node_id': 'node-1', 'status': 'online'})
+        
+        assert {r.node_id for r in self.enforcer.find_devices(device_type='temperature_sensor')} == {'node-1', 'node-2'}
+        assert {r.node_id for r in self.enforcer.find_devices(location='rack-A-1')} == {'node-1', 'esp32-audio-1'}
+        assert [r.node_id for r in self.enforcer.find_devices(online=True)] == ['node-1']
+    
+    def test_snapshot_is_isolated(self):
+        """Snapshots are read-only and unaffected by later updates"""
+        self.registry.update_from_status({'node_id': 'node-1', 'status': 'online'})
+        snapshot = self.enforcer.get_all_devices()
+        
+        self.registry.update_from_status({'node_id': 'node-2', 'status': 'online'})
+        
+        assert list(snapshot.keys()) == ['node-1']
+        with pytest.raises(TypeError):
+            snapshot['node-3'] = None
+    
+    def test_binary_encoding_negotiated(self):
+        """Devices advertising binary-v1 receive binary control frames"""
+        self.registry.update_from_status({'node_id': 'node-1', 'status': 'online',
+                                          'encodings': ['json', 'binary-v1']})
+        self.registry.update_from_status({'node_id': 'node-2', 'status': 'online'})
+        
+        payloads = {}
+        with patch.object(self.enforcer.connection, 'connected', True):
+            with patch.object(self.enforcer.client, 'publish',
+                              side_effect=lambda topic, payload, qos: payloads.update({topic: payload}) or Mock(rc=0)):
+                for target in ('node-1', 'node-2'):
+                    self.enforcer.apply_policy({'policy_type': 'sample_rate', 'target': target,
+                                                'parameters': {'sample_rate': 16000}})
+        
+        assert isinstance(payloads['iot/node-1/control'], bytes)
+        assert payloads['iot/node-2/control'].startswith('{')
+    
+    def test_stale_devices_evicted(self):
+        """Devices that stop reporting are evicted"""
+        self.registry.update_from_status({'node_id': 'node-1', 'status': 'online'}, now=1000.0)
+        self.registry.update_from_status({'node_id': 'node-2', 'status': 'online'}, now=1100.0)
+        
+        evicted = self.registry.evict_stale(now=1130.0)
+        
+        assert evicted == ['node-1']
+        assert 'node-2' in self.registry
+
+
+class TestDeviceShadow:
+    """Test desired-state reconciliation of device commands"""
+    
+    def setup_method(self):
+        self.sent = []
+        self.shadows = DeviceShadowManager(lambda target, msg: self.sent.append((target, msg)) or True)
+    
+    def _interval(self, ms):
+        return {'command': 'SET_PUBLISH_INTERVAL', 'interval_ms': ms}
+    
+    def test_unchanged_state_not_republished(self):
+        """Re-issuing the state a device already has publishes nothing"""
+        self.shadows.update('node-1', self._interval(5000), policy_id='p1')
+        self.shadows.acknowledge('node-1', {'interval_ms': 5000})
+        self.shadows.update('node-1', self._interval(5000), policy_id='p2')
+        
+        assert len(self.sent) == 1
+    
+    def test_in_flight_state_not_republished(self):
+        """A message awaiting acknowledgement is not sent twice"""
+        self.shadows.update('node-1', self._interval(5000), policy_id='p1')
+        self.shadows.update('node-1', self._interval(5000), policy_id='p1')
+        
+        assert len(self.sent) == 1
+    
+    def test_higher_priority_policy_wins(self):
+        """Settings are merged across policies by priority"""
+        self.shadows.update('node-1', self._interval(5000), policy_id='p1', priority=8)
+        self.shadows.update('node-1', self._interval(1000), policy_id='p2', priority=3)
+        
+        assert self.shadows.get_shadow('node-1')['desired']['SET_PUBLISH_INTERVAL']['interval_ms'] == 5000
+        assert len(self.sent) == 1
+    
+    def test_withdrawn_policy_falls_back(self):
+        """Removing a policy re-applies the next best desired state"""
+        self.shadows.update('node-1', self._interval(5000), policy_id='p1', priority=5)
+        self.shadows.update('node-1', self._interval(1000), policy_id='p2', priority=8)
+        
+        self.shadows.withdraw('p2')
+        
+        assert self.sent[-1] == ('node-1', self._interval(5000))
+    
+    def test_debounce_sends_only_latest(self):
+        """A burst of updates within the debounce window becomes one publish"""
+        shadows = DeviceShadowManager(lambda target, msg: self.sent.append((target, msg)) or True,
+                                      debounce=0.05)
+        for ms in (1000, 2000, 3000):
+            shadows.update('node-1', self._interval(ms))
+        time.sleep(0.2)
+        
+        assert self.sent == [('node-1', self._interval(3000))]
+        shadows.close()
+    
+    def test_drift_is_corrected(self):
+        """A device reporting different config after ack is re-converged"""
+        self.shadows.update('node-1', {'type': 'qos_update', 'qos': 2}, policy_id='p1')
+        self.shadows.acknowledge('node-1', {'qos': 2})
+        self.shadows.acknowledge('node-1', {'qos': 0})
+        
+        assert len(self.sent) == 2
+    
+    def test_rejected_setting_is_retried_then_given_up(self):
+        """A setting the device keeps reporting a different value for is resent a bounded number of times"""
+        shadows = DeviceShadowManager(lambda target, msg: self.sent.append((target, msg)) or True,
+                                      ack_timeout=0, max_attempts=2)
+        shadows.update('esp32-audio-1', {'command': 'SET_AUDIO_GAIN', 'gain': 2.0}, policy_id='p1')
+        for _ in range(4):
+            shadows.acknowledge('esp32-audio-1', {'sample_rate': 16000, 'gain': 1.0})
+        
+        assert len(self.sent) == 2
+        assert shadows.get_shadow('esp32-audio-1')['unconfirmed'] == {'SET_AUDIO_GAIN': {'command': 'SET_AUDIO_GAIN', 'gain': 2.0}}
+        shadows.acknowledge('esp32-audio-1', {'gain': 2.0})
+        assert 'SET_AUDIO_GAIN' in shadows.get_shadow('esp32-audio-1')['acknowledged']
+    
+    def test_fields_the_device_does_not_report_are_not_awaited(self):
+        """Only the fields a device reports must match; a config-less heartbeat confirms what it cannot check"""
+        from iot_simulator.node import apply_control, default_config
+        shadows = DeviceShadowManager(lambda target, msg: self.sent.append((target, msg)) or True,
+                                      ack_timeout=0, max_attempts=3)
+        
+        # The simulator reports its config, which has no reliable_delivery
+        config = default_config()
+        message = {'type': 'qos_update', 'qos': 2, 'reliable_delivery': True}
+        shadows.update('node-1', message, policy_id='p1')
+        apply_control(config, message)
+        for _ in range(3):
+            shadows.acknowledge('node-1', dict(config))
+        assert shadows.get_shadow('node-1')['acknowledged'] == {'qos_update': message}
+        
+        # ESP32 heartbeats carry no config at all
+        shadows.update('esp32-audio-1', {'command': 'SET_SAMPLE_RATE', 'sample_rate': 8000}, policy_id='p2')
+        for _ in range(3):
+            shadows.acknowledge('esp32-audio-1', None)
+        assert 'SET_SAMPLE_RATE' in shadows.get_shadow('esp32-audio-1')['acknowledged']
+        
+        assert [target for target, _ in self.sent] == ['node-1', 'esp32-audio-1']
+
+
 class TestFeedbackLoop:
     """Test feedback loop and monitoring"""
     
@@ -254,6 +565,34 @@ class TestFeedbackLoop:
                 assert satisfaction['satisfied'] is False
                 assert len(satisfaction['violations']) > 0
     
+    def test_cycle_deduplicates_queries(self):
+        """Each distinct PromQL expression is fetched once per evaluation cycle"""
+        for i in range(20):
+            self.feedback_engine.register_intent(f'intent-{i}', {'max_latency': 100})
+        
+        fetched = []
+        empty = {'result': []}
+        with patch.object(self.feedback_engine, '_fetch', side_effect=lambda q: fetched.append(q) or empty):
+            results = self.feedback_engine.evaluate_intents()
+        
+        assert len(results) == 20
+        assert len(fetched) == len(set(fetched))
+        assert len(fetched) <= 3
+    
+    def test_recommendations_reuse_satisfaction(self):
+        """Recommendations computed from a cycle's result do not query again"""
+        self.feedback_engine.register_intent('intent-1', {'max_latency': 50})
+        satisfaction = {
+            'satisfied': False,
+            'violations': [{'metric': 'latency', 'expected': 50, 'actual': 80.0}]
+        }
+        
+        with patch.object(self.feedback_engine, '_fetch') as fetch:
+            recommendations = self.feedback_engine.recommend_adjustments('intent-1', satisfaction=satisfaction)
+        
+        fetch.assert_not_called()
+        assert recommendations[0]['action'] == 'increase_priority'
+    
     def test_adjustment_recommendations(self):
         """Test generating policy adjustment recommendations"""
         intent_id = 'test-intent-4'
@@ -268,6 +607,602 @@ class TestFeedbackLoop:
             assert len(recommendations) > 0
             assert recommendations[0]['action'] in ['increase_priority', 'increase_bandwidth', 'throttle_bandwidth']
 
+    def test_per_target_evaluation(self):
+        """Intents are judged against their own devices from one vector query per metric"""
+        self.feedback_engine.register_intent('intent-a', {'max_latency': 50}, targets='node-1')
+        self.feedback_engine.register_intent('intent-b', {'max_latency': 50}, targets=['node-2', 'node-3'])
+
+        def fetch(query):
+            if query == 'avg by (node_id) (iot_latency_ms)':
+                return {'result': [
+                    {'metric': {'node_id': 'node-1'}, 'value': [0, '20']},
+                    {'metric': {'node_id': 'node-2'}, 'value': [0, '30']},
+                    {'metric': {'node_id': 'node-3'}, 'value': [0, '90']},
+                ]}
+            return {'result': []}
+
+        with patch.object(self.feedback_engine, '_fetch', side_effect=fetch) as fetched:
+            results = self.feedback_engine.evaluate_intents()
+
+        assert fetched.call_count == 3
+        assert results['intent-a']['satisfied'] is True
+        assert results['intent-b']['satisfied'] is False
+        assert results['intent-b']['violations'][0]['target'] == 'node-3'
+        assert results['intent-b']['targets']['node-2']['latency'] == 30.0
+
+        recommendations = self.feedback_engine.recommend_adjustments('intent-b', satisfaction=results['intent-b'])
+        assert recommendations[0]['target'] == 'node-3'
+
+    def test_rising_latency_is_predicted_before_breach(self):
+        """A steady latency climb is recommended on before it violates the goal"""
+        engine = FeedbackEngine('http://localhost:9090',
+                                detector=ViolationDetector(min_breach_samples=3, trend_horizon=30))
+        engine.register_intent('intent-1', {'max_latency': 100})
+
+        results = None
+        for cycle, latency in enumerate([40.0, 50.0, 60.0, 70.0]):
+            with patch('time.time', return_value=1000.0 + cycle * 5):
+                with patch.object(engine, 'get_latency_metrics', return_value=latency):
+                    results = engine.evaluate_intents()
+
+        satisfaction = results['intent-1']
+        assert satisfaction['satisfied'] is True
+        assert satisfaction['warnings'][0]['state'] == 'predicted'
+
+        recommendations = engine.recommend_adjustments('intent-1', satisfaction=satisfaction)
+        assert recommendations[0]['action'] == 'increase_priority'
+        assert recommendations[0]['predicted'] is True
+
+    def test_synthetic_source_step_is_detected(self):
+        """A latency step on one node violates only the intents watching it"""
+        clock = Mock(return_value=1000.0)
+        source = SyntheticSource(['node-1', 'node-2'], noise=0.0, clock=clock,
+                                 steps=[(60, 'latency', 'node-2', 80.0)])
+        engine = FeedbackEngine(source=source, detector=ViolationDetector(min_breach_samples=2))
+        engine.register_intent('intent-a', {'max_latency': 50}, targets='node-1')
+        engine.register_intent('intent-b', {'max_latency': 50}, targets='node-2')
+
+        states = []
+        for _ in range(5):
+            results = engine.evaluate_intents()
+            states.append((results['intent-a']['satisfied'], results['intent-b']['satisfied']))
+            clock.return_value += 30
+
+        assert states == [(True, True), (True, True), (True, True), (True, False), (True, False)]
+        assert results['intent-b']['violations'][0]['target'] == 'node-2'
+
+
+class TestRemediationExecutor:
+    """Test closed-loop remediation of feedback recommendations"""
+    
+    def setup_method(self):
+        self.policy_engine = PolicyEngine()
+        self.enforce = Mock()
+        self.withdraw = Mock()
+        # Bandwidth limit in effect per device (Mbit/s)
+        self.limits = {'node-1': 20}
+        self.executor = RemediationExecutor(
+            generate=self.policy_engine.generate_policies, enforce=self.enforce,
+            withdraw=self.withdraw, cooldown=60, max_actions=2, rate_window=3600,
+            max_step=0.5, verify_window=30, default_rate=20, current_rate=self.limits.get
+        )
+    
+    @staticmethod
+    def throughput_rec(mbps, target='node-1'):
+        return {'action': 'increase_bandwidth', 'reason': 'test', 'target': target,
+                'parameters': {'bandwidth': f"{mbps}mbps"}}
+    
+    @staticmethod
+    def result(throughput):
+        return {'intent-1': {'metrics': {'throughput': throughput},
+                             'targets': {'node-1': {'throughput': throughput}}}}
+    
+    def test_recommendation_becomes_enforced_policy(self):
+        """A recommendation is turned into policies and enforced"""
+        outcomes = self.executor.execute('intent-1', [self.throughput_rec(25)], now=0)
+        
+        assert outcomes[0]['status'] == 'applied'
+        policies, parsed = self.enforce.call_args[0]
+        assert policies[0].policy_type == PolicyType.BANDWIDTH_LIMIT
+        assert policies[0].parameters['rate'] == '25mbps'
+        assert parsed['parameters']['target_device'] == 'node-1'
+    
+    def test_cooldown_rate_limit_and_step_size(self):
+        """Repeats are held off, capped per target, and changes are bounded"""
+        self.executor.execute('intent-1', [self.throughput_rec(25)], now=0)
+        
+        assert self.executor.execute('intent-1', [self.throughput_rec(100)], now=10)[0]['status'] == 'skipped'
+        
+        outcome = self.executor.execute('intent-1', [self.throughput_rec(100)], now=100)[0]
+        assert outcome['status'] == 'applied'
+        assert outcome['parameters']['bandwidth_limit'] == ('30', 'mbps')
+        
+        outcome = self.executor.execute('intent-1', [self.throughput_rec(100)], now=200)[0]
+        assert outcome['status'] == 'skipped'
+        assert 'rate limit' in outcome['reason']
+    
+    def test_every_step_is_bounded(self):
+        """Bandwidth steps are bounded from the limit in effect; QoS moves one level"""
+        outcome = self.executor.execute('intent-1', [self.throughput_rec(200)], now=0)[0]
+        assert outcome['parameters']['bandwidth_limit'] == ('30', 'mbps')
+        
+        priority = {'action': 'increase_priority', 'reason': 'test', 'target': 'node-2', 'parameters': {'qos': 2}}
+        assert self.executor.execute('intent-1', [priority], now=0)[0]['parameters']['qos_level'] == (1,)
+        assert self.executor.execute('intent-1', [priority], now=100)[0]['parameters']['qos_level'] == (2,)
+    
+    def test_fleet_wide_recommendations_are_skipped(self):
+        """Recommendations without a target device are not auto-applied"""
+        outcome = self.executor.execute('intent-1', [self.throughput_rec(20, target=None)], now=0)[0]
+        
+        assert outcome['status'] == 'skipped'
+        self.enforce.assert_not_called()
+    
+    def test_rollback_when_metric_worsens(self):
+        """A remediation that makes its metric worse is rolled back"""
+        self.executor.execute('intent-1', [self.throughput_rec(25)], self.result(10.0)['intent-1'], now=0)
+        self.executor.execute('intent-1', [self.throughput_rec(30)], self.result(10.0)['intent-1'], now=100)
+        self.enforce.reset_mock()
+        
+        assert self.executor.verify(self.result(9.5), now=50) == []
+        rolled_back = self.executor.verify(self.result(5.0), now=140)
+        
+        assert len(rolled_back) == 1
+        assert self.withdraw.called
+        restored, _ = self.enforce.call_args[0]
+        assert restored[0].parameters['rate'] == '25mbps'
+    
+    def test_next_step_replaces_previous_remediation(self):
+        """A new step on the same target withdraws the policies of the one before"""
+        first = self.executor.execute('intent-1', [self.throughput_rec(25)], now=0)[0]
+        assert not self.withdraw.called
+        
+        self.executor.execute('intent-1', [self.throughput_rec(30)], now=100)
+        assert [c.args[0] for c in self.withdraw.call_args_list] == first['policies']
+    
+    def test_increase_starts_from_the_limit_in_effect(self):
+        """An increase is skipped on an unlimited device and never lowers a higher cap"""
+        engine = PolicyEngine()
+        engine.generate_policies({'type': 'bandwidth', 'parameters': {'target_device': 'node-3',
+                                                                      'bandwidth_limit': ('100', 'mbps')}})
+        executor = RemediationExecutor(generate=engine.generate_policies, enforce=self.enforce,
+                                       cooldown=0, max_step=0.5, default_rate=10,
+                                       current_rate=engine.effective_rate)
+        
+        unlimited = executor.execute('intent-1', [self.throughput_rec(15, target='node-4')], now=0)[0]
+        assert unlimited['status'] == 'skipped'
+        assert engine.effective_rate('node-4') is None
+        
+        lower = executor.execute('intent-1', [self.throughput_rec(30, target='node-3')], now=0)[0]
+        assert lower['status'] == 'skipped'
+        self.enforce.assert_not_called()
+        
+        raised = executor.execute('intent-1', [self.throughput_rec(400, target='node-3')], now=0)[0]
+        assert raised['parameters']['bandwidth_limit'] == ('150', 'mbps')
+    
+    def test_rollback_restores_the_device_setting(self):
+        """Rolling back the only remediation re-sends the device's previous value and undoes tc"""
+        intent_manager = IntentManager(db_manager=Mock())
+        intent_manager.device_enforcer = DeviceEnforcer('localhost', 1883)
+        intent_manager.network_enforcer = Mock()
+        sent = []
+        intent_manager.device_enforcer.shadows.publish = lambda target, msg: sent.append(
+            (target, {k: v for k, v in msg.items() if k != 'traceparent'})) or True
+        intent_manager.device_enforcer.registry.update_from_status({'node_id': 'node-1', 'config': {'qos': 0}})
+        executor = RemediationExecutor(generate=intent_manager.policy_engine.generate_policies,
+                                       enforce=intent_manager.enforce_policies,
+                                       withdraw=intent_manager.withdraw_policy, verify_window=30)
+        
+        latency = {'action': 'increase_priority', 'reason': 'test', 'target': 'node-1', 'parameters': {'qos': 1}}
+        executor.execute('intent-1', [latency], {'metrics': {'latency': 50.0}}, now=0)
+        assert sent == [('node-1', {'type': 'qos_update', 'qos': 1, 'reliable_delivery': True})]
+        
+        assert len(executor.verify({'intent-1': {'metrics': {'latency': 80.0}}}, now=40)) == 1
+        assert sent[-1] == ('node-1', {'type': 'qos_update', 'qos': 0, 'reliable_delivery': False})
+        removed = {c.args[0]['policy_type'] for c in intent_manager.network_enforcer.remove_policy.call_args_list}
+        assert removed == {'traffic_shaping', 'routing_priority'}
+
+class TestFeedbackScheduler:
+    """Test deadline-driven feedback scheduling"""
+    
+    def setup_method(self):
+        self.engine = FeedbackEngine('http://localhost:9090')
+        self.evaluated = []
+        self.engine.evaluate_intents = lambda ids: self.evaluated.append(list(ids)) or {}
+    
+    def test_priority_sets_interval(self):
+        """Critical intents are evaluated more often than low-priority ones"""
+        assert interval_for_priority(40, 10) == 10
+        assert interval_for_priority(40, 7) == 20
+        assert interval_for_priority(40, 5) == 40
+        assert interval_for_priority(40, 1) == 80
+    
+    def test_intents_run_on_their_own_cadence(self):
+        """A high-priority intent is checked several times per low-priority check"""
+        self.engine.register_intent('critical', {'max_latency': 10}, priority=10)
+        self.engine.register_intent('background', {'max_latency': 10}, priority=5)
+        scheduler = FeedbackScheduler(self.engine, on_results=lambda r: None, base_interval=0.4)
+        
+        scheduler.start()
+        time.sleep(0.95)
+        scheduler.stop()
+        
+        runs = [i for batch in self.evaluated for i in batch]
+        assert runs.count('critical') >= 2 * runs.count('background')
+        assert runs.count('background') >= 2
+    
+    def test_trigger_rechecks_target_intents(self):
+        """A device status trigger re-checks only intents watching that device"""
+        self.engine.register_intent('on-node-1', {'max_latency': 10}, targets='node-1')
+        self.engine.register_intent('on-node-2', {'max_latency': 10}, targets='node-2')
+        scheduler = FeedbackScheduler(self.engine, on_results=lambda r: None,
+                                      base_interval=60, min_retrigger=0)
+        
+        scheduler.start()
+        time.sleep(0.1)
+        self.evaluated.clear()
+        scheduler.trigger(target='node-1')
+        time.sleep(0.1)
+        scheduler.stop()
+        
+        assert [i for batch in self.evaluated for i in batch] == ['on-node-1']
+
+class TestIoTNodeTiming:
+    """Test the simulated node's publish schedule"""
+    
+    @staticmethod
+    def _node():
+        from iot_simulator.node import IoTNode
+        
+        node = IoTNode('node-1', 'localhost', 1883)
+        node.client = Mock()
+        node.client.publish.return_value = Mock(rc=0)
+        return node
+    
+    def test_publish_rate_matches_sampling_rate(self):
+        """Latency delays each publish without stretching the interval between readings"""
+        node = self._node()
+        node.config.update({'sampling_rate': 5, 'latency': 250, 'jitter': 0})
+        sent_at = []
+        now = 0.0
+        node.client.publish.side_effect = lambda *args, **kwargs: sent_at.append(now) or Mock(rc=0)
+        
+        while now < 100:
+            now = node.step(now)
+        
+        assert len(sent_at) == 20
+        assert sent_at == pytest.approx([5 * k + 0.25 for k in range(20)])
+    
+    def test_rate_change_applies_without_waiting_out_the_interval(self):
+        """A control message wakes the loop and reschedules from the last reading"""
+        node = self._node()
+        node.config.update({'sampling_rate': 60, 'latency': 0})
+        node.step(0.0)
+        
+        message = Mock(payload=json.dumps({'sampling_rate': 2}).encode())
+        node.on_message(None, None, message)
+        assert node._wakeup.is_set()
+        
+        assert node.step(0.5) == 2.0
+        node.step(2.0)
+        data = [call for call in node.client.publish.call_args_list if call.args[0] == 'iot/node-1/data']
+        assert len(data) == 2
+
+
+class TestFleetSimulator:
+    """Test the multi-node IoT fleet simulator"""
+    
+    @staticmethod
+    def _fleet(nodes, per_connection):
+        from iot_simulator.fleet import FleetSimulator
+        
+        def client_factory(client_id):
+            client = Mock()
+            client.publish.return_value = Mock(rc=0)
+            return client
+        return FleetSimulator(nodes, nodes_per_connection=per_connection, client_factory=client_factory)
+    
+    def test_nodes_publish_from_one_heap_over_shared_connections(self):
+        """Each node publishes once per sampling interval through its shard's client"""
+        fleet = self._fleet(5, per_connection=2)
+        assert len(fleet.connections) == 3
+        assert fleet.nodes[4].connection is fleet.connections[2]
+        
+        fleet.schedule_all(now=0.0)
+        for second in range(1, 21):
+            fleet.tick(float(second))
+        
+        # Default sampling rate is 5s: 4 publishes in 20s, first one within 5s (plus latency)
+        assert all(node.published in (3, 4) for node in fleet.nodes)
+        topics = {call.args[0] for call in fleet.connections[0].client.publish.call_args_list}
+        assert topics == {'iot/node-1/data', 'iot/node-2/data'}
+    
+    def test_control_message_reschedules_node(self):
+        """A new sampling rate takes effect immediately, and is acknowledged on the status topic"""
+        from iot_simulator.fleet import FleetCollector
+        from prometheus_client import CollectorRegistry, generate_latest
+        
+        fleet = self._fleet(2, per_connection=500)
+        fleet.schedule_all(now=0.0)
+        node = fleet.nodes[0]
+        
+        fleet.apply_control(node, json.dumps({'sampling_rate': 1, 'latency': 40}).encode(), now=0.0)
+        for second in range(1, 11):
+            fleet.tick(float(second))
+        
+        assert node.config['sampling_rate'] == 1 and node.received == 1
+        assert node.published == 10
+        assert fleet.nodes[1].published in (1, 2)
+        status = fleet.connections[0].client.publish.call_args_list
+        assert any(call.args[0] == 'iot/node-1/status' for call in status)
+        
+        registry = CollectorRegistry()
+        registry.register(FleetCollector(fleet))
+        metrics = generate_latest(registry).decode()
+        assert 'mqtt_messages_published_total{node_id="node-1"} 10.0' in metrics
+        assert 'iot_latency_ms{node_id="node-1"} 40.0' in metrics
+        assert 'mqtt_publish_interval_seconds{node_id="node-2"} 5.0' in metrics
+
+
+class TestAppFactory:
+    """Test lazy construction of the API application"""
+    
+    def test_import_has_no_side_effects(self):
+        """Importing the API module builds no database, app or intent manager"""
+        import subprocess
+        
+        code = ("import sys; import intent_manager.api as api; "
+                "assert api._app is None; assert 'database' not in sys.modules; "
+                "assert 'sqlalchemy' not in sys.modules")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.join(os.path.dirname(__file__), '..', 'src'))
+        assert result.returncode == 0, result.stderr
+    
+    def test_create_app_builds_independent_apps(self, tmp_path):
+        """Each app gets its own components and database"""
+        first = create_app(db_path=str(tmp_path / 'a.db'), create_admin=False)
+        second = create_app(db_path=str(tmp_path / 'b.db'), create_admin=False)
+        
+        assert first.extensions['imperium']['intent_manager'] is not second.extensions['imperium']['intent_manager']
+        assert (tmp_path / 'a.db').exists() and (tmp_path / 'b.db').exists()
+        
+        client = first.test_client()
+        assert client.get('/health').get_json()['status'] == 'healthy'
+        assert client.get('/api/v1/intents').status_code == 401
+
+
+class TestEventStream:
+    """Test the server-sent events endpoint"""
+    
+    def test_intent_and_device_changes_are_streamed(self, tmp_path):
+        """Subscribers see intent activation, enforcement results and device changes"""
+        app = create_app(db_path=str(tmp_path / 'events.db'), create_admin=False)
+        components = app.extensions['imperium']
+        manager = components['intent_manager']
+        manager.device_enforcer = Mock()
+        manager.device_enforcer.apply_policy.return_value = True
+        token = components['auth_manager'].generate_token('admin', 'admin')
+        
+        client = app.test_client()
+        assert client.get('/api/v1/events').status_code == 401
+        
+        intent = manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        
+        ticket = client.post('/api/v1/events/ticket', headers={'Authorization': f"Bearer {token}"}).get_json()['ticket']
+        response = client.get(f"/api/v1/events?ticket={ticket}&last_event_id=0", buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        chunks = iter(response.response)
+        assert next(chunks) == b'retry: 3000\n\n'
+        replay = next(chunks).decode()
+        assert 'event: policy' in replay and '"status": "enforced"' in replay
+        assert f'"id": "{intent["id"]}", "status": "active"' in replay
+        
+        enforcer = DeviceEnforcer(broker_host='localhost', broker_port=1883)
+        enforcer.change_listeners.append(lambda record: manager.publish('device', record.to_dict()))
+        status = Mock(topic='iot/node-1/status', payload=b'{"node_id": "node-1", "status": "online"}')
+        enforcer.on_message(None, None, status)
+        enforcer.on_message(None, None, status)  # heartbeat: no change, no event
+        status.payload = b'{"node_id": "node-1", "status": "offline"}'
+        enforcer.on_message(None, None, status)
+        
+        device_events = next(chunks).decode()
+        assert device_events.count('event: device') == 2
+        assert '"status": "offline"' in device_events
+        response.close()
+    
+    def test_stream_tickets_are_single_use(self, tmp_path):
+        """A ticket opens one stream and is not accepted as a bearer token"""
+        app = create_app(db_path=str(tmp_path / 'tickets.db'), create_admin=False)
+        auth_manager = app.extensions['imperium']['auth_manager']
+        ticket = auth_manager.issue_stream_ticket({'username': 'admin', 'role': 'admin'})
+        client = app.test_client()
+        
+        assert client.get('/api/v1/intents', headers={'Authorization': f"Bearer {ticket}"}).status_code == 401
+        response = client.get(f"/api/v1/events?ticket={ticket}", buffered=False)
+        assert response.status_code == 200
+        response.close()
+        assert client.get(f"/api/v1/events?ticket={ticket}").status_code == 401
+        
+        auth_manager.stream_ticket_seconds = -1
+        expired = auth_manager.issue_stream_ticket({'username': 'admin', 'role': 'admin'})
+        assert client.get(f"/api/v1/events?ticket={expired}").status_code == 401
+    
+    def test_open_streams_are_capped(self, tmp_path, monkeypatch):
+        """Streams beyond EVENTS_MAX_STREAMS get 503 until one closes"""
+        monkeypatch.setenv('EVENTS_MAX_STREAMS', '1')
+        app = create_app(db_path=str(tmp_path / 'cap.db'), create_admin=False)
+        token = app.extensions['imperium']['auth_manager'].generate_token('admin', 'admin')
+        headers = {'Authorization': f"Bearer {token}"}
+        client = app.test_client()
+        
+        first = client.get('/api/v1/events', headers=headers, buffered=False)
+        assert first.status_code == 200
+        refused = client.get('/api/v1/events', headers=headers)
+        assert refused.status_code == 503
+        assert refused.headers['Retry-After'] == '5'
+        
+        first.close()
+        second = client.get('/api/v1/events', headers=headers, buffered=False)
+        assert second.status_code == 200
+        second.close()
+
+
+class TestConditionalGet:
+    """Test ETags and cached responses of the read endpoints"""
+    
+    def test_not_modified_until_a_write(self, tmp_path):
+        """A matching If-None-Match is answered without querying the database"""
+        app = create_app(db_path=str(tmp_path / 'etag.db'), create_admin=False)
+        components = app.extensions['imperium']
+        manager = components['intent_manager']
+        token = components['auth_manager'].generate_token('admin', 'admin')
+        headers = {'Authorization': f'Bearer {token}'}
+        client = app.test_client()
+        
+        manager.submit_intent({'description': 'Set QoS level 2 for node-1'})
+        first = client.get('/api/v1/intents', headers=headers)
+        etag = first.headers['ETag']
+        assert first.status_code == 200 and first.get_json()['count'] == 1
+        
+        with patch.object(manager.db_manager, 'get_all_intents') as query:
+            revalidated = client.get('/api/v1/intents', headers={**headers, 'If-None-Match': etag})
+            # No If-None-Match: the cached body is served, still without a query
+            cached = client.get('/api/v1/intents', headers=headers)
+        query.assert_not_called()
+        assert revalidated.status_code == 304 and revalidated.headers['ETag'] == etag
+        assert cached.data == first.data
+        
+        manager.submit_intent({'description': 'Set QoS level 1 for node-2'})
+        changed = client.get('/api/v1/intents', headers={**headers, 'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+        assert changed.get_json()['count'] == 2
+        
+        # Policies have their own generation
+        policies = client.get('/api/v1/policies', headers=headers)
+        assert client.get('/api/v1/policies', headers={
+            **headers, 'If-None-Match': policies.headers['ETag']}).status_code == 304
+        assert client.get('/api/v1/intents/unknown', headers=headers).status_code == 404
+
+
+class TestWSGIWorker:
+    """Test per-worker initialization of the WSGI entry point"""
+    
+    def test_components_initialized_once_per_worker(self, tmp_path, monkeypatch):
+        """The first request builds the worker's components once"""
+        monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'imperium.db'))
+        import wsgi
+        from werkzeug.test import EnvironBuilder
+        
+        controller = Mock()
+        controller.config = {'mqtt_client_id': 'device-enforcer', 'mqtt_outbox_path': 'data/outbox.json',
+                             'feedback_enabled': True}
+        
+        with patch.object(wsgi, 'ImperiumController', return_value=controller) as factory, \
+                patch.object(wsgi, '_init_pid', None):
+            for _ in range(2):
+                environ = EnvironBuilder(path='/health').get_environ()
+                body = b''.join(wsgi.application(environ, lambda status, headers: None))
+                assert b'healthy' in body
+            
+            factory.assert_called_once_with(handle_signals=False)
+            controller.initialize_components.assert_called_once()
+            controller.start_feedback_loop.assert_called_once()
+            assert controller.config['mqtt_client_id'] == 'device-enforcer'
+            assert controller.config['mqtt_outbox_path'] == 'data/outbox.json'
+    
+    def test_worker_slots_survive_restarts(self, tmp_path, monkeypatch):
+        """A replacement worker gets its predecessor's slot, MQTT client ID and outbox file"""
+        import runpy
+        import wsgi
+        monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'imperium.db'))
+        monkeypatch.delenv('API_WORKERS', raising=False)
+        hooks = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', 'config', 'gunicorn.conf.py'))
+        
+        workers = [Mock(pid=100 + i) for i in range(3)]
+        for worker in workers:
+            hooks['pre_fork'](None, worker)
+        assert [worker.slot for worker in workers] == [0, 1, 2]
+        hooks['child_exit'](None, workers[1])
+        replacement = Mock(pid=200)
+        hooks['pre_fork'](None, replacement)
+        assert replacement.slot == 1
+        
+        controller = Mock()
+        controller.config = {'mqtt_client_id': 'device-enforcer', 'mqtt_outbox_path': 'data/outbox.json',
+                             'feedback_enabled': False}
+        with patch.object(wsgi, 'ImperiumController', return_value=controller), \
+                patch.object(wsgi, '_init_pid', None):
+            hooks['post_worker_init'](replacement)
+        assert controller.config['mqtt_client_id'] == 'device-enforcer-1'
+        assert controller.config['mqtt_outbox_path'] == 'data/outbox.1.json'
+    
+    def test_several_workers_need_split_enforcement_opt_in(self, monkeypatch):
+        """Workers enforce on their own, so more than one must be asked for explicitly"""
+        import runpy
+        path = os.path.join(os.path.dirname(__file__), '..', 'config', 'gunicorn.conf.py')
+        monkeypatch.setenv('API_WORKERS', '4')
+        monkeypatch.delenv('API_WORKERS_SPLIT_ENFORCEMENT', raising=False)
+        with pytest.raises(RuntimeError, match='API_WORKERS_SPLIT_ENFORCEMENT'):
+            runpy.run_path(path)
+        
+        monkeypatch.setenv('API_WORKERS_SPLIT_ENFORCEMENT', 'true')
+        monkeypatch.setenv('API_RESPONSE_CACHE', 'false')
+        assert runpy.run_path(path)['workers'] == 4
+
+
+class TestAsyncAPI:
+    """Test the asyncio (ASGI) variant of the Intent Manager API"""
+    
+    def test_intent_round_trip(self, tmp_path, monkeypatch):
+        """Register, log in, submit and read back an intent with the same JSON shapes"""
+        pytest.importorskip('starlette')
+        pytest.importorskip('aiosqlite')
+        from starlette.testclient import TestClient
+        monkeypatch.setenv('DATABASE_PATH', str(tmp_path / 'imperium.db'))
+        from intent_manager.asgi_api import app
+        
+        username = 'asgi-user'
+        with TestClient(app) as client:
+            assert client.get('/health').json()['status'] == 'healthy'
+            assert client.get('/api/v1/intents').status_code == 401
+            
+            response = client.post('/api/v1/auth/register', json={'username': username, 'password': 'password123'})
+            assert response.status_code == 201
+            response = client.post('/api/v1/auth/login', json={'username': username, 'password': 'wrong-password'})
+            assert response.status_code == 401
+            token = client.post('/api/v1/auth/login',
+                                json={'username': username, 'password': 'password123'}).json()['token']
+            headers = {'Authorization': f"Bearer {token}"}
+            
+            with patch('intent_manager.api.intent_manager.activate_intent') as activate:
+                response = client.post('/api/v1/intents', headers=headers,
+                                       json={'description': 'Prioritize device node-1'})
+            assert response.status_code == 201
+            intent = response.json()['intent']
+            activate.assert_called_once()
+            
+            stored = client.get(f"/api/v1/intents/{intent['id']}", headers=headers).json()['intent']
+            assert stored['original_intent'] == 'Prioritize device node-1'
+            assert len(stored['policies']) == len(intent['policies'])
+            assert client.get('/api/v1/auth/profile', headers=headers).json()['user']['username'] == username
+            
+            response = client.post('/api/v1/events/ticket', headers=headers)
+            assert response.status_code == 201
+            ticket = response.json()['ticket']
+            assert app.state.auth_manager.redeem_stream_ticket(ticket)['username'] == username
+            assert client.get(f"/api/v1/events?ticket={ticket}").status_code == 401
+
+
+    def test_import_has_no_side_effects(self, tmp_path):
+        """Importing the ASGI module creates no database or admin user; the lifespan does"""
+        pytest.importorskip('starlette')
+        import subprocess
+        db_path = tmp_path / 'imperium.db'
+        src = os.path.join(os.path.dirname(__file__), '..', 'src')
+        subprocess.run([sys.executable, '-c', 'import intent_manager.asgi_api'], check=True, cwd=src,
+                       env=dict(os.environ, DATABASE_PATH=str(db_path)))
+        assert not db_path.exists()
+
 
 class TestAPIIntegration:
     """Test Intent Manager API integration"""
@@ -318,3 +1253,192 @@ class TestAPIIntegration:
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v', '--tb=short'])
+
+
+class TestBenchmarkHarness:
+    """Test the seeded end-to-end benchmark in bench/"""
+    
+    @pytest.fixture(autouse=True)
+    def bench_path(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bench'))
+        yield
+        sys.path.pop(0)
+    
+    def test_workload_is_deterministic(self):
+        """The same seed generates the same requests; another seed does not"""
+        from workload import Workload
+        
+        assert Workload(seed=3, intents=50, nodes=10).describe() == Workload(seed=3, intents=50, nodes=10).describe()
+        assert Workload(seed=3, intents=50, nodes=10).intents == Workload(seed=3, intents=50, nodes=10).intents
+        assert Workload(seed=4, intents=50, nodes=10).describe()['digest'] != \
+            Workload(seed=3, intents=50, nodes=10).describe()['digest']
+    
+    def test_stages_report_latency_and_compare_flags_regressions(self):
+        """Every stage runs on a small workload, and compare() catches a slowdown"""
+        from workload import Workload
+        from stages import STAGES
+        from compare import compare
+        
+        workload = Workload(seed=1, intents=20, nodes=5)
+        results = {}
+        results.update(STAGES['api'](workload, lists=5))
+        results.update(STAGES['mqtt'](workload))
+        results.update(STAGES['db'](workload, lists=5))
+        results.update(STAGES['feedback'](workload, cycles=3))
+        
+        assert results['api.submit']['ops'] == 20
+        assert results['mqtt.apply']['published'] > 0
+        for stage in results.values():
+            assert stage['ops_per_second'] > 0
+            assert stage['latency_ms']['p50'] <= stage['latency_ms']['p95'] <= stage['latency_ms']['p99']
+        
+        base = {'meta': {'workload': workload.describe()}, 'stages': results}
+        slower = json.loads(json.dumps(base))
+        slower['stages']['db.add_intent']['ops_per_second'] /= 2
+        rows, warnings = compare(base, slower)
+        assert not warnings
+        assert [(row['stage'], row['metric']) for row in rows if row['regression']] == \
+            [('db.add_intent', 'ops_per_second')]
+        assert not any(row['regression'] for row in compare(base, base)[0])
+
+
+class TestControllerMetrics:
+    """Test the API's own Prometheus instrumentation"""
+    
+    @staticmethod
+    def sample(client, name, **labels):
+        from prometheus_client.parser import text_string_to_metric_families
+        
+        for family in text_string_to_metric_families(client.get('/metrics').get_data(as_text=True)):
+            for metric in family.samples:
+                if metric.name == name and all(metric.labels.get(k) == v for k, v in labels.items()):
+                    return metric.value
+        return 0.0
+    
+    def test_requests_stages_and_rejections_are_recorded(self, tmp_path):
+        """Routes are labelled by template; stages, rate limiting and the token cache are counted"""
+        app = create_app(db_path=str(tmp_path / 'metrics.db'), create_admin=False)
+        components = app.extensions['imperium']
+        components['rate_limiter'].enabled = True
+        components['rate_limiter'].configure_limits({'intents': {'requests': 1, 'window': 3600}})
+        token = components['auth_manager'].generate_token('admin', 'admin')
+        headers = {'Authorization': f'Bearer {token}'}
+        client = app.test_client()
+        
+        route = {'method': 'GET', 'route': '/api/v1/intents/<intent_id>', 'status': '404'}
+        before = {
+            'lookups': self.sample(client, 'imperium_api_request_duration_seconds_count', **route),
+            'persist': self.sample(client, 'imperium_intent_stage_duration_seconds_count', stage='persist'),
+            'limited': self.sample(client, 'imperium_api_rate_limited_total', limit_type='intents'),
+            'hits': self.sample(client, 'imperium_auth_token_cache_total', result='hit'),
+            'inserts': self.sample(client, 'imperium_db_query_duration_seconds_count', operation='add_intent'),
+        }
+        
+        intent = {'description': 'Set QoS level 2 for node-1'}
+        assert client.post('/api/v1/intents', json=intent, headers=headers).status_code == 201
+        assert client.post('/api/v1/intents', json=intent, headers=headers).status_code == 429
+        assert client.get('/api/v1/intents/missing-1', headers=headers).status_code == 404
+        assert client.get('/api/v1/intents/missing-2', headers=headers).status_code == 404
+        
+        assert self.sample(client, 'imperium_api_request_duration_seconds_count', **route) == before['lookups'] + 2
+        assert self.sample(client, 'imperium_intent_stage_duration_seconds_count',
+                           stage='persist') == before['persist'] + 1
+        assert self.sample(client, 'imperium_api_rate_limited_total', limit_type='intents') == before['limited'] + 1
+        # The first check decodes the token, the two lookups reuse it
+        assert self.sample(client, 'imperium_auth_token_cache_total', result='hit') == before['hits'] + 2
+        assert self.sample(client, 'imperium_db_query_duration_seconds_count',
+                           operation='add_intent') == before['inserts'] + 1
+    
+    def test_expired_tokens_are_not_served_from_cache(self, tmp_path):
+        """A cached token stops authenticating once it expires"""
+        app = create_app(db_path=str(tmp_path / 'expiry.db'), create_admin=False)
+        auth_manager = app.extensions['imperium']['auth_manager']
+        token = auth_manager.generate_token('admin', 'admin')
+        assert auth_manager.decode_token(token)['username'] == 'admin'
+        assert auth_manager.decode_token(token) is auth_manager._token_cache[token]
+        
+        # As if it had been cached before it expired
+        auth_manager.token_expiry_hours = -1
+        expired = auth_manager.generate_token('admin', 'admin')
+        auth_manager._token_cache[expired] = {'username': 'admin', 'role': 'admin', 'exp': time.time() - 1}
+        assert auth_manager.decode_token(expired) is None
+        assert expired not in auth_manager._token_cache
+
+
+class TestTracing:
+    """Test trace propagation from intent submission to device acknowledgement"""
+    
+    def test_one_trace_covers_intent_to_device_ack(self, tmp_path):
+        """The API continues the caller's trace through enforcement and the device's echo"""
+        import tracing
+        
+        exporter = tracing.JsonlExporter(str(tmp_path / 'traces.jsonl'))
+        previous = tracing.get_tracer()
+        tracing.set_tracer(tracing.Tracer(exporter=exporter))
+        try:
+            app = create_app(db_path=str(tmp_path / 'trace.db'), create_admin=False)
+            components = app.extensions['imperium']
+            enforcer = DeviceEnforcer(client_id='trace-test')
+            enforcer.client = Mock()
+            enforcer.client.publish.return_value = Mock(rc=0)
+            enforcer.connection.connected = True
+            components['intent_manager'].device_enforcer = enforcer
+            token = components['auth_manager'].generate_token('admin', 'admin')
+            caller = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+            
+            response = app.test_client().post(
+                '/api/v1/intents', json={'description': 'Set QoS level 2 for node-1'},
+                headers={'Authorization': f'Bearer {token}', 'traceparent': caller})
+            assert response.status_code == 201
+            assert response.headers['traceresponse'].startswith('00-4bf92f3577b34da6a3ce929d0e0e4736-')
+            
+            topic, payload = enforcer.client.publish.call_args.args[:2]
+            control = json.loads(payload)
+            assert topic == 'iot/node-1/control'
+            assert control['traceparent'].startswith('00-4bf92f3577b34da6a3ce929d0e0e4736-')
+            
+            # The simulator acknowledges with its applied config and the echoed context
+            status = {'node_id': 'node-1', 'status': 'online', 'config': {'qos': 2},
+                      'traceparent': control['traceparent']}
+            enforcer.on_message(None, None, Mock(topic='iot/node-1/status', payload=json.dumps(status).encode()))
+        finally:
+            tracing.set_tracer(previous)
+            exporter.close()
+        
+        spans = [json.loads(line) for line in open(tmp_path / 'traces.jsonl')]
+        assert {span['trace_id'] for span in spans} == {'4bf92f3577b34da6a3ce929d0e0e4736'}
+        by_name = {span['name']: span for span in spans}
+        assert {'POST /api/v1/intents', 'intent.parse', 'intent.policy_generation', 'intent.persist',
+                'intent.enforce', 'device.apply_policy', 'mqtt.publish', 'device.ack'} <= set(by_name)
+        assert by_name['POST /api/v1/intents']['parent_span_id'] == '00f067aa0ba902b7'
+        assert by_name['device.ack']['parent_span_id'] == by_name['device.apply_policy']['span_id']
+        assert by_name['device.ack']['attributes']['node_id'] == 'node-1'
+        assert by_name['device.ack']['end'] >= by_name['POST /api/v1/intents']['end']
+
+
+
+class TestProfilerEndpoint:
+    """Test the admin profiling endpoint"""
+    
+    def test_admin_only_collapsed_profile(self, tmp_path):
+        """Admins get flamegraph input; other users and bad parameters are refused"""
+        app = create_app(db_path=str(tmp_path / 'profile.db'), create_admin=False)
+        auth_manager = app.extensions['imperium']['auth_manager']
+        client = app.test_client()
+        admin = {'Authorization': f"Bearer {auth_manager.generate_token('admin', 'admin')}"}
+        user = {'Authorization': f"Bearer {auth_manager.generate_token('alice', 'user')}"}
+        
+        assert client.get('/api/v1/admin/profile?seconds=0.05', headers=user).status_code == 403
+        assert client.get('/api/v1/admin/profile?seconds=3600', headers=admin).status_code == 400
+        
+        response = client.get('/api/v1/admin/profile?seconds=0.05&interval=0.01', headers=admin)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert int(response.headers['X-Profile-Samples']) >= 2
+        # The test client runs the view on this thread, which the sampler leaves out
+        for line in response.get_data(as_text=True).splitlines():
+            stack, count = line.rsplit(' ', 1)
+            assert int(count) > 0 and ';' in stack
+        
+        memory = client.get('/api/v1/admin/profile?mode=memory&seconds=0.05', headers=admin)
+        assert memory.status_code == 200 and 'top' in memory.get_json()